@@ -0,0 +1,163 @@
+# ============================================================
+# 🗃️ Almacén columnar mapeado en memoria para resultados de lotes
+# ============================================================
+# Los trabajos por lotes (millones de clientes) no acumulan resultados en pandas: cada columna
+# es un fichero .npy reservado con su tamaño final y mapeado en memoria, y el motor escribe en
+# él bloque a bloque. Un manifiesto JSON registra el esquema y los ids de los bloques completos.
+#
+# - Los datos de un bloque se vuelcan a disco antes de anotarlo en el manifiesto, y el manifiesto
+#   se reescribe de forma atómica: tras una interrupción solo se repiten los bloques no anotados.
+# - Los bloques pueden completarse en cualquier orden: varios procesos escriben cada uno en sus
+#   propias filas (escribir_filas) y un único proceso anota los completados (marcar_completado).
+# - La lectura devuelve vistas de solo lectura sobre el fichero (sin copias): los informes pueden
+#   recorrer resultados mayores que la RAM por rebanadas.
+
+import json
+import os
+
+import numpy as np
+
+VERSION_MANIFIESTO = 1
+FICHERO_MANIFIESTO = "manifiesto.json"
+
+
+def _escribir_json_atomico(ruta, datos):
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+class AlmacenColumnar:
+    """Carpeta con un .npy por columna (n_filas cada uno) y el manifiesto. Se crea con crear() o se abre con abrir()."""
+
+    def __init__(self, ruta, manifiesto, modo):
+        self.ruta = ruta
+        self.manifiesto = manifiesto
+        self._modo = modo
+        self._columnas = {}
+
+    # ---- Creación y apertura ----
+    @classmethod
+    def crear(cls, ruta, n_filas, columnas, tam_bloque, metadatos=None):
+        """
+        Reserva los ficheros de todas las columnas (`columnas`: nombre → dtype) con su tamaño final.
+        Los ficheros se crean dispersos: el disco solo se ocupa a medida que se escriben bloques.
+        """
+        os.makedirs(ruta, exist_ok=True)
+        manifiesto = {
+            "version": VERSION_MANIFIESTO,
+            "n_filas": int(n_filas),
+            "tam_bloque": int(tam_bloque),
+            "columnas": {nombre: np.dtype(dtype).str for nombre, dtype in columnas.items()},
+            "metadatos": metadatos or {},
+            "completados": [],
+        }
+        for nombre, dtype in manifiesto["columnas"].items():
+            np.lib.format.open_memmap(os.path.join(ruta, f"{nombre}.npy"), mode="w+", dtype=dtype, shape=(n_filas,)).flush()
+        _escribir_json_atomico(os.path.join(ruta, FICHERO_MANIFIESTO), manifiesto)
+        return cls(ruta, manifiesto, "r+")
+
+    @classmethod
+    def abrir(cls, ruta, escritura=False):
+        """Almacén existente; con escritura=True se puede seguir completando (reanudar un trabajo)."""
+        with open(os.path.join(ruta, FICHERO_MANIFIESTO), encoding="utf-8") as f:
+            manifiesto = json.load(f)
+        if manifiesto.get("version") != VERSION_MANIFIESTO:
+            raise ValueError(f"Versión de manifiesto no soportada: {manifiesto.get('version')}")
+        return cls(ruta, manifiesto, "r+" if escritura else "r")
+
+    @staticmethod
+    def existe(ruta):
+        return os.path.exists(os.path.join(ruta, FICHERO_MANIFIESTO))
+
+    # ---- Esquema y progreso ----
+    @property
+    def n_filas(self):
+        return self.manifiesto["n_filas"]
+
+    @property
+    def tam_bloque(self):
+        return self.manifiesto["tam_bloque"]
+
+    @property
+    def n_bloques(self):
+        return -(-self.n_filas // self.tam_bloque)
+
+    @property
+    def completados(self):
+        return set(self.manifiesto["completados"])
+
+    @property
+    def completo(self):
+        return len(self.manifiesto["completados"]) >= self.n_bloques
+
+    def pendientes(self):
+        """Ids de los bloques que faltan, en orden."""
+        completados = self.completados
+        return [id_bloque for id_bloque in range(self.n_bloques) if id_bloque not in completados]
+
+    @property
+    def metadatos(self):
+        return self.manifiesto["metadatos"]
+
+    @property
+    def nombres_columnas(self):
+        return list(self.manifiesto["columnas"])
+
+    def rango_bloque(self, id_bloque):
+        """(inicio, fin) de las filas del bloque."""
+        inicio = id_bloque * self.tam_bloque
+        return inicio, min(inicio + self.tam_bloque, self.n_filas)
+
+    # ---- Escritura ----
+    def escribir_filas(self, id_bloque, valores):
+        """
+        Copia los arrays de `valores` (nombre → array con las filas del bloque) en su rebanada y vuelca
+        los ficheros a disco. No toca el manifiesto: se puede llamar desde varios procesos a la vez.
+        """
+        if self._modo != "r+":
+            raise PermissionError("Almacén abierto en solo lectura")
+        inicio, fin = self.rango_bloque(id_bloque)
+        for nombre in self.nombres_columnas:
+            columna = self.columna(nombre)
+            columna[inicio:fin] = valores[nombre]
+            columna.flush()
+
+    def marcar_completado(self, id_bloque):
+        """Anota el bloque en el manifiesto (solo desde un proceso y después de escribir_filas)."""
+        if id_bloque not in self.completados:
+            self.manifiesto["completados"] = sorted(self.completados | {id_bloque})
+            _escribir_json_atomico(os.path.join(self.ruta, FICHERO_MANIFIESTO), self.manifiesto)
+
+    def escribir_bloque(self, id_bloque, valores):
+        self.escribir_filas(id_bloque, valores)
+        self.marcar_completado(id_bloque)
+
+    # ---- Lectura sin copias ----
+    def columna(self, nombre):
+        """Columna completa mapeada en memoria (se abre una vez y se reutiliza)."""
+        if nombre not in self._columnas:
+            if nombre not in self.manifiesto["columnas"]:
+                raise KeyError(nombre)
+            self._columnas[nombre] = np.load(os.path.join(self.ruta, f"{nombre}.npy"), mmap_mode=self._modo)
+        return self._columnas[nombre]
+
+    def leer(self, inicio=0, fin=None, columnas=None):
+        """Vistas (sin copiar) de las filas [inicio, fin) de cada columna. Las filas de bloques pendientes valen 0."""
+        fin = self.n_filas if fin is None else min(fin, self.n_filas)
+        return {nombre: self.columna(nombre)[inicio:fin] for nombre in (columnas or self.nombres_columnas)}
+
+    def rebanadas(self, columnas=None):
+        """Recorre los bloques completos en orden: (inicio, vistas de sus filas)."""
+        for id_bloque in sorted(self.completados):
+            inicio, fin = self.rango_bloque(id_bloque)
+            yield inicio, self.leer(inicio, fin, columnas)
+
+    def cerrar(self):
+        for columna in self._columnas.values():
+            if self._modo == "r+":
+                columna.flush()
+        self._columnas.clear()
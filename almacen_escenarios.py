@@ -0,0 +1,182 @@
+# ============================================================
+# 💾 Almacén de escenarios de clientes (SQLite)
+# ============================================================
+# Los asesores guardan escenarios con nombre: los valores de la barra lateral y los resultados
+# que la app ya había calculado (pares clave/valor de la caché compartida). Al reabrir un
+# escenario se restauran los widgets y se vuelve a sembrar la caché, de modo que no se recalcula.
+#
+# - Un único fichero SQLite local y una única conexión por proceso, reutilizada por todas las sesiones.
+# - Índices por cliente, fecha y región para listar sin recorrer la tabla.
+# - Inserción masiva en una sola transacción (guardar_lote) y carga de un escenario en una consulta.
+# Los resultados se guardan con pickle comprimido: el fichero es local y solo lo escribe la propia app.
+# Van acompañados de un sello (versión de los cálculos y de las reglas fiscales) para que la app no
+# vuelva a meter en la caché compartida resultados calculados con otro motor u otras reglas.
+
+import datetime
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import zlib
+
+# Desactivado por defecto: el almacén no distingue usuarios, así que cualquiera que abra la app puede
+# listar y abrir los escenarios de un cliente (sueldo, deudas, entrada) escribiendo su nombre. Solo
+# debe activarse (CALCULADORA_ESCENARIOS=1) en instalaciones privadas: en local o tras un acceso restringido.
+ESCENARIOS_ACTIVADOS = os.environ.get("CALCULADORA_ESCENARIOS", "").strip().lower() in ("1", "true", "si", "sí")
+
+RUTA_ALMACEN = os.environ.get(
+    "CALCULADORA_ESCENARIOS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "escenarios.sqlite3"),
+)
+
+VERSION_ESQUEMA = 1
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS escenarios (
+    id         INTEGER PRIMARY KEY,
+    cliente    TEXT NOT NULL,
+    nombre     TEXT NOT NULL,
+    fecha      TEXT NOT NULL,          -- ISO 8601 (ordenable como texto)
+    region     TEXT,
+    modo       TEXT,
+    entradas   TEXT NOT NULL,          -- JSON con los valores de los widgets
+    resultados BLOB,                   -- pares (clave, valor) de la caché, pickle + zlib
+    UNIQUE (cliente, nombre)
+);
+CREATE INDEX IF NOT EXISTS idx_escenarios_cliente_fecha ON escenarios (cliente, fecha DESC);
+CREATE INDEX IF NOT EXISTS idx_escenarios_region_fecha ON escenarios (region, fecha DESC);
+CREATE INDEX IF NOT EXISTS idx_escenarios_fecha ON escenarios (fecha DESC);
+"""
+
+_INSERTAR = """
+INSERT INTO escenarios (cliente, nombre, fecha, region, modo, entradas, resultados)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (cliente, nombre) DO UPDATE SET
+    fecha = excluded.fecha, region = excluded.region, modo = excluded.modo,
+    entradas = excluded.entradas, resultados = excluded.resultados
+"""
+
+_COLUMNAS_LISTADO = "id, cliente, nombre, fecha, region, modo"
+
+
+def _empaquetar_resultados(pares, sello=None):
+    if not pares:
+        return None
+    return zlib.compress(pickle.dumps({"sello": sello, "pares": list(pares)}, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _desempaquetar_resultados(blob):
+    """
+    (sello, pares) de un blob guardado; los escenarios anteriores al sello (una lista suelta) dan sello None.
+    Confía en el fichero de la base de datos: pickle ejecuta código al cargar, así que el fichero no debe
+    poder escribirlo nadie más que la propia app (no abrir bases de datos de terceros).
+    """
+    if not blob:
+        return None, []
+    datos = pickle.loads(zlib.decompress(blob))
+    if isinstance(datos, list):
+        return None, datos
+    return datos["sello"], datos["pares"]
+
+
+class AlmacenEscenarios:
+    """Escenarios por (cliente, nombre). Guardar un nombre que ya existe lo sobrescribe."""
+
+    def __init__(self, ruta=RUTA_ALMACEN):
+        self.ruta = ruta
+        self._conexion = None
+        self._lock = threading.Lock()
+
+    def _conectar(self):
+        """Abre la conexión la primera vez que se usa y la reutiliza después (llamar con el lock tomado)."""
+        if self._conexion is None:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.executescript(ESQUEMA)
+            conexion.execute(f"PRAGMA user_version={VERSION_ESQUEMA}")
+            self._conexion = conexion
+        return self._conexion
+
+    def guardar_lote(self, escenarios):
+        """
+        Inserta o sobrescribe muchos escenarios en una única transacción.
+        Cada escenario es un dict con cliente, nombre y entradas; opcionalmente resultados (con su sello),
+        region, modo y fecha.
+        """
+        ahora = datetime.datetime.now().isoformat(timespec="seconds")
+        filas = [
+            (
+                e["cliente"], e["nombre"], e.get("fecha") or ahora, e.get("region"), e.get("modo"),
+                json.dumps(e["entradas"], ensure_ascii=False),
+                _empaquetar_resultados(e.get("resultados"), e.get("sello")),
+            )
+            for e in escenarios
+        ]
+        with self._lock:
+            conexion = self._conectar()
+            with conexion:
+                conexion.executemany(_INSERTAR, filas)
+        return len(filas)
+
+    def guardar(self, cliente, nombre, entradas, resultados=None, region=None, modo=None, fecha=None, sello=None):
+        self.guardar_lote([{
+            "cliente": cliente, "nombre": nombre, "entradas": entradas, "resultados": resultados,
+            "region": region, "modo": modo, "fecha": fecha, "sello": sello,
+        }])
+
+    def cargar(self, cliente, nombre):
+        """Escenario completo (entradas, resultados y su sello) en una sola consulta, o None si no existe."""
+        with self._lock:
+            fila = self._conectar().execute(
+                "SELECT * FROM escenarios WHERE cliente = ? AND nombre = ?", (cliente, nombre)
+            ).fetchone()
+        if fila is None:
+            return None
+        escenario = dict(fila)
+        escenario["entradas"] = json.loads(escenario["entradas"])
+        escenario["sello"], escenario["resultados"] = _desempaquetar_resultados(escenario["resultados"])
+        return escenario
+
+    def listar(self, cliente=None, region=None, desde=None, hasta=None, limite=100):
+        """Escenarios más recientes primero (sin entradas ni resultados), filtrando por cliente, región y fechas ISO."""
+        condiciones, valores = [], []
+        for columna, operador, valor in [("cliente", "=", cliente), ("region", "=", region),
+                                         ("fecha", ">=", desde), ("fecha", "<=", hasta)]:
+            if valor is not None:
+                condiciones.append(f"{columna} {operador} ?")
+                valores.append(valor)
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._lock:
+            filas = self._conectar().execute(
+                f"SELECT {_COLUMNAS_LISTADO} FROM escenarios {where} ORDER BY fecha DESC LIMIT ?", (*valores, limite)
+            ).fetchall()
+        return [dict(f) for f in filas]
+
+    def clientes(self):
+        with self._lock:
+            filas = self._conectar().execute("SELECT DISTINCT cliente FROM escenarios ORDER BY cliente").fetchall()
+        return [f["cliente"] for f in filas]
+
+    def eliminar(self, cliente, nombre):
+        with self._lock:
+            conexion = self._conectar()
+            with conexion:
+                return conexion.execute(
+                    "DELETE FROM escenarios WHERE cliente = ? AND nombre = ?", (cliente, nombre)
+                ).rowcount
+
+    def cerrar(self):
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+
+# Almacén único del proceso (la conexión se abre la primera vez que se usa)
+ALMACEN_ESCENARIOS = AlmacenEscenarios()
@@ -33,16 +33,54 @@
 
 import datetime
 import html
-from math import isclose
+import json
+import os
+import sqlite3
 
 import streamlit as st
-import streamlit.components.v1 as components
 import plotly.express as px
 import plotly.graph_objects as go
 import plotly.io as pio
 from plotly.subplots import make_subplots
 import pandas as pd
 
+from almacen_escenarios import ALMACEN_ESCENARIOS, ESCENARIOS_ACTIVADOS
+from cache_resultados import (
+    CACHE_RESULTADOS, PRECALCULO, VERSION_RESULTADOS, cacheado, claves_registradas, en_paralelo, iniciar_registro,
+    tamano_profundo,
+)
+from estado_url import codificar_estado, decodificar_estado
+from euribor import MESES_EURIBOR, VALORES_EURIBOR
+from motor_hipotecario import (
+    DTI_FAIL,
+    DTI_WARN,
+    INTERES_MAX_BUSQUEDA,
+    PERIODICIDADES_REVISION,
+    PLAZO_MAX_ANIOS,
+    buscar_precio_maximo,
+    calcular_capital_y_gastos,
+    cuota_maxima,
+    cuota_prestamo,
+    dti_visible,
+    escenarios_interes,
+    resultado_vivienda,
+    tipo_revisado,
+)
+from motor_fiscal import (
+    HUELLA_REGLAS, PERFILES_FISCALES, REGIONES, explicacion_impuestos, impuestos_compra, nombre_impuesto_transmision
+)
+from motor_vectorial import (
+    backtest_euribor_lote,
+    evolucion_anual_rapida,
+    FRONTERA_PUNTOS,
+    frontera_precio_maximo,
+    precio_maximo_por_region,
+    rejilla_frontera,
+    sensibilidad_vivienda,
+    sueldo_minimo_por_precio,
+)
+from tablas_amortizacion import TABLAS_AMORTIZACION
+
 # --- INICIO: SEO / robots / sitemap dinámico ---
 # URL pública de la app (tu dominio Streamlit)
 SITE_URL = "https://calculadorahipotecapro.streamlit.app"
@@ -85,7 +123,7 @@ if "sitemap" in _query_params:
     st.text(sitemap_xml)
     st.stop()
 
-# Meta tags + OpenGraph + JSON-LD (se inyectan en el body; Streamlit permite esto mediante unsafe_allow_html)
+# Meta tags + OpenGraph + JSON-LD (se añaden al <head> una vez por sesión, ver html_recursos)
 _meta_html = f"""
 <!-- SEO basico -->
 <meta name="description" content="Calculadora Hipotecaria Profesional — simula cuotas, LTV, DTI e impuestos rápidamente. Ideal para comparar escenarios de hipoteca en España.">
@@ -112,180 +150,84 @@ _meta_html = f"""
 }}
 </script>
 """
-# Inyectar los metadatos en la página (Streamlit los insertará en el body, eso es suficiente para verificación SEO)
-st.markdown(_meta_html, unsafe_allow_html=True)
-
-# Integración de Google Analytics 4 (GA4)
-if GA_MEASUREMENT_ID:
-    ga_snippet = """
-<!-- Google tag (gtag.js) -->
-<script>
-  (function() {
-    const parentDoc = window.parent.document;
-    if (!parentDoc.querySelector('script[data-ga-id="[GA_ID]"]')) {
-      const gtagScript = parentDoc.createElement('script');
-      gtagScript.setAttribute('data-ga-id', '[GA_ID]');
-      gtagScript.async = true;
-      gtagScript.src = 'https://www.googletagmanager.com/gtag/js?id=[GA_ID]';
-      parentDoc.head.appendChild(gtagScript);
-    }
-
-    window.parent.dataLayer = window.parent.dataLayer || [];
-    function gtag(){window.parent.dataLayer.push(arguments);}
-    window.parent.gtag = gtag;
-    gtag('js', new Date());
-    gtag('config', '[GA_ID]');
-  })();
-</script>
-""".replace("[GA_ID]", GA_MEASUREMENT_ID)
-    components.html(ga_snippet, height=0)
+# Integración de Google Analytics 4 (GA4): se ejecuta en la página principal, una vez por pestaña.
+# La URL se envía sin query string: ?e= lleva el estado de la simulación (sueldo, deudas, entrada...).
+_ga_snippet = """
+if (!document.querySelector('script[data-ga-id="[GA_ID]"]')) {
+  const gtagScript = document.createElement('script');
+  gtagScript.setAttribute('data-ga-id', '[GA_ID]');
+  gtagScript.async = true;
+  gtagScript.src = 'https://www.googletagmanager.com/gtag/js?id=[GA_ID]';
+  document.head.appendChild(gtagScript);
+  window.dataLayer = window.dataLayer || [];
+  window.gtag = function () { window.dataLayer.push(arguments); };
+  window.gtag('js', new Date());
+  const sinQuery = function (url) { return url ? url.split(/[?#]/)[0] : undefined; };
+  window.gtag('config', '[GA_ID]', {
+    page_location: location.origin + location.pathname,
+    page_referrer: sinQuery(document.referrer),
+  });
+}
+""".replace("[GA_ID]", GA_MEASUREMENT_ID) if GA_MEASUREMENT_ID else ""
 # --- FIN: SEO / robots / sitemap dinámico ---
 
+# Anota los resultados de la caché que usa esta ejecución (se guardan con el escenario del cliente)
+iniciar_registro()
 
-# Estilos CSS personalizados para mejorar la legibilidad
-st.markdown("""
-<style>
-    /* Mejora de contraste para títulos en modo oscuro */
-    .stApp[data-theme="dark"] h1,
-    .stApp[data-theme="dark"] h2,
-    .stApp[data-theme="dark"] h3,
-    .stApp[data-theme="dark"] h4,
-    .stApp[data-theme="dark"] h5,
-    .stApp[data-theme="dark"] h6 {
-        color: #FFFFFF !important;
-    }
-    
-    /* Mejora de contraste para texto en tooltips */
-    .stTooltip {
-        color: #000000 !important;
-    }
-    
-    /* Mejora de contraste para etiquetas de gráficos */
-    .stPlotlyChart .svg-container text {
-        fill: currentColor !important;
-    }
-    
-    /* Asegurar contraste en modo oscuro */
-    [data-theme="dark"] .stPlotlyChart .svg-container text {
-        fill: #FFFFFF !important;
-        opacity: 0.9 !important;
-    }
-    
-    /* Mejorar visibilidad de ejes y etiquetas */
-    [data-theme="dark"] .xtick text, 
-    [data-theme="dark"] .ytick text {
-        fill: #E0E0E0 !important;
-    }
-    
-    /* Asegurar que los contenedores de gráficos tengan el mismo tamaño */
-    .stPlotlyChart {
-        width: 100% !important;
-        height: auto !important;
-    }
-    
-    /* Asegurar que los indicadores de medidor (gauges) se muestren correctamente */
-    .js-plotly-plot {
-        display: flex !important;
-        justify-content: center !important;
-    }
-    
-    /* Asegurar que los contenedores de columnas tengan el mismo ancho */
-    .st-emotion-cache-ocqkz7 {
-        flex: 1 1 0% !important;
-        width: 50% !important;
-    }
-    
-    /* Mejorar visibilidad de leyendas */
-    [data-theme="dark"] .legendtext {
-        fill: #FFFFFF !important;
-    }
 
-    /* Fondo y borde de leyendas en modo oscuro */
-    [data-theme="dark"] .stPlotlyChart .legend .bg,
-    [data-theme="dark"] .stPlotlyChart .legendbg {
-        fill: rgba(22, 26, 33, 0.92) !important;
-        stroke: rgba(148, 163, 184, 0.35) !important;
-    }
+# =========================
+# 🎨 Estilos, tooltips, metadatos y analítica: una vez por sesión
+# =========================
+# Antes se enviaban en cada re-ejecución (bloque <style>, <script> del observador de tooltips,
+# metadatos SEO e iframe de GA). Ahora un único st.html los coloca en el <head> de la página la
+# primera vez: lo que se añade al <head> sobrevive a las re-ejecuciones aunque el elemento desaparezca.
+# Estilos y script se sirven como ficheros estáticos (app/static/, ver .streamlit/config.toml);
+# si el servidor no tiene activado enableStaticServing se insertan en línea.
+RUTA_ESTATICOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 
-    /* Tooltips para modo oscuro */
-    [data-theme="dark"] .stPlotlyChart .hovertext,
-    [data-theme="dark"] .stPlotlyChart .hoverlayer text {
-        fill: #0F172A !important;
-    }
-    
-    /* Encabezado del tooltip (año) */
-    [data-theme="dark"] .stPlotlyChart .hovertext > g:nth-child(1) > text {
-        fill: #0F172A !important;
-        font-weight: 700 !important;
-        opacity: 1 !important;
-    }
 
-    [data-theme="dark"] .stPlotlyChart .hoverlayer path.bg,
-    [data-theme="dark"] .stPlotlyChart .hoverlayer rect.bg {
-        fill: rgba(22, 26, 33, 0.95) !important;
-        stroke: rgba(148, 163, 184, 0.45) !important;
-    }
-    
-    /* Estilos específicos para la leyenda del gráfico de donut */
-    [data-theme="dark"] .stPlotlyChart .legend .bg,
-    [data-theme="dark"] .stPlotlyChart .legend .legendbox,
-    [data-theme="dark"] .stPlotlyChart .legend .legendfill {
-        fill: rgba(15, 23, 42, 0.98) !important;
-        stroke: rgba(100, 116, 139, 0.5) !important;
-    }
-    
-    [data-theme="dark"] .stPlotlyChart .legend .legendtext {
-        fill: #FFFFFF !important;
-    }
-    
-    /* Forzar estilos para la leyenda del gráfico de donut */
-    [data-theme="dark"] .stPlotlyChart .legend .scrollbox {
-        background-color: rgba(15, 23, 42, 0.98) !important;
-        border: 1px solid rgba(100, 116, 139, 0.5) !important;
-    }
-    
-    [data-theme="dark"] .stPlotlyChart .legend .legendtoggle {
-        cursor: default !important;
-        pointer-events: none !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+def _literal_js(texto):
+    """Cadena JavaScript segura dentro de <script> (un '</script>' literal cerraría el bloque antes de tiempo)."""
+    return json.dumps(texto).replace("</", "<\\/")
+
 
-# Código JavaScript para forzar estilos en tooltips
-st.markdown("""
+def html_recursos():
+    """HTML + JavaScript que inyecta en el <head> los recursos de la página si aún no están."""
+    estaticos = st.get_option("server.enableStaticServing")
+    if estaticos:
+        estilos = '<link rel="stylesheet" href="app/static/estilos.css">'
+        tooltips = "s.src = 'app/static/tooltips.js';"
+    else:
+        with open(os.path.join(RUTA_ESTATICOS, "estilos.css"), encoding="utf-8") as f:
+            estilos = f"<style>{f.read()}</style>"
+        with open(os.path.join(RUTA_ESTATICOS, "tooltips.js"), encoding="utf-8") as f:
+            tooltips = f"s.textContent = {_literal_js(f.read())};"
+    return f"""
 <script>
-// Aplicar estilos a tooltips después de que se renderice el gráfico
-setTimeout(function() {
-    // Seleccionar todos los textos de tooltips
-    const tooltipTexts = document.querySelectorAll('.hovertext text');
-    
-    // Aplicar estilos a cada elemento
-    tooltipTexts.forEach(function(el) {
-        el.style.fill = '#0F172A';
-        el.style.fontWeight = '700';
-        el.style.opacity = '1';
-    });
-    
-    // Observar cambios en el DOM para aplicar estilos a nuevos tooltips
-    const observer = new MutationObserver(function(mutations) {
-        mutations.forEach(function(mutation) {
-            mutation.addedNodes.forEach(function(node) {
-                if (node.nodeType === 1) {
-                    const newTooltips = node.querySelectorAll('.hovertext text');
-                    newTooltips.forEach(function(tooltip) {
-                        tooltip.style.fill = '#0F172A';
-                        tooltip.style.fontWeight = '700';
-                        tooltip.style.opacity = '1';
-                    });
-                }
-            });
-        });
-    });
-    
-    observer.observe(document.body, { childList: true, subtree: true });
-}, 1000); // Esperar 1 segundo
+(function () {{
+  if (document.getElementById('calculadora-recursos')) return;  // ya inyectados en esta pestaña
+  document.head.insertAdjacentHTML('beforeend', {_literal_js('<meta id="calculadora-recursos">' + _meta_html + estilos)});
+  const s = document.createElement('script');
+  {tooltips}
+  document.head.appendChild(s);
+  {_ga_snippet}
+}})();
 </script>
-""", unsafe_allow_html=True)
+"""
+
+
+if not st.session_state.get("_recursos_inyectados"):
+    st.html(html_recursos(), unsafe_allow_javascript=True)
+    st.session_state["_recursos_inyectados"] = True
+
+def usar_plantilla_plotly(nombre):
+    """
+    Fija la plantilla por defecto de Plotly solo si cambia: cada asignación la valida de nuevo (~18 ms)
+    y, al ser global del proceso, no conviene reescribirla mientras otros hilos construyen figuras.
+    """
+    if pio.templates.default != nombre:
+        pio.templates.default = nombre
+
 
 # Función auxiliar para manejar temas en los gráficos
 def get_chart_theme():
@@ -356,7 +298,7 @@ def get_chart_theme():
         is_dark = False
 
     if is_dark:
-        pio.templates.default = "plotly_dark"
+        usar_plantilla_plotly("plotly_dark")
         return {
             'dark': True,
             'text_color': '#E5E7EB',
@@ -381,7 +323,7 @@ def get_chart_theme():
             ]
         }
     else:
-        pio.templates.default = "plotly_white"
+        usar_plantilla_plotly("plotly_white")
         return {
             'dark': False,
             'text_color': '#1A1A1A',
@@ -442,10 +384,79 @@ def color_with_alpha(color: str | None, alpha: float) -> str:
 
 
 # =========================
-# Umbrales globales de DTI
+# 📦 Gráficos con carga útil mínima
 # =========================
-DTI_WARN = 0.30   # ≤ 30% → Seguro
-DTI_FAIL = 0.35   # ≤ 35% → Moderado; > 35% → Arriesgado
+# Cada st.plotly_chart envía la figura completa en JSON en cada re-ejecución. Las plantillas
+# estándar ('plotly'/'plotly_dark') ocupan ~7 KB por gráfico aunque casi todo se sobrescribe,
+# así que los gráficos de evolución y pagos usan una plantilla compacta con el estilo común
+# (título, subtítulo, ejes, tooltips) y series redondeadas al euro, enviadas como arrays tipados.
+BYTES_GRAFICOS = {}  # nombre → bytes de la figura enviada en esta ejecución (ver ?diagnostico=1)
+
+
+def colores_tooltip(theme):
+    """(fondo, borde, texto) de los tooltips: fondo claro y texto oscuro también en modo oscuro, por contraste."""
+    if theme.get('dark'):
+        return 'rgba(255, 255, 255, 0.96)', 'rgba(100, 116, 139, 0.5)', '#1A1A1A'
+    return (
+        color_with_alpha(theme.get('secondary_bg', '#F0F2F6'), 0.96),
+        color_with_alpha(theme.get('axis_label_color', theme['text_color']), 0.3),
+        theme.get('text_color', '#1A1A1A'),
+    )
+
+
+def plantilla_compacta(theme):
+    """
+    Plantilla con solo lo que usan los gráficos: el estilo propio de la app más los pocos valores de
+    'plotly'/'plotly_dark' que se notan en ejes y barras (marcas, grosor del cero, separación de títulos).
+    """
+    base = pio.templates['plotly_dark' if theme['dark'] else 'plotly'].layout
+    hover_bg, hover_border, hover_text = colores_tooltip(theme)
+    color_ejes = theme.get('axis_label_color', theme['text_color'])
+    eje = dict(
+        gridcolor=theme['grid_color'], linecolor=color_ejes, zerolinecolor=color_ejes, zerolinewidth=2,
+        showgrid=True, ticks='', automargin=True,
+        tickfont=dict(color=theme.get('tick_color', theme['text_color']), size=12),
+        title=dict(standoff=15, font=dict(color=color_ejes, size=13)),
+    )
+    return {
+        'layout': dict(
+            autosize=True,
+            font=dict(size=12, color=theme['text_color']),
+            title=dict(
+                x=0.5, xanchor='center', pad=dict(b=10, t=20),
+                font=dict(color=theme.get('title_color', theme['text_color']), family='Arial, sans-serif', size=18),
+            ),
+            annotationdefaults=dict(
+                x=0.5, y=1.0, xref='paper', yref='paper', showarrow=False,
+                xanchor='center', yanchor='bottom', yshift=10, opacity=0.95,
+                font=dict(size=14, family='Arial, sans-serif, Segoe UI',
+                          color='#F0F0F0' if theme['dark'] else theme.get('subtitle_color', theme['text_color'])),
+            ),
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            xaxis=eje,
+            yaxis=eje,
+            hoverlabel=dict(bgcolor=hover_bg, bordercolor=hover_border, align='left', namelength=-1,
+                            font=dict(color=hover_text, size=12, family='sans-serif')),
+        ),
+        'data': {'bar': [dict(marker=dict(line=dict(color=base.plot_bgcolor, width=0.5)))]},
+    }
+
+
+def serie_euros(serie):
+    """Importes redondeados al euro como int32: Plotly los envía como array tipado (4 bytes por punto)."""
+    return serie.round().astype('int32').to_numpy()
+
+
+def serie_anios(serie):
+    return serie.astype('int8').to_numpy()  # plazos de hasta 40 años
+
+
+def mostrar_grafico(nombre, figura_json, config=None):
+    """Dibuja una figura serializada y anota los bytes que ocupa en el mensaje al navegador."""
+    BYTES_GRAFICOS[nombre] = len(figura_json.encode())
+    st.plotly_chart(pio.from_json(figura_json), width="stretch",
+                    config=config or {'displayModeBar': False, 'responsive': True})
 
 
 # =========================
@@ -479,14 +490,6 @@ def pct_dti(dti_val):
     val = math.ceil(dti_val * 10000) / 100
     return f"{val:.2f}%".replace(".", ",")
 
-def dti_visible(dti_val):
-    """Devuelve el DTI visible como proporción (0–1) alineada con pct_dti.
-    Usa ceil para mostrar el valor más conservador al usuario."""
-    if dti_val is None:
-        return None
-    val_pct = math.ceil(dti_val * 10000) / 100  # ej. 35.01 (%)
-    return val_pct / 100  # 0.3501
-
 def semaforo_dti(dti_val):
     """Clasifica el DTI en Seguro, Moderado o Arriesgado con coherencia visual."""
     dv = round(dti_val, 4)  # valor lógico interno
@@ -497,18 +500,6 @@ def semaforo_dti(dti_val):
     else:
         return f"🔴 {pct_dti(dv)} (Arriesgado)"
 
-def es_viable(cuota, cuota_max, ltv_val, ltv_max, dti_val):
-    """
-    Valida la operación usando los mismos criterios que ve el usuario:
-    - Cuota ≤ cuota máxima
-    - LTV ≤ LTV máximo
-    - DTI visible (redondeado hacia arriba a 2 decimales) ≤ 35 %
-    """
-    return (
-        cuota <= cuota_max
-        and ltv_val <= ltv_max
-        and dti_visible(dti_val) <= DTI_FAIL
-    )
 
 
 
@@ -537,148 +528,11 @@ def get_theme_colors():
 # =========================
 ESCENARIOS_INTERES_PCT = [2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]  # porcentaje mostrado al usuario
 
-# =========================
-# Cálculos financieros
-# =========================
-def cuota_prestamo(capital, interes_anual, anos):
-    n = int(anos * 12)
-    if n <= 0 or capital is None or capital <= 0:
-        return None
-    r = interes_anual / 12.0
-    if isclose(r, 0.0, abs_tol=1e-12):
-        return capital / n
-    return capital * (r / (1 - (1 + r) ** (-n)))
-
-def cuota_maxima(sueldo_neto_mensual, deudas_mensuales, ratio=0.35):
-    return max(0.0, sueldo_neto_mensual * ratio - deudas_mensuales)
-
-def dti(cuota_hipoteca, deudas_mensuales, sueldo_neto_mensual):
-    """Calcula DTI con precisión de 6 decimales internamente."""
-    if sueldo_neto_mensual is None or sueldo_neto_mensual <= 0:
-        return 0.0
-    if cuota_hipoteca is None or cuota_hipoteca < 0:
-        cuota_hipoteca = 0.0
-    if deudas_mensuales is None or deudas_mensuales < 0:
-        deudas_mensuales = 0.0
-    val = (cuota_hipoteca + deudas_mensuales) / sueldo_neto_mensual
-    return round(val, 6)  # redondeamos a 6 decimales para evitar errores de precisión
-
-def cuota_mixta_peor_tramo(capital, plazo_anios, interes_fijo_pct, euribor_pct, diferencial_pct):
-    """
-    Calcula ambas cuotas (fijo y variable) sobre el plazo total y devuelve:
-    (cuota_peor, cuota_fija, cuota_variable, tramo_peor)
-    """
-    if capital is None or capital <= 0 or plazo_anios <= 0:
-        return None, None, None, None
-
-    r_fijo = (interes_fijo_pct or 0.0)
-    r_var  = ((euribor_pct or 0.0) + (diferencial_pct or 0.0))
-
-    cuota_fija = cuota_prestamo(capital, r_fijo, plazo_anios) or 0.0
-    cuota_var  = cuota_prestamo(capital, r_var,  plazo_anios) or 0.0
-
-    cuota_peor = max(cuota_fija, cuota_var)
-    tramo_peor = "FIJO" if cuota_peor == cuota_fija else "VARIABLE"
-    return cuota_peor, cuota_fija, cuota_var, tramo_peor
-
-
-# =========================
-# Presets fiscales (simplificados y coherentes)
-# =========================
-PRESETS_IMPUESTOS = {
-    "Andalucía": {"nuevo": {"iva": 0.10, "ajd": 0.015}, "segunda": {"itp": 0.08}},
-    "Aragón": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.08}},
-    "Asturias": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.08}},
-    "Baleares": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.08}},  # antes "Illes Balears"
-    "Canarias": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.06}},  # simplificado
-    "Cantabria": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.10}},
-    "Castilla-La Mancha": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.09}},
-    "Castilla y León": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.08}},
-    "Cataluña": {"nuevo": {"iva": 0.10, "ajd": 0.015}, "segunda": {"itp": 0.10}},
-    "Ceuta y Melilla": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.06}},
-    "Extremadura": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.08}},
-    "Galicia": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.09}},
-    "La Rioja": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.07}},
-    "Madrid": {"nuevo": {"iva": 0.10, "ajd": 0.007}, "segunda": {"itp": 0.06}},
-    "Murcia": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.08}},
-    "Navarra": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.06}},
-    "País Vasco": {"nuevo": {"iva": 0.10, "ajd": 0.010}, "segunda": {"itp": 0.04}},
-    "Valencia": {"nuevo": {"iva": 0.10, "ajd": 0.015}, "segunda": {"itp": 0.10}},  # antes "Comunidad Valenciana"
-}
-
-
 # =========================
 # Lista de comunidades (ordenada alfabéticamente)
 # =========================
-comunidades = sorted(PRESETS_IMPUESTOS.keys())
-
-
-
-def tipo_impuesto_por_ccaa(ccaa, estado):
-    data = PRESETS_IMPUESTOS.get(ccaa, PRESETS_IMPUESTOS["Madrid"])
-    if estado == "Nuevo":
-        return data["nuevo"]["iva"] + data["nuevo"]["ajd"]
-    else:
-        return data["segunda"]["itp"]
-
-# =========================
-# Explicaciones fiscales (alineadas con presets simplificados)
-# =========================
-EXPLICACION_IMPUESTOS = {
-    ("Madrid", "Nuevo"): "En Madrid (obra nueva) se aplica IVA 10% + AJD 0,7%.",
-    ("Madrid", "Segunda mano"): "En Madrid (segunda mano) se aplica ITP 6%.",
-
-    ("Cataluña", "Nuevo"): "En Cataluña (obra nueva) se aplica IVA 10% + AJD 1,5%.",
-    ("Cataluña", "Segunda mano"): "En Cataluña (segunda mano) se aplica ITP 10%.",
-
-    ("Andalucía", "Nuevo"): "En Andalucía (obra nueva) se aplica IVA 10% + AJD 1,5%.",
-    ("Andalucía", "Segunda mano"): "En Andalucía (segunda mano) se aplica ITP 8%.",
-
-    ("Valencia", "Nuevo"): "En Valencia (obra nueva) se aplica IVA 10% + AJD 1,5%.",
-    ("Valencia", "Segunda mano"): "En Valencia (segunda mano) se aplica ITP 10%.",
-
-    ("País Vasco", "Nuevo"): "En País Vasco (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("País Vasco", "Segunda mano"): "En País Vasco (segunda mano) se aplica ITP 4%.",
-
-    ("Navarra", "Nuevo"): "En Navarra (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Navarra", "Segunda mano"): "En Navarra (segunda mano) se aplica ITP 6%.",
-
-    ("Galicia", "Nuevo"): "En Galicia (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Galicia", "Segunda mano"): "En Galicia (segunda mano) se aplica ITP 9%.",
-
-    ("Castilla y León", "Nuevo"): "En Castilla y León (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Castilla y León", "Segunda mano"): "En Castilla y León (segunda mano) se aplica ITP 8%.",
-
-    ("Castilla-La Mancha", "Nuevo"): "En Castilla-La Mancha (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Castilla-La Mancha", "Segunda mano"): "En Castilla-La Mancha (segunda mano) se aplica ITP 9%.",
-
-    ("Murcia", "Nuevo"): "En Murcia (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Murcia", "Segunda mano"): "En Murcia (segunda mano) se aplica ITP 8%.",
-
-    ("La Rioja", "Nuevo"): "En La Rioja (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("La Rioja", "Segunda mano"): "En La Rioja (segunda mano) se aplica ITP 7%.",
-
-    ("Cantabria", "Nuevo"): "En Cantabria (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Cantabria", "Segunda mano"): "En Cantabria (segunda mano) se aplica ITP 10%.",
-
-    ("Aragón", "Nuevo"): "En Aragón (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Aragón", "Segunda mano"): "En Aragón (segunda mano) se aplica ITP 8%.",
-
-    ("Asturias", "Nuevo"): "En Asturias (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Asturias", "Segunda mano"): "En Asturias (segunda mano) se aplica ITP 8%.",
-
-    ("Baleares", "Nuevo"): "En Baleares (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Baleares", "Segunda mano"): "En Baleares (segunda mano) se aplica ITP 8%.",
-
-    ("Extremadura", "Nuevo"): "En Extremadura (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Extremadura", "Segunda mano"): "En Extremadura (segunda mano) se aplica ITP 8%.",
-
-    ("Ceuta y Melilla", "Nuevo"): "En Ceuta y Melilla (obra nueva) se aplica IVA 10% + AJD 1,0%.",
-    ("Ceuta y Melilla", "Segunda mano"): "En Ceuta y Melilla (segunda mano) se aplica ITP 6%.",
-
-    ("Canarias", "Nuevo"): "En Canarias (obra nueva) IVA 10% + AJD 1,0% (simplificación).",
-    ("Canarias", "Segunda mano"): "En Canarias (segunda mano) ITP 6% (simplificación).",
-}
+# Las reglas y sus explicaciones salen de datos/reglas_fiscales.json (ver motor_fiscal.py)
+comunidades = REGIONES
 
 
 
@@ -700,6 +554,9 @@ DEFAULTS = {
     "interes_fijo": 4.0,
     "euribor": 2.0,
     "diferencial": 1.0,
+    "revision_variable": "Anual",
+    "suelo_variable": 0.0,
+    "techo_variable": 0.0,
     "anios_fijo": 5,
     "interes_fijo_mixta": 2.0,
     "euribor_mixta": 2.0,
@@ -713,6 +570,7 @@ DEFAULTS = {
     "com_apertura": 1.0,
     "ccaa": "Madrid",
     "estado_vivienda": "Segunda mano",
+    "perfil_fiscal": "general",
     "usar_manual": False,
     "iva_itp": 10.0,
     "ajd": 1.0,
@@ -738,6 +596,29 @@ if 'modo' in st.session_state and st.session_state.modo not in opciones_modo:
 # === Claves controladas ===
 KEYS_WIDGETS = list(DEFAULTS.keys())
 
+# === Estado compartible en la URL (?e=...) ===
+ESTADOS_VIVIENDA = ["Nuevo", "Segunda mano"]
+USOS_VIVIENDA = ["🏠 Vivienda habitual", "🏖️ Segunda residencia / inversión"]
+TIPOS_HIPOTECA = ["Fija", "Variable", "Mixta"]
+OPCIONES_URL = {
+    "modo": opciones_modo,
+    "ccaa": comunidades,
+    "estado_vivienda": ESTADOS_VIVIENDA,
+    "uso_vivienda": USOS_VIVIENDA,
+    "perfil_fiscal": list(PERFILES_FISCALES),
+    "tipo_hipoteca": TIPOS_HIPOTECA,
+    "revision_variable": list(PERIODICIDADES_REVISION),
+}
+
+# Un enlace compartido rellena toda la sesión de una vez (antes de crear los widgets). Solo se aplica
+# si el código de la URL es distinto del último aplicado/escrito, para no pisar los cambios del usuario.
+_codigo_url = _query_params.get("e")
+if _codigo_url and _codigo_url != st.session_state.get("_estado_url"):
+    _estado_compartido = decodificar_estado(_codigo_url, OPCIONES_URL)
+    if _estado_compartido is not None:
+        st.session_state.update(_estado_compartido)
+    st.session_state["_estado_url"] = _codigo_url
+
 # =========================
 # ⚙️ Selección de modo
 # =========================
@@ -902,6 +783,62 @@ if st.sidebar.button("🔄 Resetear calculadora"):
     st.toast("✅ Calculadora restablecida a valores por defecto", icon="🏠")
     st.rerun()
 
+# === Escenarios de clientes (almacén SQLite local) ===
+# Se guardan los valores de todos los widgets de cálculo y los resultados ya calculados
+CLAVES_ESCENARIO = KEYS_WIDGETS + ["uso_vivienda"]
+# Los resultados guardados solo se reutilizan con los mismos cálculos y las mismas reglas fiscales
+SELLO_RESULTADOS = f"v{VERSION_RESULTADOS}-{HUELLA_REGLAS}"
+
+
+def pedir_guardado_escenario():
+    # El guardado se hace al final del script, cuando esta ejecución ya ha calculado todos sus resultados
+    st.session_state["_guardar_escenario"] = True
+
+
+def abrir_escenario():
+    """Restaura los widgets y siembra la caché con los resultados guardados (antes de la nueva ejecución)."""
+    escenario = ALMACEN_ESCENARIOS.cargar(st.session_state["escenario_cliente"].strip(), st.session_state["escenario_abrir"])
+    if escenario is None:
+        return
+    for clave, valor in escenario["entradas"].items():
+        if clave in CLAVES_ESCENARIO:
+            st.session_state[clave] = valor
+    st.session_state["escenario_nombre"] = escenario["nombre"]
+    # La caché es de todas las sesiones: resultados de otro motor u otras reglas se descartan y se recalculan
+    if escenario["sello"] == SELLO_RESULTADOS:
+        CACHE_RESULTADOS.importar(escenario["resultados"])
+
+
+with st.sidebar.expander("💾 Escenarios de clientes"):
+    # Solo en instalaciones privadas (ver almacen_escenarios.ESCENARIOS_ACTIVADOS)
+    if ESCENARIOS_ACTIVADOS:
+        cliente_escenario = st.text_input(
+            "Cliente", key="escenario_cliente",
+            help="Nombre o referencia del cliente. Sus escenarios se guardan en el servidor de la app: "
+                 "cualquiera con acceso a ella puede abrirlos con este nombre."
+        ).strip()
+        nombre_escenario = st.text_input(
+            "Nombre del escenario", key="escenario_nombre",
+            help="Si ya existe un escenario con este nombre para el cliente, se sobrescribe."
+        ).strip()
+        st.button(
+            "💾 Guardar escenario", on_click=pedir_guardado_escenario,
+            disabled=not (cliente_escenario and nombre_escenario)
+        )
+        try:
+            escenarios_cliente = ALMACEN_ESCENARIOS.listar(cliente=cliente_escenario) if cliente_escenario else []
+        except sqlite3.Error:
+            escenarios_cliente = []
+            st.caption("⚠️ El almacén de escenarios no está disponible en este entorno.")
+        if escenarios_cliente:
+            st.selectbox(
+                "Escenarios guardados", [e["nombre"] for e in escenarios_cliente], key="escenario_abrir",
+                format_func=lambda n: next(f"{e['nombre']} · {e['fecha'][:10]} · {e['region'] or '—'}"
+                                           for e in escenarios_cliente if e["nombre"] == n)
+            )
+            st.button("📂 Abrir escenario", on_click=abrir_escenario)
+    st.caption("🔗 El enlace de la barra de direcciones incluye todos los datos de la barra lateral: puedes copiarlo para compartir el escenario.")
+
 st.sidebar.markdown("---")
 
 # === Datos del inmueble ===
@@ -912,45 +849,36 @@ ccaa = st.sidebar.selectbox(
     help="La fiscalidad de la compra varía por CCAA. Impacta en IVA/ITP y AJD, afectando la entrada necesaria."
 )
 
-# Recuperamos los presets fiscales de la comunidad seleccionada
-presets = PRESETS_IMPUESTOS[ccaa]
-
-
 estado_vivienda = st.sidebar.radio(
-    "Estado", ["Nuevo", "Segunda mano"], key="estado_vivienda",
+    "Estado", ESTADOS_VIVIENDA, key="estado_vivienda",
     help="Obra nueva: IVA + AJD. Segunda mano: ITP. Cambia el coste fiscal y la entrada mínima necesaria."
 )
 
 
 # 👇 NUEVO BLOQUE: Uso de la vivienda
+def aplicar_presets_uso():
+    """Aplica LTV y plazo orientativos SOLO cuando el usuario cambia el uso de la vivienda."""
+    if st.session_state["uso_vivienda"] == "🏠 Vivienda habitual":
+        st.session_state["ltv"] = 80
+        st.session_state["plazo"] = 30
+    elif st.session_state["uso_vivienda"] == "🏖️ Segunda residencia / inversión":
+        st.session_state["ltv"] = 70
+        st.session_state["plazo"] = 25
+
 uso_vivienda = st.sidebar.radio(
     "Uso de la vivienda",
-    ["🏠 Vivienda habitual", "🏖️ Segunda residencia / inversión"],
+    USOS_VIVIENDA,
     key="uso_vivienda",
     help=(
         "Los bancos suelen ofrecer hasta el 80 % de financiación y plazos de hasta 30–35 años "
         "para vivienda habitual.\n\n"
         "Para segunda residencia/inversión, lo habitual es un 60–70 % de financiación y plazos "
         "de 20–25 años, con tipos de interés algo más altos."
-    )
+    ),
+    # El callback evita guardar en sesión una copia del último uso seleccionado
+    on_change=aplicar_presets_uso
 )
 
-# --- Inicializar memoria del último uso seleccionado ---
-if "uso_vivienda_prev" not in st.session_state:
-    st.session_state["uso_vivienda_prev"] = uso_vivienda
-
-# --- Aplicar presets SOLO si el usuario cambia de opción ---
-if uso_vivienda != st.session_state["uso_vivienda_prev"]:
-    if uso_vivienda == "🏠 Vivienda habitual":
-        st.session_state["ltv"] = 80
-        st.session_state["plazo"] = 30
-    elif uso_vivienda == "🏖️ Segunda residencia / inversión":
-        st.session_state["ltv"] = 70
-        st.session_state["plazo"] = 25
-
-# --- Actualizar el valor previo ---
-st.session_state["uso_vivienda_prev"] = uso_vivienda
-
 # 👇 Continúa con la parte de impuestos
 usar_manual = st.sidebar.checkbox(
     "Introducir impuestos manualmente", key="usar_manual",
@@ -967,7 +895,20 @@ if usar_manual:
     ) / 100
     tipo_impuesto = iva_itp_pct + ajd_pct
 else:
-    tipo_impuesto = tipo_impuesto_por_ccaa(ccaa, estado_vivienda)
+    tipo_impuesto = None
+
+perfil_fiscal = st.sidebar.selectbox(
+    "Perfil fiscal", list(PERFILES_FISCALES), key="perfil_fiscal",
+    format_func=PERFILES_FISCALES.get,
+    disabled=usar_manual or uso_vivienda != "🏠 Vivienda habitual",
+    help="Algunas comunidades aplican tipos reducidos a jóvenes o familias numerosas (solo vivienda habitual y, a menudo, con un precio máximo)."
+)
+# Las bonificaciones solo aplican a la vivienda habitual
+if uso_vivienda != "🏠 Vivienda habitual":
+    perfil_fiscal = "general"
+
+# Región, estado y perfil con los que el motor fiscal calcula los impuestos (None = tipo manual)
+fiscal = None if usar_manual else (ccaa, estado_vivienda, perfil_fiscal)
 
 # 👇 Campo de precio de la vivienda: siempre visible, editable solo en Modo 2
 if modo == "🏠 Comprobar una vivienda concreta":
@@ -988,7 +929,7 @@ else:
         disabled=True
     )
 
-explicacion = EXPLICACION_IMPUESTOS.get((ccaa, estado_vivienda))
+explicacion = None if usar_manual else explicacion_impuestos(ccaa, estado_vivienda, perfil_fiscal)
 if explicacion:
     st.sidebar.info(explicacion)
 
@@ -1046,10 +987,15 @@ anos_plazo = st.sidebar.slider(
 )
 
 tipo_hipoteca = st.sidebar.radio(
-    "Tipo de hipoteca", ["Fija", "Variable", "Mixta"], key="tipo_hipoteca",
+    "Tipo de hipoteca", TIPOS_HIPOTECA, key="tipo_hipoteca",
     help="Elige Fija (cuota estable), Variable (Euríbor + diferencial) o Mixta (tramo fijo y luego variable). La estabilidad del pago depende del tipo elegido."
 )
 
+# Parámetros que solo existen en algunos tipos de hipoteca
+interes_fijo = euribor = diferencial = interes_variable = anios_fijo = None
+suelo = techo = None
+meses_revision = PERIODICIDADES_REVISION["Anual"]
+
 if tipo_hipoteca == "Fija":
     interes_anual = st.sidebar.number_input(
         "Interés fijo (%)", 0.0, 10.0, step=0.1, key="interes_fijo",
@@ -1067,7 +1013,25 @@ elif tipo_hipoteca == "Variable":
         value=st.session_state["diferencial"], step=0.1, key="diferencial",
         help="Margen fijo que el banco añade al Euríbor (ej. Euríbor + 1%). Negociable según perfil, vinculación y condiciones."
     ) / 100
-    interes_anual = euribor + diferencial
+    meses_revision = PERIODICIDADES_REVISION[st.sidebar.radio(
+        "Revisión del tipo", list(PERIODICIDADES_REVISION), key="revision_variable", horizontal=True,
+        help="Cada cuánto se actualiza el tipo con el Euríbor vigente. En cada revisión la cuota se recalcula sobre el capital pendiente y el plazo que queda."
+    )]
+    col_suelo, col_techo = st.sidebar.columns(2)
+    suelo = col_suelo.number_input(
+        "Suelo (%)", 0.0, 10.0, step=0.1, key="suelo_variable",
+        help="Tipo mínimo que se aplica aunque Euríbor + diferencial quede por debajo. Desde la Ley 5/2019 el tipo nunca puede ser negativo (suelo del 0 %)."
+    ) / 100
+    techo = col_techo.number_input(
+        "Techo (%)", 0.0, 20.0, step=0.1, key="techo_variable",
+        help="Tipo máximo pactado en el contrato, si lo hay. 0 = sin techo."
+    ) / 100 or None
+    if techo is not None and techo < suelo:
+        st.sidebar.warning(
+            f"⚠️ El techo ({pct(techo)}) es inferior al suelo ({pct(suelo)}): se ignora el techo hasta que lo corrijas."
+        )
+        techo = None
+    interes_anual = tipo_revisado(euribor, diferencial, suelo, techo)
 
 elif tipo_hipoteca == "Mixta":
     anios_fijo = st.sidebar.number_input(
@@ -1131,6 +1095,7 @@ com_apertura_pct = st.sidebar.number_input(
 # ✅ Parámetros agregados para cálculos posteriores
 params = {
     "tipo_impuesto": tipo_impuesto,
+    "fiscal": fiscal,
     "notario": notario,
     "gestoria": gestoria,
     "registro": registro,
@@ -1142,39 +1107,730 @@ params = {
 
 
 # =========================
-# Función unificada de cálculo
+# Precio máximo viable (modo 1)
 # =========================
-def calcular_capital_y_gastos(precio, entrada, params, ltv_max=0.80, financiar_comision=False):
-    impuestos_pct = params["tipo_impuesto"]
-    impuestos = precio * impuestos_pct
-    gastos_puros = impuestos + params["notario"] + params["gestoria"] + params["registro"] + params["tasacion"] + params["seguro_inicial"]
-
-    diferencia_entrada = entrada - gastos_puros
-    excedente = max(0.0, diferencia_entrada)
-    capital_preliminar = max(0.0, precio - excedente)
-
-    com_apertura = capital_preliminar * params["com_apertura_pct"] if params["com_apertura_pct"] > 0 else 0.0
-    if financiar_comision:
-        capital_final = capital_preliminar + com_apertura
-        gastos_iniciales = gastos_puros
-    else:
-        capital_final = capital_preliminar
-        gastos_iniciales = gastos_puros + com_apertura
+# El motor hace la búsqueda; aquí solo se comparte el resultado entre sesiones
+calcular_precio_maximo = cacheado(CACHE_RESULTADOS)(buscar_precio_maximo)
+
+
+@cacheado(CACHE_RESULTADOS)
+def calcular_precio_maximo_por_region(*args, **kwargs):
+    """Precio máximo en todas las CCAA y estados con una única búsqueda vectorizada."""
+    return pd.DataFrame(precio_maximo_por_region(*args, **kwargs))
+
+
+@cacheado(CACHE_RESULTADOS)
+def figura_regiones_json(regiones, precios_nuevo, precios_segunda, ccaa_actual, estado_actual, theme):
+    """Ranking horizontal del precio máximo por comunidad (Nuevo / Segunda mano), serializado a JSON."""
+    df = pd.DataFrame({"Comunidad": regiones, "Nuevo": precios_nuevo, "Segunda mano": precios_segunda})
+    # Plotly dibuja las barras horizontales de abajo arriba: orden ascendente = mayor precio arriba
+    df = df.sort_values(estado_actual, ascending=True)
+    etiquetas = [f"<b>{c}</b>" if c == ccaa_actual else c for c in df["Comunidad"]]
+
+    fig_regiones = go.Figure()
+    for i, estado in enumerate(["Nuevo", "Segunda mano"]):
+        fig_regiones.add_trace(
+            go.Bar(
+                x=df[estado],
+                y=etiquetas,
+                orientation='h',
+                name=estado,
+                marker_color=theme['colors'][i],
+                hovertemplate=f"%{{y}} · {estado}: %{{x:,.0f}} €<extra></extra>"
+            )
+        )
+
+    fig_regiones.update_layout(
+        barmode='group',
+        height=max(420, 34 * len(df)),
+        margin=dict(l=10, r=20, t=30, b=40),
+        font=dict(size=12, color=theme['text_color']),
+        legend=dict(orientation='h', yanchor='bottom', y=1.0, xanchor='right', x=1.0),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(gridcolor=theme['grid_color'], tickformat=',.0f', ticksuffix=' €', automargin=True),
+        yaxis=dict(automargin=True),
+        template='plotly_dark' if theme['dark'] else 'plotly'
+    )
+    return fig_regiones.to_json()
+
+
+# =========================
+# Frontera de asequibilidad (modo 1)
+# =========================
+TRAMO_PRECIO = 25_000  # bandas de precio para la tabla de ingresos necesarios
 
-    ltv_real = (capital_final / precio) if (precio is not None and precio > 0) else 0.0
-    ltv_ok = ltv_real <= ltv_max
 
+@cacheado(CACHE_RESULTADOS)
+def calcular_frontera(sueldo_neto, entrada_usuario, anos_plazo, deudas_mensuales, ratio_dti, params, ltv_max,
+                      financiar_comision, tipo_hipoteca, interes_anual, interes_fijo, euribor, diferencial):
+    """
+    Precio máximo en función del sueldo para varias entradas (con el plazo actual) y varios plazos (con la
+    entrada actual): toda la rejilla se resuelve en una sola búsqueda vectorizada.
+    """
+    sueldos, entradas, plazos = rejilla_frontera(sueldo_neto, entrada_usuario, anos_plazo)
+    precios = frontera_precio_maximo(
+        sueldos, entradas, plazos, deudas_mensuales, ratio_dti, params, ltv_max, financiar_comision,
+        tipo_hipoteca, interes_anual, interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+    )
+    i_entrada = list(entradas).index(entrada_usuario)
+    i_plazo = list(plazos).index(anos_plazo)
+    sueldo = pd.Series(sueldos)
     return {
-        "gastos_puros": gastos_puros,
-        "gastos_iniciales": gastos_iniciales,
-        "capital_final": capital_final,
-        "excedente": excedente,
-        "diferencia_entrada": diferencia_entrada,
-        "ltv": ltv_real,
-        "ltv_ok": ltv_ok
+        "entradas": {eur(e): pd.Series(precios[i, i_plazo]) for i, e in enumerate(entradas)},
+        "plazos": {f"{int(p)} años": pd.Series(precios[i_entrada, j]) for j, p in enumerate(plazos)},
+        "sueldos": sueldo,
+        "actual": (eur(entrada_usuario), f"{int(anos_plazo)} años"),
     }
 
 
+@cacheado(CACHE_RESULTADOS)
+def figura_frontera_json(argumentos, dimension, theme):
+    """Una curva sueldo → precio máximo por entrada o por plazo; la de la situación actual, más gruesa."""
+    frontera = calcular_frontera(*argumentos)
+    actual = frontera["actual"][0 if dimension == "entradas" else 1]
+    sueldos = serie_euros(frontera["sueldos"])
+    tooltip_color = colores_tooltip(theme)[2]
+
+    fig_frontera = go.Figure(layout=dict(template=plantilla_compacta(theme)))
+    for i, (nombre, precios) in enumerate(frontera[dimension].items()):
+        fig_frontera.add_trace(go.Scatter(
+            x=sueldos, y=serie_euros(precios), name=nombre, mode='lines',
+            line=dict(color=theme['colors'][i % len(theme['colors'])], width=4 if nombre == actual else 2),
+            hovertemplate=(f"<span style='color:{tooltip_color}'><b>{nombre}</b><br>"
+                           "Sueldo %{x:,.0f} € → %{y:,.0f} €</span><extra></extra>"),
+        ))
+    fig_frontera.update_layout(
+        height=420,
+        margin=dict(l=60, r=20, t=30, b=60),
+        legend=dict(orientation='h', yanchor='bottom', y=1.0, xanchor='right', x=1.0),
+        hovermode='closest',
+        xaxis=dict(title_text="Sueldo neto mensual (€)", tickformat=',.0f'),
+        yaxis=dict(title_text="Precio máximo (€)", tickformat=',.0f'),
+    )
+    return fig_frontera.to_json()
+
+
+def tabla_sueldo_por_tramo(frontera, precio_maximo, tramos=4):
+    """Sueldo neto con el que se alcanza cada una de las siguientes bandas de precio (entrada y plazo actuales)."""
+    precios = frontera["entradas"][frontera["actual"][0]]
+    primer_tramo = (int(precio_maximo // TRAMO_PRECIO) + 1) * TRAMO_PRECIO
+    umbrales = [primer_tramo + k * TRAMO_PRECIO for k in range(tramos)]
+    sueldos = sueldo_minimo_por_precio(frontera["sueldos"], precios, umbrales)
+    return pd.DataFrame({"Precio objetivo": umbrales, "Sueldo necesario": sueldos})
+
+
+# =========================
+# Sensibilidad de la operación (modo 2)
+# =========================
+# Base + todas las variantes (±paso por entrada) se evalúan en una sola llamada vectorizada
+calcular_sensibilidad = cacheado(CACHE_RESULTADOS)(sensibilidad_vivienda)
+
+
+def texto_paso(paso, unidad):
+    """Texto del paso aplicado a cada entrada del tornado (±5 %, ±0,5 pp, ±100 €, ±5 años)."""
+    if unidad == "%":
+        return f"±{paso * 100:g} %".replace(".", ",")
+    if unidad == "pp":
+        return f"±{paso * 100:g} pp".replace(".", ",")
+    if unidad == "€":
+        return f"±{paso:,.0f} €".replace(",", ".")
+    return f"±{paso} años"
+
+
+@cacheado(CACHE_RESULTADOS)
+def figura_tornado_json(etiquetas, deltas_menos, deltas_mas, sufijo, decimales, theme):
+    """Tornado horizontal: variación de la métrica al bajar (−) y subir (+) cada entrada, serializado a JSON."""
+    df = pd.DataFrame({"Entrada": etiquetas, "menos": deltas_menos, "mas": deltas_mas})
+    # Plotly dibuja de abajo arriba: orden ascendente por amplitud = mayor efecto arriba
+    df = df.assign(amplitud=(df["mas"] - df["menos"]).abs()).sort_values("amplitud", ascending=True)
+
+    fig_tornado = go.Figure()
+    for i, (columna, nombre) in enumerate([("menos", "Entrada − paso"), ("mas", "Entrada + paso")]):
+        fig_tornado.add_trace(
+            go.Bar(
+                x=df[columna],
+                y=df["Entrada"],
+                orientation='h',
+                name=nombre,
+                marker_color=theme['colors'][i],
+                hovertemplate=f"%{{y}} · {nombre}: %{{x:+,.{decimales}f}}{sufijo}<extra></extra>"
+            )
+        )
+
+    fig_tornado.update_layout(
+        barmode='overlay',
+        height=max(360, 30 * len(df)),
+        margin=dict(l=10, r=20, t=30, b=40),
+        font=dict(size=12, color=theme['text_color']),
+        legend=dict(orientation='h', yanchor='bottom', y=1.0, xanchor='right', x=1.0),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(gridcolor=theme['grid_color'], tickformat=f'+,.{decimales}f', ticksuffix=sufijo,
+                   zeroline=True, zerolinecolor=theme['text_color'], automargin=True),
+        yaxis=dict(automargin=True),
+        template='plotly_dark' if theme['dark'] else 'plotly'
+    )
+    return fig_tornado.to_json()
+
+
+# =========================
+# Figuras del dashboard (modo 2)
+# =========================
+# Solo dependen de números ya calculados: se construyen y serializan a la vez en en_paralelo
+TRAMOS_DTI = ((0, 30), (30, 35), (35, 50))
+TRAMOS_LTV = ((0, 60), (60, 80), (80, 100))
+COLORES_TRAMOS = ('#10B981', '#F59E0B', '#EF4444')  # Verde, amarillo, rojo
+
+
+@cacheado(CACHE_RESULTADOS)
+def figura_indicador_json(titulo, valor, maximo, paso, color_barra, tramos, theme):
+    """Indicador de aguja (DTI o LTV, en %) con tramos verde/amarillo/rojo, serializado a JSON."""
+    if theme.get('dark'):
+        bg_color = 'rgba(30, 41, 59, 0.5)'
+        border_color = 'rgba(100, 116, 139, 0.5)'
+        text_color = '#F8FAFC'
+    else:
+        bg_color = 'rgba(255, 255, 255, 0.7)'
+        border_color = 'rgba(203, 213, 225, 0.8)'
+        text_color = '#1E293B'
+
+    fig_indicador = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=valor,
+        domain={'x': [0, 1], 'y': [0, 1]},
+        title={'text': titulo, 'font': {'size': 16, 'color': text_color}},
+        gauge={
+            'axis': {
+                'range': [None, maximo],
+                'tickwidth': 1,
+                'tickcolor': text_color,
+                'tickfont': {'color': text_color, 'size': 10},
+                'tickformat': '.0f%',
+                'tick0': 0,
+                'dtick': paso
+            },
+            'bar': {'color': color_barra},
+            'bgcolor': bg_color,
+            'borderwidth': 1,
+            'bordercolor': border_color,
+            'steps': [{'range': list(tramo), 'color': color} for tramo, color in zip(tramos, COLORES_TRAMOS)],
+            'threshold': {
+                'line': {'color': "red", 'width': 4},
+                'thickness': 0.75,
+                'value': valor
+            }
+        },
+        number={'suffix': "%", 'font': {'size': 28, 'color': text_color}, 'valueformat': '.1f'}
+    ))
+    fig_indicador.update_layout(
+        margin=dict(l=10, r=10, t=30, b=10),
+        height=280,
+        autosize=True,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color=text_color, size=12)
+    )
+    return fig_indicador.to_json()
+
+
+def partidas_coste(precio, impuestos_total, gastos_formalizacion_total, com_apertura_val, com_incluida_en_gastos,
+                   intereses_totales):
+    """(importes, etiquetas) de cada partida del coste total que sea mayor que 0, en el orden del donut."""
+    datos_costes = []
+    etiquetas_costes = []
+
+    # Precio de la vivienda
+    if precio > 0:
+        datos_costes.append(precio)
+        etiquetas_costes.append(f"🏠 Precio vivienda<br>{eur(precio)}")
+
+    # Impuestos
+    if impuestos_total > 0:
+        datos_costes.append(impuestos_total)
+        etiquetas_costes.append(f"🧾 Impuestos<br>{eur(impuestos_total)}")
+
+    # Gastos de formalización
+    if gastos_formalizacion_total > 0:
+        datos_costes.append(gastos_formalizacion_total)
+        etiquetas_costes.append(f"📋 Gastos formalización<br>{eur(gastos_formalizacion_total)}")
+
+    # Comisión de apertura (si no está financiada)
+    if com_apertura_val > 0 and com_incluida_en_gastos:
+        datos_costes.append(com_apertura_val)
+        etiquetas_costes.append(f"🏦 Comisión apertura<br>{eur(com_apertura_val)}")
+
+    # Intereses totales
+    if intereses_totales > 0:
+        datos_costes.append(intereses_totales)
+        etiquetas_costes.append(f"💸 Intereses totales<br>{eur(intereses_totales)}")
+    return datos_costes, etiquetas_costes
+
+
+@cacheado(CACHE_RESULTADOS)
+def figura_costes_json(datos_costes, etiquetas_costes, coste_total, theme):
+    """Donut de la distribución del coste total, serializado a JSON y compartido entre sesiones."""
+    # Colores del tooltip según el tema
+    if theme.get('dark'):
+        hover_bg = 'rgba(15, 23, 42, 0.98)'  # Fondo oscuro
+        hover_text_color = '#FFFFFF'  # Texto blanco
+    else:
+        hover_bg = color_with_alpha(theme.get('secondary_bg', '#FFFFFF'), 0.98)
+        hover_text_color = theme.get('text_color', '#1A1A1A')
+    text_size = 12  # Tamaño de fuente más pequeño para móviles
+
+    donut_colors = [theme['colors'][i % len(theme['colors'])] for i in range(len(datos_costes))]
+    # Crear gráfico donut con mejor visibilidad
+    fig_costes = go.Figure(data=[go.Pie(
+        labels=etiquetas_costes,
+        values=datos_costes,
+        hole=0.4,
+        marker=dict(colors=donut_colors),
+        textinfo='percent+label',  # Mostrar porcentaje y etiqueta
+        textposition='outside',
+        texttemplate='<b>%{percent:.1%}</b>',  # Porcentaje en negrita
+        insidetextorientation='radial',
+        textfont=dict(
+            color=theme['text_color'],
+            size=text_size,  # Usar tamaño de fuente responsive
+            family='Arial, sans-serif'
+        ),
+        hovertemplate=(
+            f'<b style="color:{hover_text_color}">%{{label}}</b><br>'
+            f'<span style="color:{hover_text_color}">Importe: %{{value:,.2f}} €</span><br>'
+            f'<span style="color:{hover_text_color}">Porcentaje: %{{percent:.1%}}</span><extra></extra>'
+        ),
+        pull=[0.02] * len(datos_costes),  # Separación uniforme para todas las secciones
+        outsidetextfont=dict(
+            color=theme['text_color'],
+            size=text_size,  # Usar tamaño de fuente responsive
+            family='Arial, sans-serif'
+        ),
+        direction='clockwise',
+        sort=False
+    )])
+
+    fig_costes.update_layout(
+        title={
+            'text': "<b>Distribución del Coste Total</b>",
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {
+                'color': theme.get('title_color', theme['text_color']),
+                'family': 'Arial, sans-serif',
+                'size': 18
+            },
+            'y': 0.99
+        },
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=10, r=10, t=60, b=20),  # Márgenes optimizados para móviles
+        uniformtext_minsize=12,  # Tamaño mínimo de texto más grande
+        uniformtext_mode='hide',  # Ocultar textos que no quepan
+        font=dict(size=14, color=theme['text_color']),
+        # Configuración de la leyenda (fuera de la pantalla)
+        legend=dict(
+            orientation="v",
+            yanchor="top",
+            y=1.5,  # Mover la leyenda fuera de la pantalla
+            xanchor="left",
+            x=1.05,
+            bgcolor='rgba(0,0,0,0)',
+            bordercolor='rgba(0,0,0,0)',
+            borderwidth=0,
+            font=dict(
+                color='rgba(0,0,0,0)',
+                family='Arial, sans-serif',
+                size=1  # Tamaño mínimo permitido
+            ),
+            itemclick=False,
+            itemdoubleclick=False,
+            traceorder='normal',
+            itemsizing='constant'
+        ),
+        annotations=[
+            dict(
+                x=0.5,
+                y=1.0,
+                xref='paper',
+                yref='paper',
+                text=eur(coste_total),
+                showarrow=False,
+                font=dict(
+                    size=14,
+                    color='#F0F0F0' if theme['dark'] else theme.get('subtitle_color', theme['text_color']),
+                    family='Arial, sans-serif, Segoe UI'
+                ),
+                xanchor='center',
+                yanchor='bottom',
+                yshift=4,
+                opacity=0.95
+            )
+        ],
+        hoverlabel=dict(
+            bgcolor='rgba(15, 23, 42, 0.95)' if theme['dark'] else hover_bg,
+            bordercolor='rgba(100, 116, 139, 0.5)',
+            font=dict(
+                color='#FFFFFF' if theme['dark'] else hover_text_color, 
+                size=12, 
+                family="sans-serif"
+            ),
+            align="left"
+        ),
+        height=600,
+        showlegend=False  # Desactivar la leyenda nativa
+    )  # Cierre de update_layout
+
+    # Configuración para el gráfico responsive
+    fig_costes.update_layout(
+        autosize=True,
+        margin=dict(
+            l=20,  # Reducir margen izquierdo
+            r=20,  # Reducir margen derecho
+            t=60,  # Reducir margen superior
+            b=20,  # Reducir margen inferior
+            pad=5  # Padding pequeño
+        ),
+        height=400,  # Altura fija más pequeña para móviles
+        font=dict(size=12)  # Tamaño de fuente base para mejor legibilidad
+    )
+    return fig_costes.to_json()
+
+
+# =========================
+# Fragmentos interactivos (modo 2)
+# =========================
+@cacheado(CACHE_RESULTADOS)
+def calcular_resultado_vivienda(*args, **kwargs):
+    """Resultado completo del modo 2 (ResultadoVivienda, inmutable), compartido entre sesiones con las mismas entradas."""
+    return resultado_vivienda(*args, **kwargs)
+
+
+@cacheado(CACHE_RESULTADOS)
+def calcular_evolucion_anual(capital_hipoteca, interes_anual, anos_plazo, cuota_mensual):
+    """Evolución anual del préstamo (Fija/Variable) para los gráficos de capital e intereses."""
+    return pd.DataFrame(evolucion_anual_rapida(capital_hipoteca, interes_anual, anos_plazo, cuota_mensual))
+
+
+def precalcular_modo_vivienda(argumentos_backtest, argumentos_sensibilidad, theme):
+    """
+    Lanza en segundo plano el backtest del Euríbor y el análisis de sensibilidad de las entradas actuales:
+    la página los pide después del dashboard, así que se calculan mientras se pinta lo de arriba (las figuras
+    del dashboard, evolución incluida, ya van en paralelo con en_paralelo). Si las entradas cambian, la tanda
+    anterior se cancela.
+    """
+    tareas = []
+    if argumentos_backtest is not None:
+        tareas.append(lambda: figura_backtest_json(argumentos_backtest, theme))
+    if argumentos_sensibilidad is not None:
+        posicionales, nombrados = argumentos_sensibilidad
+        tareas.append(lambda: calcular_sensibilidad(*posicionales, **nombrados))
+    clave = (argumentos_backtest, argumentos_sensibilidad, theme)
+    st.session_state["_precalculo"] = PRECALCULO.renovar(st.session_state.get("_precalculo"), clave, tareas)
+
+
+@st.fragment
+def fragmento_amortizacion_anticipada(capital_hipoteca, cuota_estimada, interes_anual, anos_plazo, sin_hipoteca, tipo_hipoteca):
+    """Simulación de amortización anticipada. Sus widgets solo re-ejecutan este fragmento, no el modo completo."""
+    simular_amortizacion = st.checkbox("Activar simulación de amortización anticipada", value=False)
+
+    if simular_amortizacion:
+        if sin_hipoteca:
+            st.info("ℹ️ No aplica amortización anticipada: no hay hipoteca.")
+        elif tipo_hipoteca == "Mixta":
+            st.warning("⚠️ La simulación solo está disponible para hipotecas Fijas o Variables.")
+        elif cuota_estimada <= 0 or capital_hipoteca <= 0:
+            st.warning("⚠️ No se puede simular: faltan parámetros válidos.")
+        else:
+            anio_extra = st.number_input("Año de amortización anticipada", min_value=1, max_value=anos_plazo, value=5, step=1)
+            pago_extra = st.number_input("Cantidad del pago extra (€)", min_value=0.0, step=1000.0, value=5000.0)
+            mantener_cuota = st.radio("¿Qué prefieres tras amortizar?", ["Reducir plazo", "Reducir cuota"], index=0)
+
+            n_total = anos_plazo * 12
+            n_transcurridos = anio_extra * 12
+            r_mensual = interes_anual / 12 if interes_anual else 0.0
+
+            # Tipo y plazo de la rejilla precalculada: el saldo es una consulta a la tabla
+            capital_pendiente = (
+                TABLAS_AMORTIZACION.saldo(capital_hipoteca, interes_anual, anos_plazo, n_transcurridos)
+                if cuota_estimada > 0 else None
+            )
+            if capital_pendiente is None and r_mensual > 0 and cuota_estimada > 0:
+                capital_pendiente = capital_hipoteca * (
+                    ((1 + r_mensual) ** n_total - (1 + r_mensual) ** n_transcurridos)
+                    / ((1 + r_mensual) ** n_total - 1)
+                )
+            elif capital_pendiente is None:
+                capital_pendiente = capital_hipoteca * (1 - n_transcurridos / n_total)
+
+            nuevo_capital = max(0.0, capital_pendiente - pago_extra)
+
+            if mantener_cuota == "Reducir plazo":
+                import math
+                if r_mensual > 0 and cuota_estimada > 0:
+                    denominador_log = cuota_estimada - nuevo_capital * r_mensual
+                    if denominador_log <= 0 or (1 + r_mensual) <= 0:
+                        nuevo_plazo_meses = 0
+                    else:
+                        nuevo_plazo_meses = math.log(
+                            cuota_estimada / denominador_log
+                        ) / math.log(1 + r_mensual)
+                    nuevo_plazo_anios = max(0, nuevo_plazo_meses / 12)
+                else:
+                    nuevo_plazo_anios = 0
+                st.info(
+                    f"📉 Con amortización anticipada de {eur(pago_extra)} en el año {anio_extra}, "
+                    f"reduces el plazo a **{nuevo_plazo_anios:.1f} años** manteniendo la misma cuota."
+                )
+            else:
+                nuevo_plazo_restante = max(1, anos_plazo - anio_extra)
+                nueva_cuota = cuota_prestamo(nuevo_capital, interes_anual, nuevo_plazo_restante) or 0.0
+                st.info(
+                    f"📉 Con amortización anticipada de {eur(pago_extra)} en el año {anio_extra}, "
+                    f"tu nueva cuota sería de **{eur(nueva_cuota)}** manteniendo el plazo original."
+                )
+
+
+@cacheado(CACHE_RESULTADOS)
+def figura_evolucion_json(capital_hipoteca, interes_anual, anos_plazo, cuota_estimada, theme):
+    """Figura de evolución del capital pendiente, serializada a JSON y compartida entre sesiones."""
+    df_evolucion = calcular_evolucion_anual(capital_hipoteca, interes_anual, anos_plazo, cuota_estimada)
+    color = theme['colors'][0]
+    tooltip_color = colores_tooltip(theme)[2]
+
+    fig_capital = go.Figure(
+        go.Scatter(
+            x=serie_anios(df_evolucion["Año"]),
+            y=serie_euros(df_evolucion["Capital Pendiente"]),
+            fill='tozeroy',
+            mode='lines+markers',
+            name='Capital Pendiente',
+            line=dict(color=color, width=3),
+            fillcolor=color_with_alpha(color, 0.3),
+            hovertemplate=(
+                f"<b style='color:{tooltip_color}'>Año %{{x}}</b><br>"
+                f"<span style='color:{tooltip_color}'>Capital pendiente: %{{y:,.0f}} €</span><extra></extra>"
+            )
+        ),
+        # La plantilla va en el constructor: si no, Plotly aplica la predeterminada completa y después la fusiona
+        layout=dict(template=plantilla_compacta(theme)),
+    )
+    fig_capital.update_layout(
+        title_text="<b>Evolución del Capital Pendiente</b>",
+        annotations=[dict(text=f"Plazo: {anos_plazo} años | Capital inicial: {eur(capital_hipoteca)}")],
+        height=540,
+        margin=dict(l=80, r=80, t=90, b=80),
+        showlegend=False,
+        xaxis_title_text="Año",
+        yaxis=dict(title_text="Capital Pendiente (€)", tickformat=',.0f', tickprefix='€'),
+    )
+    return fig_capital.to_json()
+
+
+@cacheado(CACHE_RESULTADOS)
+def figura_pagos_json(capital_hipoteca, interes_anual, anos_plazo, cuota_estimada, theme):
+    """Figura de distribución anual de pagos, serializada a JSON y compartida entre sesiones."""
+    df_evolucion = calcular_evolucion_anual(capital_hipoteca, interes_anual, anos_plazo, cuota_estimada)
+    tooltip_color = colores_tooltip(theme)[2]
+    anios = serie_anios(df_evolucion["Año"])
+
+    # El tooltip es común a las dos series: va una sola vez en la plantilla (usa el nombre de cada traza)
+    plantilla = plantilla_compacta(theme)
+    plantilla['data']['bar'][0]['hovertemplate'] = (
+        f"<span style='color:{tooltip_color};'><b>Año %{{x}}</b><br>"
+        "%{data.name}: %{y:,.0f} €</span><extra></extra>"
+    )
+    fig_pagos = go.Figure([
+        go.Bar(x=anios, y=serie_euros(df_evolucion["Capital Anual"]),
+               name='Capital Amortizado', marker_color=theme['colors'][2]),
+        go.Bar(x=anios, y=serie_euros(df_evolucion["Intereses Anuales"]),
+               name='Intereses Pagados', marker_color=theme['colors'][3]),
+    ], layout=dict(template=plantilla))
+    fig_pagos.update_layout(
+        title_text="<b>Distribución Anual de Pagos</b>",
+        annotations=[dict(text="Capital vs Intereses por año")],
+        height=520,
+        barmode='stack',
+        margin=dict(l=80, r=80, t=100, b=160),
+        legend=dict(
+            orientation="h", yanchor="top", y=-0.22, xanchor="center", x=0.5,
+            bgcolor='rgba(0,0,0,0)', font=dict(color=theme['text_color'], size=12)
+        ),
+        hovermode='x unified',
+        xaxis_title_text="Año",
+        yaxis_title_text="Pago Anual (€)",
+    )
+    return fig_pagos.to_json()
+
+
+CONFIG_GRAFICOS_EVOLUCION = {
+    'displayModeBar': True,
+    'responsive': True,
+    'displaylogo': False,
+    'modeBarButtonsToRemove': ['select2d', 'lasso2d', 'select'],
+}
+
+
+@st.fragment
+def fragmento_evolucion_capital(capital_hipoteca, interes_anual, anos_plazo, cuota_estimada):
+    """Tabs de evolución del capital y distribución de pagos, re-ejecutables de forma aislada."""
+    # =========================
+    # Sistema de Tabs para Evolución del Capital
+    # =========================
+    tab1, tab2 = st.tabs(["📈 Evolución del Capital", "💰 Distribución de Pagos"])
+
+    with tab1:
+        # Obtener configuración de tema
+        theme = get_chart_theme()
+        mostrar_grafico(
+            "Evolución del capital",
+            figura_evolucion_json(capital_hipoteca, interes_anual, anos_plazo, cuota_estimada, theme),
+            CONFIG_GRAFICOS_EVOLUCION,
+        )
+
+        st.markdown("""
+        **📊 ¿Qué muestra este gráfico?**
+        - La línea azul representa tu deuda restante cada año
+        - El área sombreada muestra la magnitud de la deuda
+        - Al final del plazo, la deuda llega a cero
+
+        **💡 Información clave:**
+        - Los primeros años se reduce más lentamente (pagas más intereses)
+        - Los últimos años se reduce más rápido (pagas más capital)
+        """)
+
+    with tab2:
+        theme = get_chart_theme()
+        mostrar_grafico(
+            "Distribución de pagos",
+            figura_pagos_json(capital_hipoteca, interes_anual, anos_plazo, cuota_estimada, theme),
+            CONFIG_GRAFICOS_EVOLUCION,
+        )
+
+        st.markdown("""
+        **📊 ¿Qué muestra este gráfico?**
+        - **Barras verdes:** Capital que reduces de tu deuda (dinero "tuyo")
+        - **Barras rojas:** Intereses que pagas al banco (coste financiero)
+        - La altura total es tu cuota anual
+
+        **💡 Información clave:**
+        - Al principio: barras rojas más grandes (pagas más intereses)
+        - Al final: barras verdes más grandes (pagas más capital)
+        - Esta es la razón por la que las amortizaciones anticipadas son más efectivas al principio
+        """)
+
+
+
+
+# =========================
+# Backtest con el Euríbor histórico (modo 2, Variable y Mixta)
+# =========================
+@cacheado(CACHE_RESULTADOS)
+def calcular_backtest_euribor(capital_hipoteca, anos_plazo, diferencial, sueldo_neto, deudas_mensuales,
+                              tipo_hipoteca, interes_fijo, anios_fijo, meses_revision, suelo, techo):
+    """La misma hipoteca firmada en cada mes de la serie histórica (una sola pasada vectorizada)."""
+    r = backtest_euribor_lote(
+        capital_hipoteca, anos_plazo, diferencial, VALORES_EURIBOR, sueldo_neto, deudas_mensuales,
+        tipo_hipoteca=tipo_hipoteca, interes_fijo=interes_fijo, anios_fijo=anios_fijo or 0,
+        meses_revision=meses_revision, suelo=suelo, techo=techo,
+    )
+    resumen = pd.DataFrame({
+        "Inicio": MESES_EURIBOR,
+        "Cuota inicial": r["cuota_inicial"],
+        "Cuota máxima": r["cuota_pico"],
+        "DTI máximo": r["dti_pico"],
+        "Intereses totales": r["intereses_totales"],
+        "Meses observados": r["meses_observados"],
+    })
+    return {"resumen": resumen, "cuotas": r["cuotas"]}
+
+
+@cacheado(CACHE_RESULTADOS)
+def figura_backtest_json(argumentos, theme):
+    """Cuota inicial y máxima según el mes de firma; el tooltip de la máxima añade el DTI y los intereses totales."""
+    resumen = calcular_backtest_euribor(*argumentos)["resumen"]
+    tooltip_color = colores_tooltip(theme)[2]
+    # float32: el DTI con un decimal y los intereses al euro caben sin pérdida y ocupan la mitad
+    detalle = pd.DataFrame({
+        "dti": (resumen["DTI máximo"] * 100).round(1),
+        "intereses": resumen["Intereses totales"].round(),
+    }).to_numpy(dtype='float32')
+
+    encabezado = f"<span style='color:{tooltip_color}'><b>Firma %{{x|%m/%Y}}</b><br>"
+    fig_backtest = go.Figure([
+        go.Scatter(
+            x=resumen["Inicio"], y=serie_euros(resumen["Cuota inicial"]), name="Cuota inicial", mode='lines',
+            line=dict(color=theme['colors'][0], width=2),
+            hovertemplate=encabezado + "Cuota inicial: %{y:,.0f} €</span><extra></extra>",
+        ),
+        go.Scatter(
+            x=resumen["Inicio"], y=serie_euros(resumen["Cuota máxima"]), name="Cuota máxima", mode='lines',
+            line=dict(color=theme['colors'][1], width=2), customdata=detalle,
+            hovertemplate=(
+                encabezado + "Cuota máxima: %{y:,.0f} €<br>DTI máximo: %{customdata[0]:.1f} %<br>"
+                "Intereses totales: %{customdata[1]:,.0f} €</span><extra></extra>"
+            ),
+        ),
+    ], layout=dict(template=plantilla_compacta(theme)))
+    fig_backtest.update_layout(
+        height=420,
+        margin=dict(l=60, r=20, t=30, b=60),
+        legend=dict(orientation='h', yanchor='bottom', y=1.0, xanchor='right', x=1.0),
+        hovermode='closest',
+        xaxis_title_text="Mes de firma",
+        yaxis=dict(title_text="Cuota mensual (€)", tickformat=',.0f'),
+    )
+    return fig_backtest.to_json()
+
+
+@cacheado(CACHE_RESULTADOS)
+def figura_trayectoria_cuota_json(argumentos, inicio, theme):
+    """Cuota de cada año del préstamo firmado en `inicio` (los años sin datos repiten el último Euríbor)."""
+    backtest = calcular_backtest_euribor(*argumentos)
+    fila = int(backtest["resumen"].index[backtest["resumen"]["Inicio"] == inicio][0])
+    cuotas = pd.Series(backtest["cuotas"][fila])
+    observados = -(-int(backtest["resumen"]["Meses observados"][fila]) // 12)
+    tooltip_color = colores_tooltip(theme)[2]
+
+    plantilla = plantilla_compacta(theme)
+    plantilla['data']['bar'][0]['hovertemplate'] = (
+        f"<span style='color:{tooltip_color}'><b>Año %{{x}}</b><br>Cuota: %{{y:,.0f}} €</span><extra></extra>"
+    )
+    colores = [theme['colors'][0] if anio < observados else color_with_alpha(theme['colors'][0], 0.35)
+               for anio in range(len(cuotas))]
+    fig_trayectoria = go.Figure(
+        go.Bar(x=serie_anios(pd.Series(range(1, len(cuotas) + 1))), y=serie_euros(cuotas), marker_color=colores),
+        layout=dict(template=plantilla),
+    )
+    fig_trayectoria.update_layout(
+        height=320,
+        margin=dict(l=60, r=20, t=20, b=50),
+        showlegend=False,
+        xaxis_title_text="Año del préstamo",
+        yaxis=dict(title_text="Cuota mensual (€)", tickformat=',.0f'),
+    )
+    return fig_trayectoria.to_json()
+
+
+@st.fragment
+def fragmento_backtest_euribor(argumentos):
+    """Trayectoria de la cuota para un mes de firma concreto; el selector solo re-ejecuta este fragmento."""
+    resumen = calcular_backtest_euribor(*argumentos)["resumen"]
+    peor = resumen.loc[resumen["Cuota máxima"].idxmax()]
+    inicio = st.select_slider(
+        "Mes de firma", options=list(MESES_EURIBOR), value=peor["Inicio"], key="backtest_inicio",
+        help="Elige cuándo se habría firmado la hipoteca para ver cómo habría cambiado la cuota cada año."
+    )
+    fila = resumen.loc[resumen["Inicio"] == inicio].iloc[0]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Cuota inicial", eur(fila["Cuota inicial"]))
+    col2.metric("Cuota máxima", eur(fila["Cuota máxima"]),
+                delta=f"{fila['Cuota máxima'] / fila['Cuota inicial'] - 1:+.1%}" if fila["Cuota inicial"] else None,
+                delta_color="inverse")
+    col3.metric("Intereses totales", eur(fila["Intereses totales"]))
+    mostrar_grafico("Trayectoria de la cuota", figura_trayectoria_cuota_json(argumentos, inicio, get_chart_theme()))
+    if fila["Meses observados"] < argumentos[1] * 12:
+        st.caption("Las barras claras son años posteriores al último dato de la serie: repiten el último Euríbor conocido.")
 
 
 # =========================
@@ -1226,44 +1882,12 @@ if modo == "🔎 Descubrir mi precio máximo":
         # --- Cálculo de cuota máxima ---
         cuota_max = cuota_maxima(sueldo_neto, deudas_mensuales, ratio=ratio_dti)
 
-        # --- Búsqueda binaria del precio máximo viable ---
-        low, high = 0.0, 2_000_000.0
-        precio_maximo = 0.0
-        for _ in range(50):
-            mid = (low + high) / 2
-
-            r_mid = calcular_capital_y_gastos(
-                mid, entrada_usuario, params,
-                ltv_max=ltv_max, financiar_comision=financiar_comision
-            )
-            capital_mid = r_mid["capital_final"]
-            ltv_ok = r_mid["ltv_ok"]
-            entrada_ok = entrada_usuario >= r_mid["gastos_puros"]
-
-            # Cuota según tipo de hipoteca
-            if tipo_hipoteca in ["Fija", "Variable"] and interes_anual:
-                cuota_mid = cuota_prestamo(capital_mid, interes_anual, anos_plazo) or 0.0
-                dti_mid = dti(cuota_mid, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
-
-            elif tipo_hipoteca == "Mixta" and (interes_fijo is not None) and (euribor is not None) and (diferencial is not None):
-                interes_variable_mid = euribor + diferencial
-                cuota_mid_fijo = cuota_prestamo(capital_mid, interes_fijo, anos_plazo) or 0.0
-                cuota_mid_var  = cuota_prestamo(capital_mid, interes_variable_mid, anos_plazo) or 0.0
-                cuota_mid = max(cuota_mid_fijo, cuota_mid_var)
-                dti_mid = dti(cuota_mid, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
-
-            else:
-                cuota_mid = 0.0
-                dti_mid = 0.0
-
-            cuota_ok = cuota_mid <= cuota_max
-            dti_ok = dti_visible(dti_mid) <= DTI_FAIL
-
-            if entrada_ok and ltv_ok and dti_ok and cuota_ok:
-                precio_maximo = mid
-                low = mid
-            else:
-                high = mid
+        # --- Búsqueda binaria del precio máximo viable (cacheada por entradas) ---
+        precio_maximo = calcular_precio_maximo(
+            entrada_usuario, sueldo_neto, deudas_mensuales, cuota_max, params, ltv_max, financiar_comision,
+            tipo_hipoteca, interes_anual, anos_plazo,
+            interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+        )
         # --- Resultado final ---
         rf = calcular_capital_y_gastos(
             precio_maximo, entrada_usuario, params,
@@ -1273,9 +1897,6 @@ if modo == "🔎 Descubrir mi precio máximo":
         ltv_val = rf["ltv"]
         gastos_puros = rf["gastos_puros"]
 
-        # Guardamos en sesión
-        st.session_state["precio_max_modo1"] = precio_maximo
-
         
         
         # =========================
@@ -1315,50 +1936,88 @@ if modo == "🔎 Descubrir mi precio máximo":
         st.subheader("📊 Escenarios de interés (2%–5%)")
         st.caption("Simulación de la cuota mensual en distintos escenarios de tipo de interés, validando LTV + DTI.")
 
-        if tipo_hipoteca == "Fija":
-            for interes_pct in ESCENARIOS_INTERES_PCT:
-                interes_decimal = interes_pct / 100
-                cuota_esc = cuota_prestamo(capital_hipoteca, interes_decimal, anos_plazo) or 0.0
-                dti_esc = dti(cuota_esc, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
-                if es_viable(cuota_esc, cuota_max, ltv_val, ltv_max, dti_esc):
-                    st.success(f"✅ {pct(interes_decimal)} → cuota {eur(cuota_esc)} | DTI {semaforo_dti(dti_esc)}")
-                else:
-                    st.error(f"❌ {pct(interes_decimal)} → cuota {eur(cuota_esc)} | DTI {semaforo_dti(dti_esc)}")
-
-        elif tipo_hipoteca == "Variable":
-            for interes_pct in ESCENARIOS_INTERES_PCT:
-                interes_decimal = interes_pct / 100
-                cuota_esc = cuota_prestamo(capital_hipoteca, interes_decimal, anos_plazo) or 0.0
-                dti_esc = dti(cuota_esc, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
-                if es_viable(cuota_esc, cuota_max, ltv_val, ltv_max, dti_esc):
-                    st.success(f"✅ {pct(interes_decimal)} → cuota {eur(cuota_esc)} | DTI {semaforo_dti(dti_esc)}")
-                else:
-                    st.error(f"❌ {pct(interes_decimal)} → cuota {eur(cuota_esc)} | DTI {semaforo_dti(dti_esc)}")
-
-        elif tipo_hipoteca == "Mixta":
-            for interes_pct in ESCENARIOS_INTERES_PCT:
-                interes_var_esc = interes_pct / 100
-                interes_variable_esc = interes_var_esc + diferencial
-                cuota_fijo_esc = cuota_prestamo(capital_hipoteca, interes_fijo, anos_plazo) or 0.0
-                cuota_var_esc  = cuota_prestamo(capital_hipoteca, interes_variable_esc, anos_plazo) or 0.0
-                cuota_peor_esc = max(cuota_fijo_esc, cuota_var_esc)
-                dti_peor_esc = dti(cuota_peor_esc, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
-                tramo_peor = "FIJO" if cuota_fijo_esc >= cuota_var_esc else "VARIABLE"
-                if es_viable(cuota_peor_esc, cuota_max, ltv_val, ltv_max, dti_peor_esc):
-                    st.success(
-                        f"✅ fijo {pct(interes_fijo)} / var {pct(interes_variable_esc)} → peor tramo {tramo_peor}: "
-                        f"cuota {eur(cuota_peor_esc)} | DTI {semaforo_dti(dti_peor_esc)}"
-                    )
-                else:
-                    st.error(
-                        f"❌ fijo {pct(interes_fijo)} / var {pct(interes_variable_esc)} → peor tramo {tramo_peor}: "
-                        f"cuota {eur(cuota_peor_esc)} | DTI {semaforo_dti(dti_peor_esc)}"
-                    )
+        escenarios = escenarios_interes(
+            capital_hipoteca, anos_plazo, ESCENARIOS_INTERES_PCT, cuota_max, ltv_val, ltv_max,
+            sueldo_neto, deudas_mensuales, tipo_hipoteca, interes_fijo=interes_fijo, diferencial=diferencial
+        )
+        for esc in escenarios:
+            icono, mostrar = ("✅", st.success) if esc["viable"] else ("❌", st.error)
+            if tipo_hipoteca == "Mixta":
+                mostrar(
+                    f"{icono} fijo {pct(interes_fijo)} / var {pct(esc['interes_variable'])} → peor tramo {esc['tramo_peor']}: "
+                    f"cuota {eur(esc['cuota'])} | DTI {semaforo_dti(esc['dti'])}"
+                )
+            else:
+                mostrar(f"{icono} {pct(esc['interes'])} → cuota {eur(esc['cuota'])} | DTI {semaforo_dti(esc['dti'])}")
 
+        if tipo_hipoteca == "Mixta":
             st.caption("En Mixta se valida siempre el tramo más exigente (peor escenario).")
 
         st.caption("DTI = (Cuota hipoteca + otras deudas) / Ingresos netos")
 
+        # =========================
+        # 🗺️ Precio máximo por comunidad autónoma
+        # =========================
+        st.subheader("🗺️ Precio máximo por comunidad autónoma")
+        st.caption(
+            "Mismos ingresos, entrada e hipoteca en todas las comunidades: solo cambian los impuestos de compra "
+            "(obra nueva y segunda mano)."
+        )
+        if usar_manual:
+            st.caption("ℹ️ Tienes los impuestos en modo manual: esta comparativa usa la tabla fiscal de cada comunidad.")
+
+        df_regiones = calcular_precio_maximo_por_region(
+            entrada_usuario, sueldo_neto, deudas_mensuales, cuota_max, params, ltv_max, financiar_comision,
+            tipo_hipoteca, interes_anual, anos_plazo,
+            interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial, perfil=perfil_fiscal
+        )
+        mostrar_grafico("Precio máximo por comunidad", figura_regiones_json(
+            tuple(df_regiones["Comunidad"]), tuple(df_regiones["Nuevo"]), tuple(df_regiones["Segunda mano"]),
+            ccaa, estado_vivienda, get_chart_theme()
+        ))
+
+        with st.expander("📋 Ver tabla por comunidad"):
+            precio_referencia = df_regiones.loc[df_regiones["Comunidad"] == ccaa, estado_vivienda].iloc[0]
+            df_tabla = df_regiones.sort_values(estado_vivienda, ascending=False).reset_index(drop=True)
+            df_tabla[f"Diferencia vs {ccaa}"] = (df_tabla[estado_vivienda] - precio_referencia).map(eur)
+            df_tabla["Nuevo"] = df_tabla["Nuevo"].map(eur)
+            df_tabla["Segunda mano"] = df_tabla["Segunda mano"].map(eur)
+            st.dataframe(df_tabla, hide_index=True, width="stretch")
+
+        # =========================
+        # 📈 Frontera de asequibilidad
+        # =========================
+        st.subheader("📈 Frontera de asequibilidad")
+        st.caption(
+            "Precio máximo según el sueldo neto, del 50 % al 200 % del actual, con el resto de datos iguales. "
+            "Cuando la curva se aplana, el límite ya no son los ingresos sino la entrada (gastos y LTV)."
+        )
+        argumentos_frontera = (sueldo_neto, entrada_usuario, anos_plazo, deudas_mensuales, ratio_dti, params, ltv_max,
+                               financiar_comision, tipo_hipoteca, interes_anual, interes_fijo, euribor, diferencial)
+        tab_entrada, tab_plazo = st.tabs(["Según la entrada", "Según el plazo"])
+        with tab_entrada:
+            mostrar_grafico("Frontera por entrada", figura_frontera_json(argumentos_frontera, "entradas", get_chart_theme()))
+        with tab_plazo:
+            mostrar_grafico("Frontera por plazo", figura_frontera_json(argumentos_frontera, "plazos", get_chart_theme()))
+
+        if precio_maximo > 0:
+            tramos = tabla_sueldo_por_tramo(calcular_frontera(*argumentos_frontera), precio_maximo)
+            tramos = tramos[tramos["Sueldo necesario"].notna()]
+            if tramos.empty:
+                st.info(
+                    "ℹ️ Con tu entrada actual el precio ya está limitado por la entrada (gastos de compra y LTV): "
+                    "más ingresos no lo suben. La pestaña «Según la entrada» muestra cuánto lo haría una entrada mayor."
+                )
+            else:
+                st.markdown("**Ingresos necesarios para los siguientes tramos de precio** (entrada y plazo actuales)")
+                st.dataframe(pd.DataFrame({
+                    "Precio objetivo": tramos["Precio objetivo"].map(eur),
+                    "Sueldo neto necesario": tramos["Sueldo necesario"].map(eur),
+                    "Sueldo extra": (tramos["Sueldo necesario"] - sueldo_neto).map(lambda v: f"+{eur(v)}"),
+                }), hide_index=True, width="stretch")
+                st.caption(f"Sueldos aproximados a la resolución de la curva ({FRONTERA_PUNTOS} puntos); "
+                           "los tramos que no se alcanzan con esta entrada no aparecen.")
+
 
 
 
@@ -1412,47 +2071,48 @@ elif modo == "🏠 Comprobar una vivienda concreta":
     elif entrada_usuario <= 0:
         st.error("⚠️ Debes introducir una entrada aportada mayor que 0.")
     else:
-        # --- Cálculo de capital y gastos (usa tu función existente) ---
-        r = calcular_capital_y_gastos(
-            precio,
-            entrada_usuario,
-            params,
-            ltv_max=ltv_max,
-            financiar_comision=financiar_comision
+        # --- Evaluación de la operación (motor compartido con las herramientas de validación) ---
+        # Un único resultado inmutable por estado de entrada: todas las secciones leen de aquí
+        resultado = calcular_resultado_vivienda(
+            precio, entrada_usuario, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+            tipo_hipoteca, interes_anual, anos_plazo,
+            interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial, anios_fijo=anios_fijo
         )
 
-        gastos_puros = r["gastos_puros"]                # impuestos + trámites
-        diferencia_entrada = r["diferencia_entrada"]    # entrada - gastos_puros (puede ser negativa)
-        excedente = r["excedente"]                      # sobrante aplicado al precio o préstamo
-        capital_hipoteca = r["capital_final"]           # capital a financiar tras aplicar excedente
-        ltv_val = r["ltv"]                              # capital_final/precio
-        ltv_ok = r.get("ltv_ok", True)
-
-        cuota_max = cuota_maxima(sueldo_neto, deudas_mensuales, ratio=ratio_dti)
+        gastos_puros = resultado.gastos_puros                # impuestos + trámites
+        diferencia_entrada = resultado.diferencia_entrada    # entrada - gastos_puros (puede ser negativa)
+        excedente = resultado.excedente                      # sobrante aplicado al precio o préstamo
+        capital_hipoteca = resultado.capital_final           # capital a financiar tras aplicar excedente
+        ltv_val = resultado.ltv                              # capital_final/precio
+        ltv_ok = resultado.ltv_ok
+        cuota_max = resultado.cuota_max
+        sin_hipoteca = resultado.sin_hipoteca                # compra al contado si capital=0
+        cuota_estimada = resultado.cuota                     # en Mixta, la del peor tramo
+        tramo_peor = resultado.tramo_peor
+        dti_val = resultado.dti                              # solo tiene sentido si hay hipoteca y sueldo > 0
+
+        hay_evolucion = not sin_hipoteca and cuota_estimada > 0 and capital_hipoteca > 0
+        argumentos_evolucion = (
+            (capital_hipoteca, interes_anual, anos_plazo, cuota_estimada)
+            if hay_evolucion and tipo_hipoteca in ("Fija", "Variable") else None
+        )
+        # Backtest y sensibilidad (más abajo en la página): se calculan en segundo plano mientras se pinta lo de arriba
+        argumentos_backtest = (
+            (capital_hipoteca, anos_plazo, diferencial, sueldo_neto, deudas_mensuales,
+             tipo_hipoteca, interes_fijo, anios_fijo, meses_revision, suelo, techo)
+            if tipo_hipoteca in ("Variable", "Mixta") and not sin_hipoteca and capital_hipoteca > 0 else None
+        )
+        argumentos_sensibilidad = (
+            (
+                (precio, entrada_usuario, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+                 tipo_hipoteca, interes_anual, anos_plazo),
+                dict(interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial, anios_fijo=anios_fijo,
+                     suelo=suelo, techo=techo),
+            )
+            if not sin_hipoteca and cuota_estimada > 0 else None
+        )
+        precalcular_modo_vivienda(argumentos_backtest, argumentos_sensibilidad, get_chart_theme())
 
-        # --- Determinar si hay hipoteca (compra al contado si capital=0) ---
-        sin_hipoteca = (capital_hipoteca <= 0 and diferencia_entrada >= precio)
-
-        # --- Cuota estimada según tipo (solo si hay hipoteca) ---
-        cuota_estimada = 0.0
-        tramo_peor = None
-        if not sin_hipoteca:
-            if tipo_hipoteca in ["Fija", "Variable"] and interes_anual:
-                cuota_estimada = cuota_prestamo(capital_hipoteca, interes_anual, anos_plazo) or 0.0
-            elif (
-                tipo_hipoteca == "Mixta"
-                and (interes_fijo is not None)
-                and (euribor is not None)
-                and (diferencial is not None)
-            ):
-                interes_variable_total = euribor + diferencial
-                cuota_fijo_total = cuota_prestamo(capital_hipoteca, interes_fijo, anos_plazo) or 0.0
-                cuota_variable_total = cuota_prestamo(capital_hipoteca, interes_variable_total, anos_plazo) or 0.0
-                cuota_estimada = max(cuota_fijo_total, cuota_variable_total)
-                tramo_peor = "FIJO" if cuota_estimada == cuota_fijo_total else "VARIABLE"
-
-        # --- DTI (solo sentido si hay hipoteca y sueldo > 0) ---
-        dti_val = round(dti(cuota_estimada, deudas_mensuales, sueldo_neto), 4) if (sueldo_neto > 0 and not sin_hipoteca) else 0.0
         # =========================
         # 📌 Resumen de la vivienda
         # =========================
@@ -1503,19 +2163,10 @@ elif modo == "🏠 Comprobar una vivienda concreta":
                 iva_itp_val = precio * iva_itp_pct if precio > 0 else 0.0
                 ajd_val = 0.0
         else:
-            preset = PRESETS_IMPUESTOS.get(ccaa, PRESETS_IMPUESTOS.get("Madrid", {}))
-            if estado_vivienda == "Nuevo":
-                iva_itp_label = "IVA"
-                iva_itp_pct = preset.get("nuevo", {}).get("iva", 0.0)
-                ajd_pct = preset.get("nuevo", {}).get("ajd", 0.0)
-                iva_itp_val = precio * iva_itp_pct if precio > 0 else 0.0
-                ajd_val = precio * ajd_pct if precio > 0 else 0.0
-            else:
-                iva_itp_label = "ITP"
-                iva_itp_pct = preset.get("segunda", {}).get("itp", 0.0)
-                ajd_pct = 0.0
-                iva_itp_val = precio * iva_itp_pct if precio > 0 else 0.0
-                ajd_val = 0.0
+            desglose_impuestos = impuestos_compra(precio, *fiscal) if precio > 0 else {"transmision": 0.0, "ajd": 0.0}
+            iva_itp_label = nombre_impuesto_transmision(estado_vivienda)
+            iva_itp_val = desglose_impuestos["transmision"]
+            ajd_val = desglose_impuestos["ajd"]
 
         # Comisión de apertura (si existe)
         if com_apertura_pct > 0 and not sin_hipoteca:
@@ -1556,7 +2207,7 @@ elif modo == "🏠 Comprobar una vivienda concreta":
                 st.write(f"**Cuota mensual estimada:** {eur(cuota_estimada) if cuota_estimada > 0 else 'No disponible'}")
 
             # Evaluación combinada (solo si hay hipoteca)
-            if cuota_estimada > 0 and es_viable(cuota_estimada, cuota_max, ltv_val, ltv_max, dti_val):
+            if resultado.viable:
                 if dti_val <= DTI_WARN:
                     st.success(
                         f"DTI estimado: 🟢 {pct_dti(dti_val)} (Seguro)\n\n"
@@ -1587,97 +2238,54 @@ elif modo == "🏠 Comprobar una vivienda concreta":
 
         st.caption("DTI = (Cuota hipoteca + otras deudas) / Ingresos netos")
 
+        # =========================
+        # 🖼️ Figuras del dashboard (en paralelo)
+        # =========================
+        impuestos_total = (iva_itp_val + ajd_val) if precio > 0 else 0.0
+        gastos_formalizacion_total = (notario + registro + gestoria + tasacion + seguro_inicial)
+        gastos_compra_total = impuestos_total + gastos_formalizacion_total + (com_apertura_val if com_incluida_en_gastos else 0.0)
+        coste_inicial_total = (precio + gastos_compra_total) if precio > 0 else 0.0
+
+        # Pagos al banco (si hay hipoteca); en Mixta, tramo fijo y después el capital pendiente a tipo variable
+        pagos_totales = resultado.pagos_totales
+        intereses_totales = resultado.intereses_totales
+        capital_amortizado = capital_hipoteca if pagos_totales > 0 else 0.0
+
+        coste_total = (coste_inicial_total + intereses_totales) if precio > 0 else 0.0
+
+        datos_costes, etiquetas_costes = partidas_coste(
+            precio, impuestos_total, gastos_formalizacion_total, com_apertura_val, com_incluida_en_gastos, intereses_totales
+        )
+
+        # Indicadores, donut, evolución y pagos solo dependen de los números de arriba: se construyen y
+        # serializan a la vez antes de pintar. La evolución y los pagos los pinta su fragmento, que los lee de la caché.
+        theme = get_chart_theme()
+        tareas_figuras = {}
+        if not sin_hipoteca and cuota_estimada > 0:
+            tareas_figuras["dti"] = lambda: figura_indicador_json(
+                "Ratio de Endeudamiento (DTI)", dti_val * 100, 50, 10, '#3B82F6', TRAMOS_DTI, theme
+            )
+            tareas_figuras["ltv"] = lambda: figura_indicador_json(
+                f"Ratio de Financiación (LTV) - Máx. {ltv_max*100:.0f}%", ltv_val * 100, 100, 20, '#8B5CF6', TRAMOS_LTV, theme
+            )
+        if precio > 0:
+            tareas_figuras["costes"] = lambda: figura_costes_json(datos_costes, etiquetas_costes, coste_total, theme)
+        if argumentos_evolucion is not None:
+            tareas_figuras["evolucion"] = lambda: figura_evolucion_json(*argumentos_evolucion, theme)
+            tareas_figuras["pagos"] = lambda: figura_pagos_json(*argumentos_evolucion, theme)
+        figuras = en_paralelo(tareas_figuras)
+
         # =========================
         # 📊 Dashboard de Viabilidad (Gauges)
         # =========================
         st.subheader("📊 Dashboard de Viabilidad")
         
         if not sin_hipoteca and cuota_estimada > 0:
-            theme = get_chart_theme()
-            
-            # Definir colores basados en el tema
-            if theme.get('dark'):
-                bg_color = 'rgba(30, 41, 59, 0.5)'
-                border_color = 'rgba(100, 116, 139, 0.5)'
-                text_color = '#F8FAFC'
-                grid_color = 'rgba(255, 255, 255, 0.1)'
-            else:
-                bg_color = 'rgba(255, 255, 255, 0.7)'
-                border_color = 'rgba(203, 213, 225, 0.8)'
-                text_color = '#1E293B'
-                grid_color = 'rgba(0, 0, 0, 0.1)'
-            
             # Crear columnas con el mismo ancho
             col1, col2 = st.columns(2, gap="medium")
             
             with col1:
-                # Gráfico DTI
-                fig_dti = go.Figure(go.Indicator(
-                    mode = "gauge+number",
-                    value = dti_val * 100,
-                    domain = {'x': [0, 1], 'y': [0, 1]},
-                    title = {
-                        'text': "Ratio de Endeudamiento (DTI)",
-                        'font': {'size': 16, 'color': text_color}
-                    },
-                    gauge = {
-                        'axis': {
-                            'range': [None, 50],
-                            'tickwidth': 1,
-                            'tickcolor': text_color,
-                            'tickfont': {'color': text_color, 'size': 10},
-                            'tickformat': '.0f%',
-                            'tick0': 0,
-                            'dtick': 10
-                        },
-                        'bar': {'color': '#3B82F6'},
-                        'bgcolor': bg_color,
-                        'borderwidth': 1,
-                        'bordercolor': border_color,
-                        'steps': [
-                            {'range': [0, 30], 'color': '#10B981'},  # Verde
-                            {'range': [30, 35], 'color': '#F59E0B'}, # Amarillo
-                            {'range': [35, 50], 'color': '#EF4444'}  # Rojo
-                        ],
-                        'threshold': {
-                            'line': {'color': "red", 'width': 4},
-                            'thickness': 0.75,
-                            'value': dti_val * 100
-                        }
-                    },
-                    number = {
-                        'suffix': "%", 
-                        'font': {'size': 28, 'color': text_color},
-                        'valueformat': '.1f'
-                    }
-                ))
-                
-                # Configuración mínima necesaria
-                fig_dti.update_layout(
-                    margin=dict(l=20, r=20, t=60, b=20),
-                    height=280,
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font=dict(color=text_color, size=12)
-                )
-                
-                # Configuración responsive para el gráfico DTI
-                fig_dti.update_layout(
-                    margin=dict(l=10, r=10, t=30, b=10),
-                    autosize=True,
-                    font=dict(size=12)
-                )
-                st.plotly_chart(
-                    fig_dti, 
-                    use_container_width=True, 
-                    config={
-                        'displayModeBar': True,
-                        'responsive': True,
-                        'displaylogo': False,
-                        'modeBarButtonsToRemove': ['select2d', 'lasso2d', 'select'],
-                        'staticPlot': False
-                    }
-                )
+                mostrar_grafico("Indicador DTI", figuras["dti"], CONFIG_GRAFICOS_EVOLUCION)
                 
                 # Interpretación DTI
                 with st.container(height=90):
@@ -1689,73 +2297,7 @@ elif modo == "🏠 Comprobar una vivienda concreta":
                         st.markdown("<div style='background-color: #fef2f2; color: #991b1b; padding: 0.5rem; border-radius: 0.5rem; margin: 0.25rem 0;'>❌ <strong>DTI Alto</strong> - Riesgo de rechazo</div>", unsafe_allow_html=True)
             
             with col2:
-                # Gráfico LTV
-                fig_ltv = go.Figure(go.Indicator(
-                    mode = "gauge+number",
-                    value = ltv_val * 100,
-                    domain = {'x': [0, 1], 'y': [0, 1]},
-                    title = {
-                        'text': f"Ratio de Financiación (LTV) - Máx. {ltv_max*100:.0f}%",
-                        'font': {'size': 16, 'color': text_color}
-                    },
-                    gauge = {
-                        'axis': {
-                            'range': [None, 100],
-                            'tickwidth': 1,
-                            'tickcolor': text_color,
-                            'tickfont': {'color': text_color, 'size': 10},
-                            'tickformat': '.0f%',
-                            'tick0': 0,
-                            'dtick': 20
-                        },
-                        'bar': {'color': '#8B5CF6'},
-                        'bgcolor': bg_color,
-                        'borderwidth': 1,
-                        'bordercolor': border_color,
-                        'steps': [
-                            {'range': [0, 60], 'color': '#10B981'},  # Verde
-                            {'range': [60, 80], 'color': '#F59E0B'}, # Amarillo
-                            {'range': [80, 100], 'color': '#EF4444'}  # Rojo
-                        ],
-                        'threshold': {
-                            'line': {'color': "red", 'width': 4},
-                            'thickness': 0.75,
-                            'value': ltv_val * 100
-                        }
-                    },
-                    number = {
-                        'suffix': "%", 
-                        'font': {'size': 28, 'color': text_color},
-                        'valueformat': '.1f'
-                    }
-                ))
-                
-                # Configuración mínima necesaria
-                fig_ltv.update_layout(
-                    margin=dict(l=20, r=20, t=60, b=20),
-                    height=280,
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font=dict(color=text_color, size=12)
-                )
-                
-                # Configuración responsive para el gráfico LTV
-                fig_ltv.update_layout(
-                    margin=dict(l=10, r=10, t=30, b=10),
-                    autosize=True,
-                    font=dict(size=12)
-                )
-                st.plotly_chart(
-                    fig_ltv, 
-                    use_container_width=True, 
-                    config={
-                        'displayModeBar': True,
-                        'responsive': True,
-                        'displaylogo': False,
-                        'modeBarButtonsToRemove': ['select2d', 'lasso2d', 'select'],
-                        'staticPlot': False
-                    }
-                )
+                mostrar_grafico("Indicador LTV", figuras["ltv"], CONFIG_GRAFICOS_EVOLUCION)
                 
                 # Interpretación LTV
                 with st.container(height=90):
@@ -1807,32 +2349,6 @@ elif modo == "🏠 Comprobar una vivienda concreta":
 
         st.subheader("💵 Coste total de la operación")
 
-        impuestos_total = (iva_itp_val + ajd_val) if precio > 0 else 0.0
-        gastos_formalizacion_total = (notario + registro + gestoria + tasacion + seguro_inicial)
-        gastos_compra_total = impuestos_total + gastos_formalizacion_total + (com_apertura_val if com_incluida_en_gastos else 0.0)
-        coste_inicial_total = (precio + gastos_compra_total) if precio > 0 else 0.0
-
-        # Pagos al banco (si hay hipoteca)
-        if not sin_hipoteca and tipo_hipoteca in ["Fija", "Variable"] and cuota_estimada > 0 and capital_hipoteca > 0:
-            pagos_totales = cuota_estimada * anos_plazo * 12
-            intereses_totales = max(0.0, pagos_totales - capital_hipoteca)
-            capital_amortizado = capital_hipoteca
-        elif not sin_hipoteca and tipo_hipoteca == "Mixta" and cuota_estimada > 0 and capital_hipoteca > 0:
-            cuota_fijo = cuota_prestamo(capital_hipoteca, interes_fijo, anios_fijo) or 0.0
-            pagos_fijo = cuota_fijo * anios_fijo * 12
-            plazo_var = max(0, anos_plazo - anios_fijo)
-            cuota_var = cuota_prestamo(capital_hipoteca, interes_variable, plazo_var) if plazo_var > 0 else 0.0
-            pagos_var = cuota_var * plazo_var * 12
-            pagos_totales = pagos_fijo + pagos_var
-            intereses_totales = max(0.0, pagos_totales - capital_hipoteca)
-            capital_amortizado = capital_hipoteca
-        else:
-            pagos_totales = 0.0
-            intereses_totales = 0.0
-            capital_amortizado = 0.0
-
-        coste_total = (coste_inicial_total + intereses_totales) if precio > 0 else 0.0
-
         # --- Tabla resumen ---
         tabla_resumen = pd.DataFrame([
             ["⚖️ Coste inicial (precio + impuestos + gastos)", eur(coste_inicial_total) if coste_inicial_total > 0 else "No disponible"],
@@ -1862,401 +2378,21 @@ elif modo == "🏠 Comprobar una vivienda concreta":
         st.subheader("📊 Dashboard Visual de Costes")
         
         if precio > 0:
-            # Preparar datos para el gráfico
-            datos_costes = []
-            etiquetas_costes = []
-            
-            # Precio de la vivienda
-            if precio > 0:
-                datos_costes.append(precio)
-                etiquetas_costes.append(f"🏠 Precio vivienda<br>{eur(precio)}")
-            
-            # Impuestos
-            if impuestos_total > 0:
-                datos_costes.append(impuestos_total)
-                etiquetas_costes.append(f"🧾 Impuestos<br>{eur(impuestos_total)}")
-            
-            # Gastos de formalización
-            if gastos_formalizacion_total > 0:
-                datos_costes.append(gastos_formalizacion_total)
-                etiquetas_costes.append(f"📋 Gastos formalización<br>{eur(gastos_formalizacion_total)}")
-            
-            # Comisión de apertura (si no está financiada)
-            if com_apertura_val > 0 and com_incluida_en_gastos:
-                datos_costes.append(com_apertura_val)
-                etiquetas_costes.append(f"🏦 Comisión apertura<br>{eur(com_apertura_val)}")
-            
-            # Intereses totales
-            if intereses_totales > 0:
-                datos_costes.append(intereses_totales)
-                etiquetas_costes.append(f"💸 Intereses totales<br>{eur(intereses_totales)}")
-            
-            theme = get_chart_theme()
-            subtitle_color = theme.get('subtitle_color', theme['text_color'])
-            
-            # Configuración de colores para tooltips y leyenda
-            if theme.get('dark'):
-                # Configuración de colores para tooltips y leyenda
-                hover_bg = 'rgba(15, 23, 42, 0.98)'  # Fondo oscuro
-                hover_border = 'rgba(100, 116, 139, 0.5)'
-                hover_text_color = '#FFFFFF'  # Texto blanco
-                legend_bg = 'rgba(15, 23, 42, 0.98)'  # Fondo oscuro
-                legend_text_color = '#FFFFFF'  # Texto blanco
-                plotly_template = 'plotly_dark'  # Usar tema oscuro de Plotly
-                
-                # Ajustes específicos para móviles
-                text_size = 12  # Tamaño de fuente más pequeño para móviles
-            else:
-                # Para modo claro
-                hover_bg = color_with_alpha(theme.get('secondary_bg', '#FFFFFF'), 0.98)
-                hover_border = color_with_alpha(theme.get('axis_label_color', theme['text_color']), 0.3)
-                hover_text_color = theme.get('text_color', '#1A1A1A')
-                legend_bg = 'rgba(255, 255, 255, 0.95)'
-                legend_text_color = theme.get('text_color', '#1A1A1A')
-                plotly_template = 'plotly_white'
-                
-                # Ajustes específicos para móviles
-                text_size = 12  # Tamaño de fuente más pequeño para móviles
-                
+            # Colores de la leyenda propia (los mismos que usa el donut)
             donut_colors = [theme['colors'][i % len(theme['colors'])] for i in range(len(datos_costes))]
-            # Crear gráfico donut con mejor visibilidad
-            fig_costes = go.Figure(data=[go.Pie(
-                labels=etiquetas_costes,
-                values=datos_costes,
-                hole=0.4,
-                marker=dict(colors=donut_colors),
-                textinfo='percent+label',  # Mostrar porcentaje y etiqueta
-                textposition='outside',
-                texttemplate='<b>%{percent:.1%}</b>',  # Porcentaje en negrita
-                insidetextorientation='radial',
-                textfont=dict(
-                    color=theme['text_color'],
-                    size=text_size,  # Usar tamaño de fuente responsive
-                    family='Arial, sans-serif'
-                ),
-                hovertemplate=(
-                    f'<b style="color:{hover_text_color}">%{{label}}</b><br>'
-                    f'<span style="color:{hover_text_color}">Importe: %{{value:,.2f}} €</span><br>'
-                    f'<span style="color:{hover_text_color}">Porcentaje: %{{percent:.1%}}</span><extra></extra>'
-                ),
-                pull=[0.02] * len(datos_costes),  # Separación uniforme para todas las secciones
-                outsidetextfont=dict(
-                    color=theme['text_color'],
-                    size=text_size,  # Usar tamaño de fuente responsive
-                    family='Arial, sans-serif'
-                ),
-                direction='clockwise',
-                sort=False
-            )])
-            
-            fig_costes.update_layout(
-                title={
-                    'text': "<b>Distribución del Coste Total</b>",
-                    'x': 0.5,
-                    'xanchor': 'center',
-                    'font': {
-                        'color': theme.get('title_color', theme['text_color']),
-                        'family': 'Arial, sans-serif',
-                        'size': 18
-                    },
-                    'y': 0.99
-                },
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                margin=dict(l=10, r=10, t=60, b=20),  # Márgenes optimizados para móviles
-                uniformtext_minsize=12,  # Tamaño mínimo de texto más grande
-                uniformtext_mode='hide',  # Ocultar textos que no quepan
-                font=dict(size=14, color=theme['text_color']),
-                # Configuración de la leyenda (fuera de la pantalla)
-                legend=dict(
-                    orientation="v",
-                    yanchor="top",
-                    y=1.5,  # Mover la leyenda fuera de la pantalla
-                    xanchor="left",
-                    x=1.05,
-                    bgcolor='rgba(0,0,0,0)',
-                    bordercolor='rgba(0,0,0,0)',
-                    borderwidth=0,
-                    font=dict(
-                        color='rgba(0,0,0,0)',
-                        family='Arial, sans-serif',
-                        size=1  # Tamaño mínimo permitido
-                    ),
-                    itemclick=False,
-                    itemdoubleclick=False,
-                    traceorder='normal',
-                    itemsizing='constant'
-                ),
-                annotations=[
-                    dict(
-                        x=0.5,
-                        y=1.0,
-                        xref='paper',
-                        yref='paper',
-                        text=eur(coste_total),
-                        showarrow=False,
-                        font=dict(
-                            size=14,
-                            color='#F0F0F0' if theme['dark'] else theme.get('subtitle_color', theme['text_color']),
-                            family='Arial, sans-serif, Segoe UI'
-                        ),
-                        xanchor='center',
-                        yanchor='bottom',
-                        yshift=4,
-                        opacity=0.95
-                    )
-                ],
-                hoverlabel=dict(
-                    bgcolor='rgba(15, 23, 42, 0.95)' if theme['dark'] else hover_bg,
-                    bordercolor='rgba(100, 116, 139, 0.5)',
-                    font=dict(
-                        color='#FFFFFF' if theme['dark'] else hover_text_color, 
-                        size=12, 
-                        family="sans-serif"
-                    ),
-                    align="left"
-                ),
-                height=600,
-                showlegend=False  # Desactivar la leyenda nativa
-            )  # Cierre de update_layout
-            
-            # Configuración para el gráfico responsive
-            fig_costes.update_layout(
-                autosize=True,
-                margin=dict(
-                    l=20,  # Reducir margen izquierdo
-                    r=20,  # Reducir margen derecho
-                    t=60,  # Reducir margen superior
-                    b=20,  # Reducir margen inferior
-                    pad=5  # Padding pequeño
-                ),
-                height=400,  # Altura fija más pequeña para móviles
-                font=dict(size=12)  # Tamaño de fuente base para mejor legibilidad
+            hover_border = (
+                'rgba(100, 116, 139, 0.5)' if theme.get('dark')
+                else color_with_alpha(theme.get('axis_label_color', theme['text_color']), 0.3)
             )
-            
+
             # Configuración para el contenedor del gráfico
             col1, col2 = st.columns([3, 1])
             
             with col1:
                 # Mostrar el gráfico con configuración responsive
-                st.plotly_chart(
-                    fig_costes,
-                    use_container_width=True,  # Usar el ancho del contenedor
-                    config={
-                        'displayModeBar': True,
-                        'staticPlot': False,
-                        'displaylogo': False,
-                        'responsive': True,  # Hacer el gráfico responsive
-                        'modeBarButtonsToRemove': ['select2d', 'lasso2d', 'select'],
-                    }
-                )
-            
-            # Estilos CSS globales para todos los gráficos
-            st.markdown("""
-            <style>
-                /* Estilos para móviles */
-                @media (max-width: 768px) {
-                    .stPlotlyChart {
-                        width: 100% !important;
-                        max-width: 100% !important;
-                    }
-                    .js-plotly-plot .plotly .main-svg text {
-                        font-size: 12px !important;
-                    }
-                    .plotly .legend {
-                        font-size: 10px !important;
-                    }
-                }
-                
-                /* Ajustes para tablets */
-                @media (min-width: 769px) and (max-width: 1024px) {
-                    .stPlotlyChart {
-                        width: 100% !important;
-                    }
-                    .js-plotly-plot .plotly .main-svg text {
-                        font-size: 11px !important;
-                    }
-                }
-                
-                /* Ajustes generales para todos los gráficos */
-                .stPlotlyChart {
-                    transition: all 0.3s ease;
-                }
-                
-                /* Mejorar la legibilidad en modo oscuro */
-                [data-testid="stAppViewContainer"] .js-plotly-plot .plotly .main-svg {
-                    background: transparent !important;
-                }
-                
-                /* Ajustar el tamaño de los tooltips */
-                .svg-container {
-                    margin: 0 auto;
-                }
-            </style>
-            """, unsafe_allow_html=True)
+                mostrar_grafico("Coste total", figuras["costes"], CONFIG_GRAFICOS_EVOLUCION)
             
             with col2:
-                # Inyectar JavaScript para detectar el tema
-                st.markdown("""
-                <script>
-                // Función para detectar el tema actual
-                function getCurrentTheme() {
-                    // Verificar si está en modo oscuro
-                    if (window.matchMedia && window.matchMedia('(prefers-color-scheme: dark)').matches) {
-                        return 'dark';
-                    }
-                    return 'light';
-                }
-                
-                // Aplicar tema al cargar
-                document.addEventListener('DOMContentLoaded', function() {
-                    updateThemeStyles();
-                    
-                    // Escuchar cambios de tema
-                    window.matchMedia('(prefers-color-scheme: dark)').addEventListener('change', updateThemeStyles);
-                });
-                
-                // Actualizar estilos basado en el tema
-                function updateThemeStyles() {
-                    const theme = getCurrentTheme();
-                    const root = document.documentElement;
-                    
-                    if (theme === 'dark') {
-                        root.style.setProperty('--legend-bg', 'rgba(30, 41, 59, 0.95)');
-                        root.style.setProperty('--legend-border', 'rgba(51, 65, 85, 0.5)');
-                        root.style.setProperty('--legend-text', '#F8FAFC');
-                        root.style.setProperty('--legend-value', '#CBD5E1');
-                        root.style.setProperty('--legend-divider', 'rgba(51, 65, 85, 0.5)');
-                    } else {
-                        root.style.setProperty('--legend-bg', 'rgba(255, 255, 255, 0.95)');
-                        root.style.setProperty('--legend-border', 'rgba(203, 213, 225, 0.8)');
-                        root.style.setProperty('--legend-text', '#1E293B');
-                        root.style.setProperty('--legend-value', '#475569');
-                        root.style.setProperty('--legend-divider', 'rgba(203, 213, 225, 0.8)');
-                    }
-                }
-                </script>
-                
-                <style>
-                /* Variables CSS para los temas */
-                :root {
-                    --legend-bg: rgba(255, 255, 255, 0.95);
-                    --legend-border: rgba(0, 0, 0, 0.1);
-                    --legend-text: #1E293B;
-                    --legend-value: #475569;
-                    --legend-divider: #E2E8F0;
-                    --legend-hover-bg: rgba(0, 0, 0, 0.03);
-                }
-                
-                /* Ocultar solo la leyenda nativa del gráfico de donut */
-                div[data-testid="stPlotlyChart"]:has(> div > div > svg > g.infolayer > g.legend) .legend,
-                div[data-testid="stPlotlyChart"]:has(> div > div > svg > g.infolayer > g.legend) .legends,
-                div[data-testid="stPlotlyChart"]:has(> div > div > svg > g.infolayer > g.legend) .legendgroup,
-                div[data-testid="stPlotlyChart"]:has(> div > div > svg > g.infolayer > g.legend) .legendtext,
-                div[data-testid="stPlotlyChart"]:has(> div > div > svg > g.infolayer > g.legend) .legendtoggle,
-                div[data-testid="stPlotlyChart"]:has(> div > div > svg > g.infolayer > g.legend) .legendtitle,
-                div[data-testid="stPlotlyChart"]:has(> div > div > svg > g.infolayer > g.legend) .legendpoints {
-                    display: none !important;
-                    visibility: hidden !important;
-                    opacity: 0 !important;
-                    width: 0 !important;
-                    height: 0 !important;
-                    padding: 0 !important;
-                    margin: 0 !important;
-                    border: none !important;
-                }}
-                
-                .legend-item:hover {
-                    background-color: var(--legend-hover-bg);
-                    border: 1px solid var(--legend-border);
-                    border-radius: 8px;
-                /* Estilos para los elementos de la leyenda */
-                .legend-item {
-                    display: flex;
-                    align-items: center;
-                    margin-bottom: 8px;
-                    padding: 4px 8px;
-                    border-radius: 4px;
-                    transition: all 0.3s ease;
-                    line-height: 1.4;
-                    color: var(--legend-text);
-                }
-                
-                .legend-color {
-                    width: 16px;
-                    height: 16px;
-                    min-width: 16px;
-                    min-height: 16px;
-                    border-radius: 4px;
-                    margin-right: 10px;
-                    display: inline-block;
-                    vertical-align: middle;
-                    flex-shrink: 0;
-                    border: 1px solid var(--legend-border);
-                    box-sizing: border-box;
-                }
-                
-                .legend-label {
-                    color: var(--legend-text);
-                    font-weight: 500;
-                }
-                
-                .legend-value {
-                    color: var(--legend-value);
-                    margin-left: 4px;
-                    font-weight: 500;
-                    font-size: 0.9em;
-                    opacity: 0.9;
-                }
-                
-                /* Efecto hover sutil */
-                .legend-item:hover {
-                    background-color: var(--legend-hover-bg);
-                }
-                        width: 16px;
-                        height: 16px;
-                        border-radius: 4px;
-                        margin-right: 10px;
-                        flex-shrink: 0;
-                        border: 1px solid {hover_border};
-                    }}
-                    
-                    .legend-value {{
-                        margin-left: 4px;
-                        font-weight: 500;
-                        color: var(--legend-value);
-                        opacity: 0.9;
-                        font-size: 0.9em;
-                        transition: color 0.3s ease;
-                    }}
-                    
-                    /* Los estilos específicos ahora se manejan con JavaScript y variables CSS */
-                    
-                    /* Asegurar que los colores se actualicen suavemente */
-                    @media (prefers-color-scheme: dark) {
-                        /* Valores iniciales para modo oscuro */
-                        :root {
-                            --legend-bg: rgba(30, 41, 59, 0.95);
-                            --legend-border: rgba(51, 65, 85, 0.5);
-                            --legend-text: #F8FAFC;
-                            --legend-value: #CBD5E1;
-                            --legend-divider: rgba(51, 65, 85, 0.5);
-                        }
-                    }
-                    
-                    @media (prefers-color-scheme: light) {
-                        /* Valores iniciales para modo claro */
-                        :root {
-                            --legend-bg: rgba(255, 255, 255, 0.95);
-                            --legend-border: rgba(203, 213, 225, 0.8);
-                            --legend-text: #1E293B;
-                            --legend-value: #475569;
-                            --legend-divider: rgba(203, 213, 225, 0.8);
-                        }
-                    }}
-                </style>
-                """, unsafe_allow_html=True)
-                
                 # Iniciar el contenedor de la leyenda sin título
                 st.markdown("""
                 <div class="custom-legend" id="custom-legend-container">
@@ -2355,50 +2491,96 @@ elif modo == "🏠 Comprobar una vivienda concreta":
             if capital_hipoteca <= 0 or sueldo_neto <= 0:
                 st.warning("⚠️ No se pueden simular escenarios porque faltan parámetros mínimos (sueldo o capital a financiar).")
             else:
-                if tipo_hipoteca == "Fija":
-                    for interes_pct in ESCENARIOS_INTERES_PCT:
-                        interes_decimal = interes_pct / 100
-                        cuota_esc = cuota_prestamo(capital_hipoteca, interes_decimal, anos_plazo) or 0.0
-                        dti_esc = dti(cuota_esc, deudas_mensuales, sueldo_neto)
-                        if es_viable(cuota_esc, cuota_max, ltv_val, ltv_max, dti_esc):
-                            st.success(f"✅ {pct(interes_decimal)} → cuota {eur(cuota_esc)} | DTI {semaforo_dti(dti_esc)}")
-                        else:
-                            st.error(f"❌ {pct(interes_decimal)} → cuota {eur(cuota_esc)} | DTI {semaforo_dti(dti_esc)}")
-
-                elif tipo_hipoteca == "Variable":
-                    for interes_pct in ESCENARIOS_INTERES_PCT:
-                        interes_decimal = interes_pct / 100
-                        cuota_esc = cuota_prestamo(capital_hipoteca, interes_decimal, anos_plazo) or 0.0
-                        dti_esc = dti(cuota_esc, deudas_mensuales, sueldo_neto)
-                        if es_viable(cuota_esc, cuota_max, ltv_val, ltv_max, dti_esc):
-                            st.success(f"✅ {pct(interes_decimal)} → cuota {eur(cuota_esc)} | DTI {semaforo_dti(dti_esc)}")
-                        else:
-                            st.error(f"❌ {pct(interes_decimal)} → cuota {eur(cuota_esc)} | DTI {semaforo_dti(dti_esc)}")
-
-                elif tipo_hipoteca == "Mixta":
-                    for interes_pct in ESCENARIOS_INTERES_PCT:
-                        interes_variable_esc = (interes_pct / 100) + diferencial
-                        cuota_fijo_esc = cuota_prestamo(capital_hipoteca, interes_fijo, anos_plazo) or 0.0
-                        cuota_var_esc  = cuota_prestamo(capital_hipoteca, interes_variable_esc, anos_plazo) or 0.0
-                        cuota_peor_esc = max(cuota_fijo_esc, cuota_var_esc)
-                        dti_peor_esc = dti(cuota_peor_esc, deudas_mensuales, sueldo_neto)
-                        tramo_peor_esc = "FIJO" if cuota_fijo_esc >= cuota_var_esc else "VARIABLE"
-
-                        if es_viable(cuota_peor_esc, cuota_max, ltv_val, ltv_max, dti_peor_esc):
-                            st.success(
-                                f"✅ fijo {pct(interes_fijo)} / var {pct(interes_variable_esc)} → peor tramo {tramo_peor_esc}: "
-                                f"cuota {eur(cuota_peor_esc)} | DTI {semaforo_dti(dti_peor_esc)}"
-                            )
-                        else:
-                            st.error(
-                                f"❌ fijo {pct(interes_fijo)} / var {pct(interes_variable_esc)} → peor tramo {tramo_peor_esc}: "
-                                f"cuota {eur(cuota_peor_esc)} | DTI {semaforo_dti(dti_peor_esc)}"
-                            )
+                escenarios = escenarios_interes(
+                    capital_hipoteca, anos_plazo, ESCENARIOS_INTERES_PCT, cuota_max, ltv_val, ltv_max,
+                    sueldo_neto, deudas_mensuales, tipo_hipoteca, interes_fijo=interes_fijo, diferencial=diferencial
+                )
+                for esc in escenarios:
+                    icono, mostrar = ("✅", st.success) if esc["viable"] else ("❌", st.error)
+                    if tipo_hipoteca == "Mixta":
+                        mostrar(
+                            f"{icono} fijo {pct(interes_fijo)} / var {pct(esc['interes_variable'])} → peor tramo {esc['tramo_peor']}: "
+                            f"cuota {eur(esc['cuota'])} | DTI {semaforo_dti(esc['dti'])}"
+                        )
+                    else:
+                        mostrar(f"{icono} {pct(esc['interes'])} → cuota {eur(esc['cuota'])} | DTI {semaforo_dti(esc['dti'])}")
 
+                if tipo_hipoteca == "Mixta":
                     st.caption("En Mixta se valida siempre el tramo más exigente (peor escenario).")
 
         st.caption("DTI = (Cuota hipoteca + otras deudas) / Ingresos netos")
-        
+
+        # =========================
+        # 📈 Backtest con el Euríbor histórico
+        # =========================
+        if argumentos_backtest is not None:
+            st.subheader("📈 Backtest con el Euríbor histórico")
+            limites = [f"suelo {pct(suelo)}"] if suelo is not None else []
+            limites += [f"techo {pct(techo)}"] if techo is not None else []
+            st.caption(
+                f"Tu misma hipoteca (capital, plazo y diferencial) firmada en cada mes desde {MESES_EURIBOR[0][:4]}, "
+                f"revisando la cuota cada {meses_revision} meses con el Euríbor a 12 meses de ese momento"
+                + (f" ({', '.join(limites)})" if limites else "")
+                + (f" tras {anios_fijo} años al {pct(interes_fijo)}." if tipo_hipoteca == "Mixta" else ".")
+                + " Serie mensual aproximada; los años posteriores al último dato repiten el último valor."
+            )
+            resumen_backtest = calcular_backtest_euribor(*argumentos_backtest)["resumen"]
+            peor_inicio = resumen_backtest.loc[resumen_backtest["Cuota máxima"].idxmax()]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Peor cuota histórica", eur(peor_inicio["Cuota máxima"]))
+            col2.metric("DTI máximo histórico", pct_dti(peor_inicio["DTI máximo"]),
+                        help=f"Firmando en {peor_inicio['Inicio']}.")
+            col3.metric("Intereses totales (rango)",
+                        f"{eur(resumen_backtest['Intereses totales'].min())} – {eur(resumen_backtest['Intereses totales'].max())}")
+            mostrar_grafico("Backtest del Euríbor", figura_backtest_json(argumentos_backtest, get_chart_theme()))
+            fragmento_backtest_euribor(argumentos_backtest)
+
+        # =========================
+        # 🌪️ Sensibilidad de la operación
+        # =========================
+        st.subheader("🌪️ Sensibilidad de la operación")
+        st.caption(
+            "Cuánto cambian el DTI y el coste total si cada dato se mueve un paso arriba o abajo (el resto se mantiene). "
+            "Las entradas con más efecto aparecen arriba."
+        )
+
+        if sin_hipoteca or cuota_estimada <= 0:
+            st.info("ℹ️ El análisis de sensibilidad solo aplica cuando hay hipoteca.")
+        else:
+            posicionales, nombrados = argumentos_sensibilidad
+            sensibilidad = calcular_sensibilidad(*posicionales, **nombrados)
+            base_sens = sensibilidad["base"]
+            filas_sens = sensibilidad["filas"]
+            etiquetas_sens = tuple(f"{f['etiqueta']} ({texto_paso(f['paso'], f['unidad'])})" for f in filas_sens)
+            theme = get_chart_theme()
+
+            tab_dti, tab_coste = st.tabs(["📉 DTI", "💵 Coste total"])
+            with tab_dti:
+                mostrar_grafico("Sensibilidad del DTI", figura_tornado_json(
+                    etiquetas_sens,
+                    tuple((f["dti"][0] - base_sens["dti"]) * 100 for f in filas_sens),
+                    tuple((f["dti"][1] - base_sens["dti"]) * 100 for f in filas_sens),
+                    " pp", 2, theme
+                ))
+                st.caption(f"Variación en puntos porcentuales sobre el DTI actual ({pct_dti(base_sens['dti'])}).")
+            with tab_coste:
+                mostrar_grafico("Sensibilidad del coste total", figura_tornado_json(
+                    etiquetas_sens,
+                    tuple(f["coste_total"][0] - base_sens["coste_total"] for f in filas_sens),
+                    tuple(f["coste_total"][1] - base_sens["coste_total"] for f in filas_sens),
+                    " €", 0, theme
+                ))
+                st.caption(f"Variación en euros sobre el coste total con hipoteca ({eur(base_sens['coste_total'])}).")
+
+            cambios_viabilidad = [
+                f"{f['etiqueta']} {signo}{texto_paso(f['paso'], f['unidad'])[1:]}"
+                for f in filas_sens
+                for signo, viable_variante in zip(["−", "+"], f["viable"])
+                if viable_variante != base_sens["viable"]
+            ]
+            if cambios_viabilidad:
+                estado_nuevo = "no viable" if base_sens["viable"] else "viable"
+                st.warning(f"⚠️ La operación pasaría a ser **{estado_nuevo}** con: {', '.join(cambios_viabilidad)}.")
 
         # =========================
         # 💡 Consejos para mejorar la viabilidad
@@ -2407,85 +2589,6 @@ elif modo == "🏠 Comprobar una vivienda concreta":
         
         st.subheader("💡 Consejos para mejorar la viabilidad")
         
-        # Estilos CSS compatibles con tema claro y oscuro
-        st.markdown("""
-        <style>
-            /* Estilos base que funcionan en ambos temas */
-            .consejo-container {
-                border-left: 4px solid;
-                padding: 1rem;
-                margin: 1rem 0;
-                border-radius: 0 8px 8px 0;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-            }
-            
-            /* Estilos específicos para tema claro */
-            @media (prefers-color-scheme: light) {
-                .consejo-container {
-                    background-color: #f8f9fa;
-                    border-left-color: #4CAF50;
-                    color: #333;
-                }
-                .opcion-consejo {
-                    background-color: #f0f7ff;
-                    border-left: 4px solid #2196F3;
-                    color: #1a1a1a;
-                }
-                .advertencia {
-                    background-color: #fff3e0 !important;
-                    border-left-color: #ff9800 !important;
-                }
-                .financiacion {
-                    background-color: #e8f5e9 !important;
-                    border-left-color: #4caf50 !important;
-                }
-            }
-            
-            /* Estilos específicos para tema oscuro */
-            @media (prefers-color-scheme: dark) {
-                .consejo-container {
-                    background-color: #1e1e1e;
-                    border-left-color: #4CAF50;
-                    color: #f0f0f0;
-                }
-                .opcion-consejo {
-                    background-color: #2a3b4d;
-                    border-left: 4px solid #4d8ff9;
-                    color: #f0f0f0;
-                }
-                .advertencia {
-                    background-color: #3e2c16 !important;
-                    border-left-color: #ff9800 !important;
-                }
-                .financiacion {
-                    background-color: #1a3a1a !important;
-                    border-left-color: #4caf50 !important;
-                }
-            }
-            
-            /* Estilos comunes para opciones de consejo */
-            .opcion-consejo {
-                margin: 0.5rem 0;
-                padding: 0.75rem;
-                border-radius: 6px;
-                transition: all 0.3s ease;
-            }
-            
-            .opcion-consejo:hover {
-                transform: translateX(5px);
-                opacity: 0.9;
-            }
-            
-            /* Asegurar que el texto sea legible en ambos temas */
-            .opcion-consejo p, 
-            .consejo-container p, 
-            .consejo-container h3,
-            .opcion-consejo h3 {
-                color: inherit !important;
-            }
-        </style>
-        """, unsafe_allow_html=True)
-        
         def mostrar_consejo(tipo, mensaje, es_html=False):
             if tipo == 'advertencia':
                 st.markdown(f'<div class="consejo-container advertencia">{mensaje if not es_html else mensaje}</div>', unsafe_allow_html=True)
@@ -2497,85 +2600,81 @@ elif modo == "🏠 Comprobar una vivienda concreta":
         if sin_hipoteca:
             st.info("ℹ️ No se generan consejos: no se requiere hipoteca.")
         else:
-            if tipo_hipoteca == "Mixta":
-                interes_variable_total = euribor + diferencial
-                cuota_fijo_total = cuota_prestamo(capital_hipoteca, interes_fijo, anos_plazo) or 0.0
-                cuota_var_total  = cuota_prestamo(capital_hipoteca, interes_variable_total, anos_plazo) or 0.0
+            # --- Umbrales exactos: qué valor de cada variable (cambiando solo esa) hace viable la operación ---
+            soluciones = resultado.soluciones
+            operacion_viable = resultado.viable and diferencia_entrada >= 0
+
+            if soluciones.entrada_min is None:
+                txt_entrada = "No se alcanza solo aportando más entrada."
+            elif soluciones.entrada_min > entrada_usuario:
+                txt_entrada = f"{eur(soluciones.entrada_min)} (<b>+{eur(soluciones.entrada_min - entrada_usuario)}</b> sobre tu entrada actual)"
+            else:
+                txt_entrada = f"{eur(soluciones.entrada_min)} (te sobran {eur(entrada_usuario - soluciones.entrada_min)})"
 
-                dti_fijo = dti(cuota_fijo_total, deudas_mensuales, sueldo_neto)
-                dti_variable = dti(cuota_var_total, deudas_mensuales, sueldo_neto)
-                dti_peor = max(dti_fijo, dti_variable)
-                cuota_peor = max(cuota_fijo_total, cuota_var_total)
+            if soluciones.sueldo_min is None:
+                txt_sueldo = "Ningún sueldo lo resuelve por sí solo (revisa la entrada o el LTV)."
+            else:
+                txt_sueldo = f"{eur(soluciones.sueldo_min)} al mes (tu sueldo actual: {eur(sueldo_neto)})"
 
-                dti_peor_visible = dti_visible(dti_peor)
-                
-                if not es_viable(cuota_peor, cuota_max, ltv_val, ltv_max, dti_peor):
-                    if dti_peor_visible and dti_peor_visible > DTI_FAIL:
-                        with st.container():
-                            st.markdown("### 🔍 Opciones de financiación y asesoramiento")
-                            st.markdown('<div class="opcion-consejo">👉 Aumenta la entrada inicial para reducir el importe a financiar.</div>', unsafe_allow_html=True)
-                            st.markdown('<div class="opcion-consejo">👉 Negocia un tipo de interés más bajo con el banco.</div>', unsafe_allow_html=True)
-                            st.markdown('<div class="opcion-consejo">👉 Considera ampliar el plazo del préstamo para reducir la cuota mensual.</div>', unsafe_allow_html=True)
-                    
-                    elif dti_peor_visible and DTI_WARN < dti_peor_visible <= DTI_FAIL:
-                        with st.container():
-                            st.markdown("### ⚠️ Capacidad de endeudamiento en el límite")
-                            st.markdown("Tu capacidad de endeudamiento está cerca del límite. Te recomendamos:")
-                            st.markdown('<div class="opcion-consejo">• Aportar más dinero para la entrada inicial</div>', unsafe_allow_html=True)
-                            st.markdown('<div class="opcion-consejo">• Reducir el precio objetivo de la vivienda</div>', unsafe_allow_html=True)
-                            st.markdown('<div class="opcion-consejo">• Incorporar un avalista que mejore la evaluación bancaria</div>', unsafe_allow_html=True)
-                    
-                    if ltv_val > ltv_max:
-                        with st.container():
-                            if ltv_val > 0.8:  # Si supera el 80% de financiación
-                                st.markdown("### 📊 Límite de financiación elevado")
-                                st.markdown(f"El banco suele financiar hasta el 80% del valor de la vivienda (solicitado: {ltv_val*100:.1f}%).")
-                                st.markdown("**Opciones para mejorar la viabilidad:**")
-                                st.markdown(f'<div class="opcion-consejo">• Aportar un {((ltv_val - ltv_max)*100):.1f}% adicional de entrada</div>', unsafe_allow_html=True)
-                                st.markdown('<div class="opcion-consejo">• Consultar con otros bancos por condiciones especiales</div>', unsafe_allow_html=True)
-                                st.markdown('<div class="opcion-consejo">• Valorar un avalista o garantías adicionales</div>', unsafe_allow_html=True)
-                                st.markdown('<div class="opcion-consejo">• Buscar una propiedad con un precio más ajustado</div>', unsafe_allow_html=True)
-                            else:
-                                st.markdown("### 📊 Financiación dentro de los límites")
-                                st.markdown(f"El banco financia hasta el {ltv_max*100:.0f}% del valor de la vivienda (solicitado: {ltv_val*100:.1f}%).")
-                else:
-                    st.success("✅ Tu operación es viable con los parámetros actuales (considerando ambos tramos).")
+            if soluciones.interes_max is None:
+                txt_interes = "Ningún tipo de interés lo resuelve por sí solo."
+            elif soluciones.interes_max >= INTERES_MAX_BUSQUEDA:
+                txt_interes = f"Viable incluso con un tipo superior al {pct(INTERES_MAX_BUSQUEDA)}."
+            elif tipo_hipoteca == "Mixta":
+                txt_interes = (
+                    f"Euríbor hasta {pct(soluciones.interes_max - diferencial)} en el tramo variable "
+                    f"(tipo total {pct(soluciones.interes_max)})"
+                )
+            else:
+                txt_interes = f"{pct(soluciones.interes_max)} (actual: {pct(interes_anual)})"
 
-            else:  # Fija/Variable
-                dti_dashboard = dti_val
-                dti_dashboard_visible = dti_visible(dti_dashboard)
+            if soluciones.plazo_min is None:
+                txt_plazo = f"Ni con {PLAZO_MAX_ANIOS} años resulta viable."
+            else:
+                txt_plazo = f"{soluciones.plazo_min} años (actual: {anos_plazo} años)"
+
+            st.markdown("### 🎯 Qué haría viable esta operación" if not operacion_viable else "### 📏 Margen de tu operación")
+            st.caption("Cada valor cambia una sola variable y mantiene el resto de parámetros actuales.")
+            st.markdown(f'<div class="opcion-consejo">💰 <b>Entrada mínima:</b> {txt_entrada}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="opcion-consejo">💶 <b>Ingresos netos mínimos:</b> {txt_sueldo}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="opcion-consejo">📈 <b>Tipo de interés máximo:</b> {txt_interes}</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="opcion-consejo">📅 <b>Plazo mínimo:</b> {txt_plazo}</div>', unsafe_allow_html=True)
+
+            # En Mixta, cuota y DTI son los del peor tramo
+            dti_dashboard_visible = dti_visible(dti_val)
+
+            if not resultado.viable:
+                if dti_dashboard_visible and dti_dashboard_visible > DTI_FAIL:
+                    with st.container():
+                        st.markdown("### 🔍 Opciones de financiación y asesoramiento")
+                        st.markdown('<div class="opcion-consejo">👉 Aumenta la entrada inicial para reducir el importe a financiar.</div>', unsafe_allow_html=True)
+                        st.markdown('<div class="opcion-consejo">👉 Negocia un tipo de interés más bajo con el banco.</div>', unsafe_allow_html=True)
+                        st.markdown('<div class="opcion-consejo">👉 Considera ampliar el plazo del préstamo para reducir la cuota mensual.</div>', unsafe_allow_html=True)
                 
-                if not es_viable(cuota_estimada, cuota_max, ltv_val, ltv_max, dti_dashboard):
-                    if dti_dashboard_visible and dti_dashboard_visible > DTI_FAIL:
-                        with st.container():
-                            st.markdown("### 🔍 Opciones de financiación y asesoramiento")
-                            st.markdown('<div class="opcion-consejo">👉 Aumenta la entrada inicial para reducir el importe a financiar.</div>', unsafe_allow_html=True)
-                            st.markdown('<div class="opcion-consejo">👉 Negocia un tipo de interés más bajo con el banco.</div>', unsafe_allow_html=True)
-                            st.markdown('<div class="opcion-consejo">👉 Considera ampliar el plazo del préstamo para reducir la cuota mensual.</div>', unsafe_allow_html=True)
-                    
-                    elif dti_dashboard_visible and DTI_WARN < dti_dashboard_visible <= DTI_FAIL:
-                        with st.container():
-                            st.markdown("### ⚠️ Capacidad de endeudamiento en el límite")
-                            st.markdown("Tu capacidad de endeudamiento está cerca del límite. Te recomendamos:")
-                            st.markdown('<div class="opcion-consejo">• Aportar más dinero para la entrada inicial</div>', unsafe_allow_html=True)
-                            st.markdown('<div class="opcion-consejo">• Reducir el precio objetivo de la vivienda</div>', unsafe_allow_html=True)
-                            st.markdown('<div class="opcion-consejo">• Incorporar un avalista que mejore la evaluación bancaria</div>', unsafe_allow_html=True)
-                    
-                    if ltv_val > ltv_max:
-                        with st.container():
-                            if ltv_val > 0.8:  # Si supera el 80% de financiación
-                                st.markdown("### 📊 Límite de financiación elevado")
-                                st.markdown(f"El banco suele financiar hasta el 80% del valor de la vivienda (solicitado: {ltv_val*100:.1f}%).")
-                                st.markdown("**Opciones para mejorar la viabilidad:**")
-                                st.markdown(f'<div class="opcion-consejo">• Aportar un {((ltv_val - ltv_max)*100):.1f}% adicional de entrada</div>', unsafe_allow_html=True)
-                                st.markdown('<div class="opcion-consejo">• Consultar con otros bancos por condiciones especiales</div>', unsafe_allow_html=True)
-                                st.markdown('<div class="opcion-consejo">• Valorar un avalista o garantías adicionales</div>', unsafe_allow_html=True)
-                                st.markdown('<div class="opcion-consejo">• Buscar una propiedad con un precio más ajustado</div>', unsafe_allow_html=True)
-                            else:
-                                st.markdown("### 📊 Financiación dentro de los límites")
-                                st.markdown(f"El banco financia hasta el {ltv_max*100:.0f}% del valor de la vivienda (solicitado: {ltv_val*100:.1f}%).")
-                else:
-                    st.success("✅ Tu operación es viable con los parámetros actuales.")
+                elif dti_dashboard_visible and DTI_WARN < dti_dashboard_visible <= DTI_FAIL:
+                    with st.container():
+                        st.markdown("### ⚠️ Capacidad de endeudamiento en el límite")
+                        st.markdown("Tu capacidad de endeudamiento está cerca del límite. Te recomendamos:")
+                        st.markdown('<div class="opcion-consejo">• Aportar más dinero para la entrada inicial</div>', unsafe_allow_html=True)
+                        st.markdown('<div class="opcion-consejo">• Reducir el precio objetivo de la vivienda</div>', unsafe_allow_html=True)
+                        st.markdown('<div class="opcion-consejo">• Incorporar un avalista que mejore la evaluación bancaria</div>', unsafe_allow_html=True)
+                
+                if ltv_val > ltv_max:
+                    with st.container():
+                        if ltv_val > 0.8:  # Si supera el 80% de financiación
+                            st.markdown("### 📊 Límite de financiación elevado")
+                            st.markdown(f"El banco suele financiar hasta el 80% del valor de la vivienda (solicitado: {ltv_val*100:.1f}%).")
+                            st.markdown("**Opciones para mejorar la viabilidad:**")
+                            st.markdown(f'<div class="opcion-consejo">• Aportar un {((ltv_val - ltv_max)*100):.1f}% adicional de entrada</div>', unsafe_allow_html=True)
+                            st.markdown('<div class="opcion-consejo">• Consultar con otros bancos por condiciones especiales</div>', unsafe_allow_html=True)
+                            st.markdown('<div class="opcion-consejo">• Valorar un avalista o garantías adicionales</div>', unsafe_allow_html=True)
+                            st.markdown('<div class="opcion-consejo">• Buscar una propiedad con un precio más ajustado</div>', unsafe_allow_html=True)
+                        else:
+                            st.markdown("### 📊 Financiación dentro de los límites")
+                            st.markdown(f"El banco financia hasta el {ltv_max*100:.0f}% del valor de la vivienda (solicitado: {ltv_val*100:.1f}%).")
+            else:
+                st.success("✅ Tu operación es viable con los parámetros actuales"
+                           + (" (considerando ambos tramos)." if tipo_hipoteca == "Mixta" else "."))
 
         # =========================
         # 💸 Simulación de amortización anticipada (opcional)
@@ -2590,58 +2689,9 @@ elif modo == "🏠 Comprobar una vivienda concreta":
         - *Reducir cuota*: mantienes el plazo, pero tu cuota mensual baja.  
         """)
 
-        simular_amortizacion = st.checkbox("Activar simulación de amortización anticipada", value=False)
-
-        if simular_amortizacion:
-            if sin_hipoteca:
-                st.info("ℹ️ No aplica amortización anticipada: no hay hipoteca.")
-            elif tipo_hipoteca == "Mixta":
-                st.warning("⚠️ La simulación solo está disponible para hipotecas Fijas o Variables.")
-            elif cuota_estimada <= 0 or capital_hipoteca <= 0:
-                st.warning("⚠️ No se puede simular: faltan parámetros válidos.")
-            else:
-                anio_extra = st.number_input("Año de amortización anticipada", min_value=1, max_value=anos_plazo, value=5, step=1)
-                pago_extra = st.number_input("Cantidad del pago extra (€)", min_value=0.0, step=1000.0, value=5000.0)
-                mantener_cuota = st.radio("¿Qué prefieres tras amortizar?", ["Reducir plazo", "Reducir cuota"], index=0)
-
-                n_total = anos_plazo * 12
-                n_transcurridos = anio_extra * 12
-                r_mensual = interes_anual / 12 if interes_anual else 0.0
-
-                if r_mensual > 0 and cuota_estimada > 0:
-                    capital_pendiente = capital_hipoteca * (
-                        ((1 + r_mensual) ** n_total - (1 + r_mensual) ** n_transcurridos)
-                        / ((1 + r_mensual) ** n_total - 1)
-                    )
-                else:
-                    capital_pendiente = capital_hipoteca * (1 - n_transcurridos / n_total)
-
-                nuevo_capital = max(0.0, capital_pendiente - pago_extra)
-
-                if mantener_cuota == "Reducir plazo":
-                    import math
-                    if r_mensual > 0 and cuota_estimada > 0:
-                        denominador_log = cuota_estimada - nuevo_capital * r_mensual
-                        if denominador_log <= 0 or (1 + r_mensual) <= 0:
-                            nuevo_plazo_meses = 0
-                        else:
-                            nuevo_plazo_meses = math.log(
-                                cuota_estimada / denominador_log
-                            ) / math.log(1 + r_mensual)
-                        nuevo_plazo_anios = max(0, nuevo_plazo_meses / 12)
-                    else:
-                        nuevo_plazo_anios = 0
-                    st.info(
-                        f"📉 Con amortización anticipada de {eur(pago_extra)} en el año {anio_extra}, "
-                        f"reduces el plazo a **{nuevo_plazo_anios:.1f} años** manteniendo la misma cuota."
-                    )
-                else:
-                    nuevo_plazo_restante = max(1, anos_plazo - anio_extra)
-                    nueva_cuota = cuota_prestamo(nuevo_capital, interes_anual, nuevo_plazo_restante) or 0.0
-                    st.info(
-                        f"📉 Con amortización anticipada de {eur(pago_extra)} en el año {anio_extra}, "
-                        f"tu nueva cuota sería de **{eur(nueva_cuota)}** manteniendo el plazo original."
-                    )
+        fragmento_amortizacion_anticipada(
+            capital_hipoteca, cuota_estimada, interes_anual, anos_plazo, sin_hipoteca, tipo_hipoteca
+        )
 
         # =========================
         # 📊 Tabla de amortización simplificada (por años)
@@ -2656,32 +2706,18 @@ elif modo == "🏠 Comprobar una vivienda concreta":
                 st.warning("⚠️ No se puede generar la tabla de amortización porque faltan parámetros válidos.")
             else:
                 if tipo_hipoteca in ["Fija", "Variable"]:
-                    data = []
-                    capital_pendiente = capital_hipoteca
-                    r = interes_anual / 12 if interes_anual else 0.0
-                    cuota_mensual = cuota_estimada
-
-                    for anio in range(1, anos_plazo + 1):
-                        intereses_anio = 0.0
-                        capital_anio = 0.0
-                        for mes in range(12):
-                            interes_mes = capital_pendiente * r
-                            amortizacion_mes = cuota_mensual - interes_mes
-                            intereses_anio += interes_mes
-                            capital_anio += amortizacion_mes
-                            capital_pendiente -= amortizacion_mes
-                            if capital_pendiente <= 0:
-                                capital_pendiente = 0
-                                break
-                        data.append({
-                            "Año": anio,
-                            "Cuota anual": eur(cuota_mensual * 12),
-                            "Intereses pagados": eur(intereses_anio),
-                            "Capital amortizado": eur(capital_anio),
-                            "Capital pendiente": eur(capital_pendiente)
-                        })
-                        if capital_pendiente <= 0:
-                            break
+                    # Mismo cuadro anual que los gráficos de evolución (ya calculado al construir sus figuras)
+                    df_evolucion = calcular_evolucion_anual(*argumentos_evolucion)
+                    data = [
+                        {
+                            "Año": int(fila["Año"]),
+                            "Cuota anual": eur(cuota_estimada * 12),
+                            "Intereses pagados": eur(fila["Intereses Anuales"]),
+                            "Capital amortizado": eur(fila["Capital Anual"]),
+                            "Capital pendiente": eur(max(0.0, fila["Capital Pendiente"])),
+                        }
+                        for _, fila in df_evolucion.iterrows()
+                    ]
 
                     df_amort = pd.DataFrame(data)
                     st.dataframe(df_amort, width="stretch")
@@ -2692,7 +2728,7 @@ elif modo == "🏠 Comprobar una vivienda concreta":
                     data_fijo = []
                     capital_pendiente = capital_hipoteca
                     r_fijo = interes_fijo / 12 if interes_fijo else 0.0
-                    cuota_mensual_fijo = cuota_prestamo(capital_pendiente, interes_fijo, anos_plazo) or 0.0
+                    cuota_mensual_fijo = resultado.cuota_fijo or 0.0
 
                     for anio in range(1, anios_fijo + 1):
                         intereses_anio = 0.0
@@ -2725,34 +2761,12 @@ elif modo == "🏠 Comprobar una vivienda concreta":
                     if plazo_var > 0 and capital_pendiente > 0:
                         data_var = []
                         r_var = interes_variable / 12 if interes_variable else 0.0
-                        cuota_mensual_var = cuota_prestamo(capital_pendiente, interes_variable, plazo_var) if plazo_var > 0 else 0.0
+                        cuota_mensual_var = resultado.cuota_variable or 0.0
 
                         for anio in range(1, plazo_var + 1):
                             intereses_anio = 0.0
                             capital_anio = 0.0
                             for mes in range(12):
-                                if dti_peor_visible and dti_peor_visible > DTI_FAIL:
-                                    mensaje_dti = (
-                                        "📊 **Capacidad de endeudamiento superada**\n\n"
-                                        f"Tu ratio DTI ({dti_peor_visible*100:.1f}%) supera el máximo recomendado ({DTI_FAIL*100:.0f}%).\n\n"
-                                        "🔹 **Opciones para mejorar tu perfil financiero:**\n"
-                                        "   • Aumenta la entrada inicial para reducir el importe a financiar\n"
-                                        "   • Considera ampliar el plazo del préstamo para reducir la cuota mensual\n"
-                                        "   • Reduce el precio objetivo de la vivienda\n"
-                                        "   • Mejora tus ingresos o reduce otras deudas"
-                                    )
-                                    consejos.append(mensaje_dti)
-                                elif dti_peor_visible and DTI_WARN < dti_peor_visible <= DTI_FAIL:
-                                    mensaje_dti = (
-                                        "⚠️ **Atención: Límite de endeudamiento cercano**\n\n"
-                                        f"Tu ratio DTI ({dti_peor_visible*100:.1f}%) se acerca al máximo recomendado ({DTI_FAIL*100:.0f}%).\n\n"
-                                        "🔹 **Recomendaciones para mejorar tu perfil:**\n"
-                                        "   • Aporta más dinero para la entrada si es posible\n"
-                                        "   • Valora reducir el precio de la vivienda objetivo\n"
-                                        "   • Considera la opción de un avalista\n"
-                                        "   • Revisa si puedes reducir otras deudas existentes"
-                                    )
-                                    consejos.append(mensaje_dti)
                                 interes_mes = capital_pendiente * r_var
                                 amortizacion_mes = cuota_mensual_var - interes_mes
                                 intereses_anio += interes_mes
@@ -2785,396 +2799,7 @@ elif modo == "🏠 Comprobar una vivienda concreta":
         if not sin_hipoteca and cuota_estimada > 0 and capital_hipoteca > 0:
             # Generar datos para el gráfico de evolución
             if tipo_hipoteca in ["Fija", "Variable"]:
-                evolucion_data = []
-                capital_pendiente = capital_hipoteca
-                r = interes_anual / 12 if interes_anual else 0.0
-                cuota_mensual = cuota_estimada
-
-                intereses_acumulados = 0.0
-                capital_amortizado_acumulado = 0.0
-                
-                for anio in range(1, anos_plazo + 1):
-                    intereses_anio = 0.0
-                    capital_anio = 0.0
-                    
-                    for mes in range(12):
-                        if capital_pendiente <= 0:
-                            break
-                        interes_mes = capital_pendiente * r
-                        amortizacion_mes = cuota_mensual - interes_mes
-                        intereses_anio += interes_mes
-                        capital_anio += amortizacion_mes
-                        capital_pendiente -= amortizacion_mes
-                    
-                    intereses_acumulados += intereses_anio
-                    capital_amortizado_acumulado += capital_anio
-                    
-                    evolucion_data.append({
-                        "Año": anio,
-                        "Capital Pendiente": max(0, capital_pendiente),
-                        "Intereses Acumulados": intereses_acumulados,
-                        "Capital Amortizado": capital_amortizado_acumulado,
-                        "Intereses Anuales": intereses_anio,
-                        "Capital Anual": capital_anio
-                    })
-                    
-                    if capital_pendiente <= 0:
-                        break
-                
-                # Crear DataFrame
-                df_evolucion = pd.DataFrame(evolucion_data)
-                
-                # =========================
-                # Sistema de Tabs para Evolución del Capital
-                # =========================
-                tab1, tab2 = st.tabs(["📈 Evolución del Capital", "💰 Distribución de Pagos"])
-                
-                with tab1:
-                    # Obtener configuración de tema
-                    theme = get_chart_theme()
-                    # Configuración de colores para tooltips
-                    if theme.get('dark'):
-                        hover_bg = 'rgba(255, 255, 255, 0.96)'  # Fondo blanco para mejor contraste
-                        hover_border = 'rgba(100, 116, 139, 0.5)'
-                        hover_text_color = '#1A1A1A'  # Texto oscuro para mejor legibilidad
-                    else:
-                        hover_bg = color_with_alpha(theme.get('secondary_bg', '#F0F2F6'), 0.96)
-                        hover_border = color_with_alpha(theme.get('axis_label_color', theme['text_color']), 0.3)
-                        hover_text_color = theme.get('text_color', '#1A1A1A')
-                    tooltip_color = hover_text_color
-                    
-                    # Crear figura con tema adaptativo
-                    fig_capital = go.Figure()
-                    
-                    # Añadir trazo con colores del tema
-                    fig_capital.add_trace(
-                        go.Scatter(
-                            x=df_evolucion["Año"],
-                            y=df_evolucion["Capital Pendiente"],
-                            fill='tozeroy',
-                            mode='lines+markers',
-                            name='Capital Pendiente',
-                            line=dict(color=theme['colors'][0], width=3),
-                            fillcolor=f"rgba({int(theme['colors'][0].lstrip('#')[0:2], 16)}, "
-                                    f"{int(theme['colors'][0].lstrip('#')[2:4], 16)}, "
-                                    f"{int(theme['colors'][0].lstrip('#')[4:6], 16)}, 0.3)",
-                            hovertemplate=(
-                                f"<b style='color:{tooltip_color}'>Año %{{x}}</b><br>"
-                                f"<span style='color:{tooltip_color}'>Capital pendiente: %{{y:,.2f}} €</span><extra></extra>"
-                            )
-                        )
-                    )
-                    
-                    # Configuración de diseño adaptativo con automargin
-                    fig_capital.update_layout(
-                        title={
-                            'text': "<b>Evolución del Capital Pendiente</b>",
-                            'x': 0.5,
-                            'xanchor': 'center',
-                            'font': {
-                                'color': theme.get('title_color', theme['text_color']),
-                                'family': 'Arial, sans-serif',
-                                'size': 18
-                            },
-                            'pad': {'b': 10, 't': 20}  # Espaciado interno para el título
-                        },
-                        annotations=[
-                            dict(
-                                x=0.5,
-                                y=1.0,
-                                xref='paper',
-                                yref='paper',
-                                text=f"Plazo: {anos_plazo} años | Capital inicial: {eur(capital_hipoteca)}",
-                                showarrow=False,
-                                font=dict(
-                                    size=14,
-                                    color='#F0F0F0' if theme['dark'] else theme.get('subtitle_color', theme['text_color']),
-                                    family='Arial, sans-serif, Segoe UI'
-                                ),
-                                xanchor='center',
-                                yanchor='bottom',
-                                yshift=10,
-                                opacity=0.95
-                            )
-                        ],
-                        height=540,
-                        margin=dict(l=80, r=80, t=90, b=80),  # Margen superior aumentado
-                        font=dict(
-                            size=14,
-                            color=theme['text_color']
-                        ),
-                        showlegend=False,
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        xaxis=dict(
-                            gridcolor=theme['grid_color'],
-                            linecolor=theme.get('axis_label_color', theme['text_color']),
-                            zerolinecolor=theme.get('axis_label_color', theme['text_color']),
-                            showgrid=True,
-                            tickfont=dict(
-                                color=theme.get('tick_color', theme['text_color']),
-                                size=12
-                            ),
-                            title_font=dict(
-                                color=theme.get('axis_label_color', theme['text_color']),
-                                size=13
-                            )
-                        ),
-                        yaxis=dict(
-                            gridcolor=theme['grid_color'],
-                            linecolor=theme.get('axis_label_color', theme['text_color']),
-                            zerolinecolor=theme.get('axis_label_color', theme['text_color']),
-                            showgrid=True,
-                            tickformat=',.0f',
-                            tickprefix='€',
-                            tickfont=dict(
-                                color=theme.get('tick_color', theme['text_color']),
-                                size=12
-                            ),
-                            title_font=dict(
-                                color=theme.get('axis_label_color', theme['text_color']),
-                                size=13
-                            )
-                        ),
-                        hoverlabel=dict(
-                            bgcolor=hover_bg,
-                            bordercolor=hover_border,
-                            font=dict(color=hover_text_color, size=12, family="sans-serif"),
-                            align="left"
-                        ),
-                        # Forzar estilos de tooltip
-                        hoverlabel_font_color=hover_text_color,
-                        hoverlabel_bgcolor=hover_bg,
-                        hoverlabel_bordercolor=hover_border,
-                        # Configuración adicional para tooltips
-                        hoverlabel_namelength=-1,  # Mostrar el nombre completo
-                        # Estilos para el contenedor del tooltip
-                        hoverlabel_align='left',
-                        # Asegurar que el tema oscuro se aplique correctamente
-                        template='plotly_dark' if theme['dark'] else 'plotly'
-                    )
-                    
-                    fig_capital.update_xaxes(title_text="Año", tickfont=dict(size=12))
-                    fig_capital.update_yaxes(title_text="Capital Pendiente (€)", tickfont=dict(size=12))
-                    
-                    # Configuración responsive para el gráfico de capital
-                    fig_capital.update_layout(
-                        autosize=True,
-                        font=dict(size=12)
-                    )
-                    # Habilitar automargin para ejes
-                    fig_capital.update_xaxes(automargin=True)
-                    fig_capital.update_yaxes(automargin=True)
-                    st.plotly_chart(
-                        fig_capital, 
-                        use_container_width=True,
-                        config={
-                            'displayModeBar': True,
-                            'responsive': True,
-                            'displaylogo': False,
-                            'modeBarButtonsToRemove': ['select2d', 'lasso2d', 'select'],
-                            'staticPlot': False
-                        }
-                    )
-                    
-                    st.markdown("""
-                    **📊 ¿Qué muestra este gráfico?**
-                    - La línea azul representa tu deuda restante cada año
-                    - El área sombreada muestra la magnitud de la deuda
-                    - Al final del plazo, la deuda llega a cero
-                    
-                    **💡 Información clave:**
-                    - Los primeros años se reduce más lentamente (pagas más intereses)
-                    - Los últimos años se reduce más rápido (pagas más capital)
-                    """)
-                
-                with tab2:
-                    theme = get_chart_theme()
-                    subtitle_color = theme.get('subtitle_color', theme['text_color'])
-                    # Configuración de colores para tooltips
-                    if theme.get('dark'):
-                        hover_bg = 'rgba(255, 255, 255, 0.96)'  # Fondo blanco para mejor contraste
-                        hover_border = 'rgba(100, 116, 139, 0.5)'
-                        hover_text_color = '#1A1A1A'  # Texto oscuro para mejor legibilidad
-                    else:
-                        hover_bg = color_with_alpha(theme.get('secondary_bg', '#F0F2F6'), 0.96)
-                        hover_border = color_with_alpha(theme.get('axis_label_color', theme['text_color']), 0.3)
-                        hover_text_color = theme.get('text_color', '#1A1A1A')
-                    tooltip_color = hover_text_color
-                    fig_pagos = go.Figure()
-                    
-                    fig_pagos.add_trace(
-                        go.Bar(
-                            x=df_evolucion["Año"],
-                            y=df_evolucion["Capital Anual"],
-                            name='Capital Amortizado',
-                            marker_color=theme['colors'][2],
-                            hovertemplate=(
-                                f"<b style='color:{tooltip_color}'>Año %{{x}}</b><br>"
-                                f"<span style='color:{tooltip_color}'>Capital: %{{y:,.2f}} €</span><extra></extra>"
-                            )
-                        )
-                    )
-                    
-                    fig_pagos.add_trace(
-                        go.Bar(
-                            x=df_evolucion["Año"],
-                            y=df_evolucion["Intereses Anuales"],
-                            name='Intereses Pagados',
-                            marker_color=theme['colors'][3],
-                            hovertemplate=(
-                                f"<b style='color:{tooltip_color}'>Año %{{x}}</b><br>"
-                                f"<span style='color:{tooltip_color}'>Intereses: %{{y:,.2f}} €</span><extra></extra>"
-                            )
-                        )
-                    )
-                    
-# No es necesario volver a definir las variables, ya están definidas arriba
-                    
-                    fig_pagos.update_layout(
-                        title={
-                            'text': "<b>Distribución Anual de Pagos</b>",
-                            'x': 0.5,
-                            'xanchor': 'center',
-                            'font': {
-                                'color': theme.get('title_color', theme['text_color']),
-                                'family': 'Arial, sans-serif',
-                                'size': 18
-                            },
-                            'pad': {'b': 10, 't': 20}  # Espaciado interno para el título
-                        },
-                        annotations=[
-                            dict(
-                                x=0.5,
-                                y=1.0,
-                                xref='paper',
-                                yref='paper',
-                                text="Capital vs Intereses por año",
-                                showarrow=False,
-                                font=dict(
-                                    size=14,
-                                    color='#F0F0F0' if theme['dark'] else theme.get('subtitle_color', theme['text_color']),
-                                    family='Arial, sans-serif, Segoe UI'
-                                ),
-                                xanchor='center',
-                                yanchor='bottom',
-                                yshift=10,
-                                opacity=0.95
-                            )
-                        ],
-                        height=520,
-                        barmode='stack',
-                        margin=dict(l=80, r=80, t=100, b=160),  # Margen superior aumentado
-                        font=dict(size=14, color=theme['text_color']),
-                        legend=dict(
-                            orientation="h",
-                            yanchor="top",
-                            y=-0.22,
-                            xanchor="center",
-                            x=0.5,
-                            bgcolor='rgba(0,0,0,0)',
-                            bordercolor='rgba(0,0,0,0)',
-                            borderwidth=0,
-                            font=dict(color=theme['text_color'], size=12),
-                            title=dict(text="")
-                        ),
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        xaxis=dict(
-                            gridcolor=theme['grid_color'],
-                            linecolor=theme.get('axis_label_color', theme['text_color']),
-                            zerolinecolor=theme.get('axis_label_color', theme['text_color']),
-                            showgrid=True,
-                            tickfont=dict(
-                                color=theme.get('tick_color', theme['text_color']),
-                                size=12
-                            ),
-                            title_font=dict(
-                                color=theme.get('axis_label_color', theme['text_color']),
-                                size=13
-                            )
-                        ),
-                        yaxis=dict(
-                            gridcolor=theme['grid_color'],
-                            linecolor=theme.get('axis_label_color', theme['text_color']),
-                            zerolinecolor=theme.get('axis_label_color', theme['text_color']),
-                            showgrid=True,
-                            tickfont=dict(
-                                color=theme.get('tick_color', theme['text_color']),
-                                size=12
-                            ),
-                            title_font=dict(
-                                color=theme.get('axis_label_color', theme['text_color']),
-                                size=13
-                            )
-                        ),
-                        hoverlabel=dict(
-                            bgcolor=hover_bg,
-                            bordercolor=hover_border,
-                            font=dict(color=hover_text_color, size=12, family="sans-serif"),
-                            align="left"
-                        ),
-                        hovermode='x unified',
-                        # Forzar estilos de tooltip
-                        hoverlabel_font_color=hover_text_color,
-                        hoverlabel_bgcolor=hover_bg,
-                        hoverlabel_bordercolor=hover_border,
-                        # Configuración adicional para tooltips
-                        hoverlabel_namelength=-1,  # Mostrar el nombre completo
-                        # Estilos para el contenedor del tooltip
-                        hoverlabel_align='left',
-                        # Asegurar que el tema oscuro se aplique correctamente
-                        template='plotly_dark' if theme['dark'] else 'plotly'
-                    )
-                    
-                    # Configuración de tooltips para las barras
-                    fig_pagos.update_traces(
-                        hoverlabel=dict(
-                            bgcolor=hover_bg,
-                            bordercolor=hover_border,
-                            font=dict(color=hover_text_color, size=12, family="sans-serif"),
-                            align='left',
-                            namelength=0
-                        ),
-                        hovertemplate=(
-                            "<span style='color:%s;'><b>Año %%{x}</b><br>"
-                            "%%{data.name}: %%{y:,.2f} €</span><extra></extra>" % hover_text_color
-                        )
-                    )
-                    fig_pagos.update_xaxes(title_text="Año")
-                    fig_pagos.update_yaxes(title_text="Pago Anual (€)" )
-                    
-                    # Configuración responsive para el gráfico de pagos
-                    fig_pagos.update_layout(
-                        autosize=True,
-                        font=dict(size=12)
-                    )
-                    # Habilitar automargin para ejes
-                    fig_pagos.update_xaxes(automargin=True)
-                    fig_pagos.update_yaxes(automargin=True)
-                    st.plotly_chart(
-                        fig_pagos, 
-                        use_container_width=True,
-                        config={
-                            'displayModeBar': True,
-                            'responsive': True,
-                            'displaylogo': False,
-                            'modeBarButtonsToRemove': ['select2d', 'lasso2d', 'select'],
-                            'staticPlot': False
-                        }
-                    )
-                    
-                    st.markdown("""
-                    **📊 ¿Qué muestra este gráfico?**
-                    - **Barras verdes:** Capital que reduces de tu deuda (dinero "tuyo")
-                    - **Barras rojas:** Intereses que pagas al banco (coste financiero)
-                    - La altura total es tu cuota anual
-                    
-                    **💡 Información clave:**
-                    - Al principio: barras rojas más grandes (pagas más intereses)
-                    - Al final: barras verdes más grandes (pagas más capital)
-                    - Esta es la razón por la que las amortizaciones anticipadas son más efectivas al principio
-                    """)
+                fragmento_evolucion_capital(capital_hipoteca, interes_anual, anos_plazo, cuota_estimada)
                 
             elif tipo_hipoteca == "Mixta":
                 st.info("ℹ️ El gráfico de evolución detallado para hipotecas mixtas no está disponible. "
@@ -3199,313 +2824,99 @@ elif modo == "🏠 Comprobar una vivienda concreta":
             col4.metric("Cuota estimada", "0,00 €")
             st.info("ℹ️ Resumen: No se requiere hipoteca (compra al contado).")
         else:
-            if tipo_hipoteca == "Mixta":
-                interes_variable_total = (euribor + diferencial) if (euribor is not None and diferencial is not None) else None
-                cuota_fijo_total = cuota_prestamo(capital_hipoteca, interes_fijo, anos_plazo) if (capital_hipoteca > 0 and interes_fijo) else 0.0
-                cuota_var_total  = cuota_prestamo(capital_hipoteca, interes_variable_total, anos_plazo) if (capital_hipoteca > 0 and interes_variable_total) else 0.0
-
-                dti_fijo = dti(cuota_fijo_total, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
-                dti_variable = dti(cuota_var_total, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
-                dti_peor = max(dti_fijo, dti_variable)
-                cuota_peor = max(cuota_fijo_total, cuota_var_total)
-                tramo_peor = "FIJO" if cuota_peor == cuota_fijo_total else "VARIABLE"
-
-                col1, col2, col3, col4 = st.columns(4)
-                col1.metric("DTI (peor tramo)", semaforo_dti(dti_peor) if dti_peor > 0 else "No disponible")
-                col2.metric("LTV", pct(ltv_val) if ltv_val > 0 else "No disponible")
-                col3.metric("Cuota máx.", eur(cuota_max) if cuota_max > 0 else "No disponible")
-                col4.metric("Cuota estimada (peor tramo)", eur(cuota_peor) if cuota_peor > 0 else "No disponible")
+            # En Mixta, cuota y DTI son los del peor tramo (los mismos que en el resto de la página)
+            sufijo_tramo = " (peor tramo)" if tipo_hipoteca == "Mixta" else ""
 
-                st.caption(f"Evaluado en tramo: {tramo_peor}")
-                st.caption("DTI = (Cuota hipoteca + otras deudas) / Ingresos netos")
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("DTI" + sufijo_tramo, semaforo_dti(dti_val) if dti_val > 0 else "No disponible")
+            col2.metric("LTV", pct(ltv_val) if ltv_val > 0 else "No disponible")
+            col3.metric("Cuota máx.", eur(cuota_max) if cuota_max > 0 else "No disponible")
+            col4.metric("Cuota estimada" + sufijo_tramo, eur(cuota_estimada) if cuota_estimada > 0 else "No disponible")
 
-                if cuota_peor > 0 and es_viable(cuota_peor, cuota_max, ltv_val, ltv_max, dti_peor):
-                    st.success("✅ Resumen: Operación viable (LTV y DTI dentro de rango).")
-                    if abs(dti_visible(dti_peor) - DTI_FAIL) < 1e-9:
-                        st.info("ℹ️ Estás en el límite exacto del 35 %. Cualquier variación mínima podría hacerla no viable.")
-                else:
-                    if precio <= 0 or sueldo_neto <= 0 or entrada_usuario <= 0 or capital_hipoteca <= 0:
-                        st.warning("⚠️ Resumen no evaluable: faltan parámetros mínimos.")
-                    else:
-                        st.error("❌ Resumen: Operación no viable (supera LTV o DTI).")
+            if tipo_hipoteca == "Mixta" and tramo_peor:
+                st.caption(f"Evaluado en tramo: {tramo_peor}")
+            st.caption("DTI = (Cuota hipoteca + otras deudas) / Ingresos netos")
 
+            if resultado.viable:
+                st.success("✅ Resumen: Operación viable (LTV y DTI dentro de rango).")
+                if abs(dti_visible(dti_val) - DTI_FAIL) < 1e-9:
+                    st.info("ℹ️ Estás en el límite exacto del 35 %. Cualquier variación mínima podría hacerla no viable.")
             else:
-                cuota_dashboard = cuota_estimada or 0.0
-                dti_dashboard = dti_val or 0.0
-
-                col1, col2, col3, col4 = st.columns(4)
-                col1.metric("DTI", semaforo_dti(dti_dashboard) if dti_dashboard > 0 else "No disponible")
-                col2.metric("LTV", pct(ltv_val) if ltv_val > 0 else "No disponible")
-                col3.metric("Cuota máx.", eur(cuota_max) if cuota_max > 0 else "No disponible")
-                col4.metric("Cuota estimada", eur(cuota_dashboard) if cuota_dashboard > 0 else "No disponible")
-
-                st.caption("DTI = (Cuota hipoteca + otras deudas) / Ingresos netos")
-
-                if cuota_dashboard > 0 and es_viable(cuota_dashboard, cuota_max, ltv_val, ltv_max, dti_dashboard):
-                    st.success("✅ Resumen: Operación viable (LTV y DTI dentro de rango).")
-                    if abs(dti_visible(dti_dashboard) - DTI_FAIL) < 1e-9:
-                        st.info("ℹ️ Estás en el límite exacto del 35 %. Cualquier variación mínima podría hacerla no viable.")
+                if precio <= 0 or sueldo_neto <= 0 or entrada_usuario <= 0 or capital_hipoteca <= 0:
+                    st.warning("⚠️ Resumen no evaluable: faltan parámetros mínimos.")
                 else:
-                    if precio <= 0 or sueldo_neto <= 0 or entrada_usuario <= 0 or capital_hipoteca <= 0:
-                        st.warning("⚠️ Resumen no evaluable: faltan parámetros mínimos.")
-                    else:
-                        st.error("❌ Resumen: Operación no viable (supera LTV o DTI).")
+                    st.error("❌ Resumen: Operación no viable (supera LTV o DTI).")
 
 
-# ============================================================
-# 🧪 Validador profesional completo de coherencia hipotecaria
-# ============================================================
-
-MODO_VALIDACION = False           # ⬅️ Actívalo a "True" para ejecutar el validador; "False" para desactivarlo.
-
-if MODO_VALIDACION:
-    import statistics as stats
-    import random
-    
-    st.header("🧪 VALIDACIÓN PROFESIONAL COMPLETA")
-    st.markdown("**Validando coherencia matemática y lógica en todos los escenarios hipotecarios**")
-    
-    # --- Umbrales alineados con la app ---
-    DTI_WARN = 0.30
-    DTI_FAIL = 0.35
-    LTV_MAX = 0.80
-    
-    # --- Funciones de validación ---
-    def validar_escenario(tipo_hipoteca, escenario_id, params):
-        """Valida un escenario específico y devuelve resultados"""
-        errores = []
-        advertencias = []
-        
-        try:
-            # Parámetros básicos
-            precio = params["precio"]
-            entrada = params["entrada"]
-            sueldo = params["sueldo"]
-            deudas = params["deudas"]
-            plazo = params["plazo"]
-            
-            # Cálculos básicos
-            capital_hipoteca = max(0, precio - entrada)
-            ltv_real = (capital_hipoteca / precio) if precio > 0 else 0.0
-            cuota_maxima_user = cuota_maxima(sueldo, deudas, DTI_FAIL)
-            
-            # Validaciones básicas
-            if capital_hipoteca < 0:
-                errores.append("Capital hipoteca negativo")
-            if ltv_real < 0 or ltv_real > 1:
-                errores.append("LTV fuera de rango válido")
-            if cuota_maxima_user < 0:
-                errores.append("Cuota máxima negativa")
-            
-            # Cálculos específicos por tipo
-            if tipo_hipoteca == "Fija":
-                interes = params["interes"]
-                cuota = cuota_prestamo(capital_hipoteca, interes, plazo)
-                dti_calc = dti(cuota, deudas, sueldo) if cuota else 0.0
-                
-                if cuota is None or cuota <= 0:
-                    errores.append("Cuota fija inválida")
-                if dti_calc < 0 or dti_calc > 1:
-                    errores.append("DTI fuera de rango")
-                    
-            elif tipo_hipoteca == "Variable":
-                interes = params["interes"]
-                cuota = cuota_prestamo(capital_hipoteca, interes, plazo)
-                dti_calc = dti(cuota, deudas, sueldo) if cuota else 0.0
-                
-                if cuota is None or cuota <= 0:
-                    errores.append("Cuota variable inválida")
-                if dti_calc < 0 or dti_calc > 1:
-                    errores.append("DTI fuera de rango")
-                    
-            elif tipo_hipoteca == "Mixta":
-                interes_fijo = params["interes_fijo"]
-                interes_var = params["interes_var"]
-                anios_fijo = params.get("anios_fijo", 5)
-                
-                # Para hipotecas mixtas, calculamos la cuota como si fuera el plazo total
-                # pero usando el interés más alto para el peor escenario
-                cuota_fija = cuota_prestamo(capital_hipoteca, interes_fijo, plazo)
-                cuota_variable = cuota_prestamo(capital_hipoteca, interes_var, plazo)
-                
-                dti_fijo = dti(cuota_fija, deudas, sueldo) if cuota_fija else 0.0
-                dti_variable = dti(cuota_variable, deudas, sueldo) if cuota_variable else 0.0
-                
-                # Validaciones específicas mixta
-                if cuota_fija is None or cuota_fija <= 0:
-                    errores.append("Cuota fija inválida en mixta")
-                if cuota_variable is None or cuota_variable <= 0:
-                    errores.append("Cuota variable inválida en mixta")
-                if dti_fijo < 0 or dti_fijo > 1 or dti_variable < 0 or dti_variable > 1:
-                    errores.append("DTI fuera de rango en mixta")
-                    
-                # Coherencia del peor tramo
-                cuota_peor = max(cuota_fija, cuota_variable)
-                tramo_peor = "FIJO" if cuota_peor == cuota_fija else "VARIABLE"
-                
-                if tramo_peor == "FIJO" and cuota_fija < cuota_variable:
-                    advertencias.append("Inconsistencia en identificación peor tramo")
-                
-                cuota = cuota_peor
-                dti_calc = max(dti_fijo, dti_variable)
-            
-            # Validaciones de coherencia general
-            if cuota and cuota > 0:
-                if dti_calc > DTI_FAIL and es_viable(cuota, cuota_maxima_user, ltv_real, LTV_MAX, dti_calc):
-                    advertencias.append("DTI > 35% pero operación marcada como viable")
-                    
-                if ltv_real > LTV_MAX and es_viable(cuota, cuota_maxima_user, ltv_real, LTV_MAX, dti_calc):
-                    advertencias.append("LTV > 80% pero operación marcada como viable")
-            
-            # Validaciones matemáticas
-            if capital_hipoteca > 0 and sueldo > 0:
-                ratio_endeudamiento = (deudas / sueldo) if sueldo > 0 else 0.0
-                if ratio_endeudamiento > DTI_FAIL:
-                    advertencias.append("Ratio de endeudamiento base ya supera 35%")
-        
-        except Exception as e:
-            errores.append(f"Error en cálculo: {str(e)}")
-        
-        return {
-            "escenario_id": escenario_id,
-            "tipo_hipoteca": tipo_hipoteca,
-            "errores": errores,
-            "advertencias": advertencias,
-            "viable": len(errores) == 0,
-            "ltv": ltv_real,
-            "dti": dti_calc if 'dti_calc' in locals() else 0.0,
-            "cuota": cuota if 'cuota' in locals() else 0.0
-        }
-    
-    # --- Escenarios de prueba completos ---
-    escenarios_prueba = [
-        # Hipoteca Fija
-        {"tipo": "Fija", "id": "FJ-01", "precio": 200000, "entrada": 40000, "interes": 0.025, "plazo": 20, "sueldo": 2500, "deudas": 0},
-        {"tipo": "Fija", "id": "FJ-02", "precio": 300000, "entrada": 60000, "interes": 0.035, "plazo": 25, "sueldo": 3000, "deudas": 200},
-        {"tipo": "Fija", "id": "FJ-03", "precio": 150000, "entrada": 30000, "interes": 0.020, "plazo": 15, "sueldo": 2000, "deudas": 100},
-        
-        # Hipoteca Variable
-        {"tipo": "Variable", "id": "VR-01", "precio": 250000, "entrada": 50000, "interes": 0.030, "plazo": 20, "sueldo": 2800, "deudas": 0},
-        {"tipo": "Variable", "id": "VR-02", "precio": 350000, "entrada": 70000, "interes": 0.040, "plazo": 30, "sueldo": 4000, "deudas": 300},
-        {"tipo": "Variable", "id": "VR-03", "precio": 180000, "entrada": 36000, "interes": 0.025, "plazo": 25, "sueldo": 2200, "deudas": 150},
-        
-        # Hipoteca Mixta
-        {"tipo": "Mixta", "id": "MX-01", "precio": 280000, "entrada": 56000, "interes_fijo": 0.025, "interes_var": 0.035, "anios_fijo": 5, "plazo": 25, "sueldo": 3200, "deudas": 100},
-        {"tipo": "Mixta", "id": "MX-02", "precio": 400000, "entrada": 80000, "interes_fijo": 0.030, "interes_var": 0.045, "anios_fijo": 10, "plazo": 30, "sueldo": 4500, "deudas": 200},
-        {"tipo": "Mixta", "id": "MX-03", "precio": 200000, "entrada": 40000, "interes_fijo": 0.022, "interes_var": 0.032, "anios_fijo": 3, "plazo": 20, "sueldo": 2500, "deudas": 0},
-        
-        # Casos límite
-        {"tipo": "Fija", "id": "LM-01", "precio": 100000, "entrada": 20000, "interes": 0.050, "plazo": 30, "sueldo": 1500, "deudas": 100},
-        {"tipo": "Variable", "id": "LM-02", "precio": 500000, "entrada": 100000, "interes": 0.020, "plazo": 15, "sueldo": 6000, "deudas": 500},
-        {"tipo": "Mixta", "id": "LM-03", "precio": 150000, "entrada": 30000, "interes_fijo": 0.015, "interes_var": 0.025, "anios_fijo": 2, "plazo": 10, "sueldo": 1800, "deudas": 50},
-    ]
-    
-    # ============================================================
-    # 🔍 Ejecutar validación completa
-    # ============================================================
-    # --- Ejecutar validación de todos los escenarios ---
-    resultados = []
-    errores_criticos = []
-    advertencias = []
-    
-    for escenario in escenarios_prueba:
-        resultado = validar_escenario(
-            escenario["tipo"], 
-            escenario["id"], 
-            escenario
+# =========================
+# 💾 Guardado del escenario del cliente
+# =========================
+# Al final del script: los resultados que ha usado esta ejecución ya están en la caché compartida
+if st.session_state.pop("_guardar_escenario", False) and ESCENARIOS_ACTIVADOS:
+    try:
+        ALMACEN_ESCENARIOS.guardar(
+            cliente_escenario, nombre_escenario,
+            entradas={k: st.session_state[k] for k in CLAVES_ESCENARIO if k in st.session_state},
+            resultados=CACHE_RESULTADOS.exportar(claves_registradas()),
+            region=ccaa, modo=modo, sello=SELLO_RESULTADOS,
         )
-        resultados.append(resultado)
-        
-        if resultado["errores"]:
-            errores_criticos.extend([
-                f"{resultado['escenario_id']}: {error}" 
-                for error in resultado["errores"]
-            ])
-        
-        if resultado["advertencias"]:
-            advertencias.extend([
-                f"{resultado['escenario_id']}: {warning}" 
-                for warning in resultado["advertencias"]
-            ])
-    
-    # --- Métricas generales ---
-    total_escenarios = len(resultados)
-    escenarios_exitosos = sum(1 for r in resultados if r["viable"])
-    tasa_exito = (escenarios_exitosos / total_escenarios * 100) if total_escenarios > 0 else 0
-    
-    # --- Resumen por tipo de hipoteca ---
-    fijas = [r for r in resultados if r["tipo_hipoteca"] == "Fija"]
-    variables = [r for r in resultados if r["tipo_hipoteca"] == "Variable"]
-    mixtas = [r for r in resultados if r["tipo_hipoteca"] == "Mixta"]
-    
-    st.subheader("📊 Métricas generales")
-    col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Escenarios probados", total_escenarios)
-    col2.metric("Errores críticos", len(errores_criticos))
-    col3.metric("Advertencias", len(advertencias))
-    col4.metric("Tasa éxito", f"{tasa_exito:.1f}%")
-    
-    # --- Veredicto final ---
-    if not errores_criticos and not advertencias:
-        st.success("✅ **VEREDICTO: Todo correcto** - La calculadora funciona perfectamente en todos los escenarios")
-    elif errores_criticos:
-        st.error(f"❌ **VEREDICTO: Problemas detectados** - {len(errores_criticos)} errores críticos encontrados")
-    else:
-        st.warning(f"⚠️ **VEREDICTO: Precaución** - {len(advertencias)} advertencias encontradas")
-    
-    # --- Detalles por tipo ---
-    st.subheader("📈 Resumen por tipo de hipoteca")
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.markdown("**🟦 Hipoteca Fija**")
-        st.write(f"Escenarios: {len(fijas)}")
-        st.write(f"Éxitos: {sum(1 for r in fijas if r['viable'])}")
-        st.write(f"Errores: {sum(len(r['errores']) for r in fijas)}")
-    
-    with col2:
-        st.markdown("**🟧 Hipoteca Variable**")
-        st.write(f"Escenarios: {len(variables)}")
-        st.write(f"Éxitos: {sum(1 for r in variables if r['viable'])}")
-        st.write(f"Errores: {sum(len(r['errores']) for r in variables)}")
-    
-    with col3:
-        st.markdown("**🟩 Hipoteca Mixta**")
-        st.write(f"Escenarios: {len(mixtas)}")
-        st.write(f"Éxitos: {sum(1 for r in mixtas if r['viable'])}")
-        st.write(f"Errores: {sum(len(r['errores']) for r in mixtas)}")
-    
-    # --- Detalles de errores y advertencias ---
-    if errores_criticos:
-        st.subheader("❌ Errores críticos detectados")
-        for error in errores_criticos:
-            st.error(error)
-    
-    if advertencias:
-        st.subheader("⚠️ Advertencias detectadas")
-        for warning in advertencias:
-            st.warning(warning)
-    
-    # --- Detalles de escenarios ---
-    with st.expander("📋 Ver detalles de todos los escenarios"):
-        for resultado in resultados:
-            st.markdown(f"**{resultado['escenario_id']} - {resultado['tipo_hipoteca']}**")
-            col1, col2, col3, col4 = st.columns(4)
-            col1.write(f"LTV: {pct(resultado['ltv'])}")
-            col2.write(f"DTI: {pct(resultado['dti'])}")
-            col3.write(f"Cuota: {eur(resultado['cuota'])}")
-            col4.write(f"Estado: {'✅ OK' if resultado['viable'] else '❌ Error'}")
-            
-            if resultado['errores']:
-                st.error("Errores: " + ", ".join(resultado['errores']))
-            if resultado['advertencias']:
-                st.warning("Advertencias: " + ", ".join(resultado['advertencias']))
-
+        st.toast(f"💾 Escenario «{nombre_escenario}» guardado para {cliente_escenario}", icon="✅")
+    except sqlite3.Error as error:
+        st.toast(f"No se pudo guardar el escenario: {error}", icon="⚠️")
 
 
+# =========================
+# 🔗 Estado actual en la URL
+# =========================
+# La barra de direcciones siempre lleva el escenario actual: copiarla basta para compartirlo
+_codigo_actual = codificar_estado(
+    {clave: st.session_state.get(clave, DEFAULTS.get(clave)) for clave in CLAVES_ESCENARIO}, OPCIONES_URL
+)
+if _query_params.get("e") != _codigo_actual:
+    _query_params["e"] = _codigo_actual
+st.session_state["_estado_url"] = _codigo_actual
 
 
+# =========================
+# 🩺 Diagnóstico de memoria por sesión (?diagnostico=1)
+# =========================
+def huella_sesion():
+    """Devuelve un DataFrame con los bytes que ocupa cada clave de st.session_state."""
+    estado = st.session_state.to_dict()
+    filas = [{"Clave": str(k), "Bytes": tamano_profundo(v)} for k, v in estado.items()]
+    return pd.DataFrame(filas, columns=["Clave", "Bytes"]).sort_values("Bytes", ascending=False)
+
+
+if "diagnostico" in _query_params:
+    with st.sidebar.expander("🩺 Diagnóstico de sesión", expanded=True):
+        df_huella = huella_sesion()
+        st.metric("Memoria en sesión", f"{int(df_huella['Bytes'].sum()):,} bytes".replace(",", "."))
+        st.caption(f"{len(df_huella)} claves en st.session_state. Los resultados calculados viven en la caché compartida del proceso.")
+        st.dataframe(df_huella, hide_index=True, width="stretch")
+
+        metricas_cache = CACHE_RESULTADOS.metricas()
+        st.markdown("**🗄️ Caché compartida del proceso**")
+        c1, c2 = st.columns(2)
+        c1.metric("Tasa de aciertos", pct(metricas_cache["tasa_aciertos"]))
+        c2.metric("Entradas", metricas_cache["entradas"])
+        st.caption(
+            f"{metricas_cache['bytes_usados'] / 1_048_576:.1f} MB de {metricas_cache['max_bytes'] / 1_048_576:.0f} MB · "
+            f"{metricas_cache['aciertos']} aciertos · {metricas_cache['fallos']} fallos · "
+            f"{metricas_cache['expulsiones']} expulsiones"
+        )
+        metricas_precalculo = PRECALCULO.metricas()
+        st.caption(
+            f"Precálculo en segundo plano: {metricas_precalculo['lanzadas']} tareas lanzadas · "
+            f"{metricas_precalculo['canceladas']} canceladas por cambios de entrada"
+        )
 
+        if BYTES_GRAFICOS:
+            st.markdown("**📦 Gráficos enviados en esta ejecución**")
+            st.dataframe(
+                pd.DataFrame(BYTES_GRAFICOS.items(), columns=["Gráfico", "Bytes"]).sort_values("Bytes", ascending=False),
+                hide_index=True, width="stretch",
+            )
+            st.caption(f"{sum(BYTES_GRAFICOS.values()):,} bytes en {len(BYTES_GRAFICOS)} gráficos".replace(",", "."))
 
 
 # =========================
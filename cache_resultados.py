@@ -0,0 +1,284 @@
+# ============================================================
+# 🗄️ Caché de resultados compartida entre sesiones
+# ============================================================
+# Streamlit vuelve a ejecutar app.py en cada interacción, pero los módulos importados
+# se cargan una sola vez por proceso. Por eso la caché vive aquí: todas las sesiones
+# (y todos sus hilos) comparten los mismos resultados y las mismas figuras serializadas.
+
+import functools
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+
+def tamano_profundo(obj, _vistos=None):
+    """Bytes aproximados de un objeto incluyendo su contenido (dicts, listas, DataFrames...)."""
+    if _vistos is None:
+        _vistos = set()
+    if id(obj) in _vistos:
+        return 0
+    _vistos.add(id(obj))
+
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        uso = obj.memory_usage(deep=True)
+        return int(uso.sum()) if isinstance(obj, pd.DataFrame) else int(uso)
+
+    tamano = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        tamano += sum(tamano_profundo(k, _vistos) + tamano_profundo(v, _vistos) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        tamano += sum(tamano_profundo(v, _vistos) for v in obj)
+    return tamano
+
+
+def congelar(valor):
+    """Convierte argumentos (dicts, listas, sets) en una clave hashable y estable."""
+    if isinstance(valor, dict):
+        return tuple(sorted((str(k), congelar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(congelar(v) for v in valor)
+    if isinstance(valor, (set, frozenset)):
+        return tuple(sorted(congelar(v) for v in valor))
+    return valor
+
+
+class CacheLRU:
+    """
+    Caché LRU segura entre hilos, acotada por memoria (bytes) y no por número de entradas.
+    - Si dos sesiones piden a la vez la misma clave, solo una calcula y la otra espera el resultado.
+    - Lleva métricas de aciertos, fallos y expulsiones para medir su eficacia.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()      # clave -> (valor, bytes)
+        self._en_curso = {}              # clave -> threading.Event de quien está calculando
+        self._lock = threading.Lock()
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def obtener(self, clave, defecto=None):
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave][0]
+            self.fallos += 1
+            return defecto
+
+    def guardar(self, clave, valor, tamano=None):
+        tamano = tamano_profundo(valor) if tamano is None else tamano
+        with self._lock:
+            self._guardar_sin_lock(clave, valor, tamano)
+
+    def _guardar_sin_lock(self, clave, valor, tamano):
+        if tamano > self.max_bytes:
+            return  # nunca cabría: no expulsamos toda la caché por un único valor
+        if clave in self._datos:
+            self.bytes_usados -= self._datos.pop(clave)[1]
+        self._datos[clave] = (valor, tamano)
+        self.bytes_usados += tamano
+        while self.bytes_usados > self.max_bytes:
+            _, (_, tamano_expulsado) = self._datos.popitem(last=False)
+            self.bytes_usados -= tamano_expulsado
+            self.expulsiones += 1
+
+    def obtener_o_calcular(self, clave, funcion):
+        """Devuelve el valor cacheado o lo calcula una sola vez aunque lo pidan varias sesiones a la vez."""
+        while True:
+            with self._lock:
+                if clave in self._datos:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return self._datos[clave][0]
+                evento = self._en_curso.get(clave)
+                if evento is None:
+                    self.fallos += 1
+                    evento = threading.Event()
+                    self._en_curso[clave] = evento
+                    break
+            # Otra sesión ya lo está calculando: esperamos y volvemos a mirar
+            evento.wait()
+
+        try:
+            valor = funcion()
+            tamano = tamano_profundo(valor)
+            with self._lock:
+                self._guardar_sin_lock(clave, valor, tamano)
+            return valor
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+            evento.set()
+
+    def exportar(self, claves):
+        """Pares (clave, valor) de las claves que siguen en la caché, sin contar aciertos ni reordenar."""
+        with self._lock:
+            return [(clave, self._datos[clave][0]) for clave in dict.fromkeys(claves) if clave in self._datos]
+
+    def importar(self, pares):
+        """Vuelve a sembrar la caché con pares (clave, valor) exportados antes (p. ej. de un escenario guardado)."""
+        for clave, valor in pares:
+            self.guardar(clave, valor)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self.bytes_usados = 0
+
+    def metricas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "bytes_usados": self.bytes_usados,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+                "tasa_aciertos": (self.aciertos / consultas) if consultas else 0.0,
+            }
+
+
+# =========================
+# Registro de claves consultadas por ejecución
+# =========================
+# Cada ejecución del script de Streamlit corre en su propio hilo: el registro es local al hilo
+# y permite saber qué resultados ha usado la ejecución actual (para guardarlos con el escenario).
+_REGISTRO = threading.local()
+
+
+def iniciar_registro():
+    """Empieza a anotar las claves que consulta el hilo actual a través de funciones @cacheado."""
+    _REGISTRO.claves = []
+
+
+def claves_registradas():
+    return list(getattr(_REGISTRO, "claves", None) or [])
+
+
+def con_registro_actual(tarea):
+    """
+    Envuelve `tarea` para ejecutarla en otro hilo anotando sus claves en el registro del hilo que la
+    lanza: así los resultados calculados en los pools también se guardan con el escenario.
+    """
+    claves = getattr(_REGISTRO, "claves", None)
+
+    def envoltura():
+        anterior = getattr(_REGISTRO, "claves", None)
+        _REGISTRO.claves = claves
+        try:
+            return tarea()
+        finally:
+            _REGISTRO.claves = anterior
+
+    return envoltura
+
+
+def cacheado(cache, nombre=None):
+    """
+    Decorador: guarda el resultado de la función en `cache` con clave = nombre + argumentos.
+    La clave usa el nombre y no la identidad de la función, porque app.py redefine sus
+    funciones en cada ejecución del script.
+    """
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__qualname__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            clave = (etiqueta, congelar(args), congelar(kwargs))
+            registro = getattr(_REGISTRO, "claves", None)
+            if registro is not None:
+                registro.append(clave)
+            return cache.obtener_o_calcular(clave, lambda: funcion(*args, **kwargs))
+
+        return envoltura
+
+    return decorador
+
+
+# Versión de lo que calculan las funciones @cacheado (motor y figuras). Las claves solo llevan nombre y
+# argumentos: al cambiar un cálculo hay que subirla para que no se reutilicen resultados guardados antes.
+VERSION_RESULTADOS = 2
+
+# Caché única del proceso: resultados del motor y figuras Plotly ya serializadas (JSON)
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_RESULTADOS = CacheLRU(max_bytes=CACHE_MAX_BYTES)
+
+
+# =========================
+# Precálculo en segundo plano
+# =========================
+def _sin_resultado(tarea):
+    """Ejecuta `tarea` descartando lo que devuelve (para que el futuro no retenga el resultado)."""
+    def envoltura():
+        tarea()
+
+    return envoltura
+
+
+class Precalculo:
+    """
+    Pool de hilos que calienta la caché con resultados que la página pedirá más abajo (o en la
+    siguiente interacción) mientras el script sigue pintando lo anterior.
+    - Cada sesión guarda su tanda como (clave de entradas, futuros). Si las entradas no han cambiado
+      no se relanza nada; si han cambiado se cancelan las tareas de la tanda anterior que aún no han
+      empezado (las que ya corren terminan y dejan su resultado en la caché, que sigue siendo válido).
+    - Las tareas solo deben llamar a funciones @cacheado: si la página pide la misma clave mientras
+      se calcula, obtener_o_calcular espera a ese cálculo en lugar de repetirlo.
+    - Un fallo en segundo plano se ignora: la página recalculará en su hilo y mostrará el error allí.
+    - Las tareas no devuelven nada: su resultado vive solo en la caché (acotada por bytes) y los futuros
+      que guarda la sesión, vacíos, sirven únicamente para cancelarlos.
+    """
+
+    def __init__(self, max_hilos):
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="precalculo")
+        self._lock = threading.Lock()
+        self.lanzadas = 0
+        self.canceladas = 0
+
+    def renovar(self, tanda, clave, tareas):
+        """Devuelve la tanda vigente para `clave`: la misma si no ha cambiado o una nueva con `tareas` (callables)."""
+        if tanda is not None and tanda[0] == clave:
+            return tanda
+        canceladas = sum(futuro.cancel() for futuro in tanda[1]) if tanda is not None else 0
+        futuros = [self._pool.submit(con_registro_actual(_sin_resultado(tarea))) for tarea in tareas]
+        with self._lock:
+            self.lanzadas += len(futuros)
+            self.canceladas += canceladas
+        return clave, futuros
+
+    def metricas(self):
+        with self._lock:
+            return {"lanzadas": self.lanzadas, "canceladas": self.canceladas}
+
+
+# Pool único del proceso: pocas tareas cortas, sobre todo Plotly y pandas (el GIL limita el paralelismo)
+PRECALCULO_HILOS = 2
+PRECALCULO = Precalculo(max_hilos=PRECALCULO_HILOS)
+
+
+# =========================
+# Construcción en paralelo
+# =========================
+# Pool aparte del precálculo: aquí la página espera el resultado, no debe quedar detrás de una tanda
+HILOS_PARALELO = min(4, os.cpu_count() or 1)
+_POOL_PARALELO = ThreadPoolExecutor(max_workers=HILOS_PARALELO, thread_name_prefix="paralelo")
+
+
+def en_paralelo(tareas):
+    """
+    Ejecuta a la vez tareas independientes (nombre → callable sin argumentos) y devuelve nombre → resultado
+    cuando han terminado todas; si alguna falla, su excepción se relanza aquí. El GIL solo deja solapar lo
+    que suelta el intérprete (NumPy, E/S): con Plotly, que es casi todo Python, la ganancia viene sobre todo
+    de los aciertos de caché y de no esperar en serie a lo que ya calcula el precálculo.
+    Las claves que consultan las tareas se anotan en el registro del hilo que llama.
+    """
+    futuros = {nombre: _POOL_PARALELO.submit(con_registro_actual(tarea)) for nombre, tarea in tareas.items()}
+    return {nombre: futuro.result() for nombre, futuro in futuros.items()}
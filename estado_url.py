@@ -0,0 +1,132 @@
+# ============================================================
+# 🔗 Estado de la calculadora codificado en la URL (?e=...)
+# ============================================================
+# Todos los datos de la barra lateral se empaquetan en una estructura binaria fija (struct),
+# con un byte de versión delante y una suma de control detrás, y se codifican en base64 apto
+# para URL. Un enlace compartido restaura la sesión completa en un solo paso: como los valores
+# son idénticos a los del remitente, los cálculos salen directamente de la caché compartida.
+
+import base64
+import binascii
+import struct
+import zlib
+
+VERSION_ACTUAL = 2
+
+# (clave de st.session_state, formato struct, codificación, rango (mínimo, máximo) del widget o None)
+# - opcion: índice dentro de la lista de opciones del widget
+# - entero: valor entero tal cual
+# - centimos: importe en € guardado en céntimos (sin signo)
+# - centesimas: porcentaje guardado en centésimas (con signo: el Euríbor puede ser negativo)
+# El rango repite los límites del widget en app.py: un valor fuera de él (enlace manipulado o de una
+# versión con otros límites) haría fallar al widget, así que el enlace entero se da por no válido.
+CAMPOS = {
+    1: [
+        ("modo", "B", "opcion", None),
+        ("ccaa", "B", "opcion", None),
+        ("estado_vivienda", "B", "opcion", None),
+        ("uso_vivienda", "B", "opcion", None),
+        ("perfil_fiscal", "B", "opcion", None),
+        ("tipo_hipoteca", "B", "opcion", None),
+        ("edad", "B", "entero", (18, 75)),
+        ("ratio_dti", "B", "entero", (20, 50)),
+        ("ltv", "B", "entero", (50, 100)),
+        ("plazo", "B", "entero", (5, 40)),
+        ("anios_fijo", "B", "entero", (1, 30)),
+        ("financiar_comision", "?", "bool", None),
+        ("usar_manual", "?", "bool", None),
+        ("sueldo", "I", "centimos", None),
+        ("deudas", "I", "centimos", None),
+        ("entrada", "I", "centimos", None),
+        ("precio_comp", "I", "centimos", None),
+        ("notario", "I", "centimos", None),
+        ("registro", "I", "centimos", None),
+        ("gestoria", "I", "centimos", None),
+        ("tasacion", "I", "centimos", None),
+        ("seguro_inicial", "I", "centimos", None),
+        ("interes_fijo", "h", "centesimas", (0, 10)),
+        ("euribor", "h", "centesimas", (-2, 10)),
+        ("diferencial", "h", "centesimas", (0, 5)),
+        ("interes_fijo_mixta", "h", "centesimas", (0, 10)),
+        ("euribor_mixta", "h", "centesimas", (-2, 10)),
+        ("diferencial_mixta", "h", "centesimas", (0, 5)),
+        ("com_apertura", "h", "centesimas", (0, 5)),
+        ("iva_itp", "h", "centesimas", (0, 20)),
+        ("ajd", "h", "centesimas", (0, 2)),
+    ],
+}
+# v2: revisión, suelo y techo de la hipoteca variable (los enlaces v1 se siguen abriendo con sus valores por defecto)
+CAMPOS[2] = CAMPOS[1] + [
+    ("revision_variable", "B", "opcion", None),
+    ("suelo_variable", "h", "centesimas", (0, 10)),
+    ("techo_variable", "h", "centesimas", (0, 20)),
+]
+
+_LIMITES = {"B": (0, 255), "I": (0, 2**32 - 1), "h": (-(2**15), 2**15 - 1)}
+_ESTRUCTURAS = {version: struct.Struct("<" + "".join(f for _, f, _, _ in campos)) for version, campos in CAMPOS.items()}
+_CABECERA = struct.Struct("<B")
+_CONTROL = struct.Struct("<H")
+
+
+def _suma_control(datos):
+    return zlib.crc32(datos) & 0xFFFF
+
+
+def _empaquetar_valor(valor, formato, codificacion, opciones):
+    if codificacion == "opcion":
+        return opciones.index(valor) if valor in opciones else 0
+    if codificacion == "bool":
+        return bool(valor)
+    escala = {"entero": 1, "centimos": 100, "centesimas": 100}[codificacion]
+    minimo, maximo = _LIMITES[formato]
+    return min(max(round(float(valor or 0) * escala), minimo), maximo)
+
+
+def _desempaquetar_valor(valor, codificacion, opciones):
+    if codificacion == "opcion":
+        return opciones[valor] if valor < len(opciones) else None
+    if codificacion == "bool":
+        return bool(valor)
+    if codificacion == "entero":
+        return int(valor)
+    return round(valor / 100, 2)
+
+
+def codificar_estado(estado, opciones, version=VERSION_ACTUAL):
+    """
+    Texto base64 (sin relleno) con los valores de `estado`. `opciones` da, por clave de tipo opción,
+    la lista de valores del widget. Los importes se redondean al céntimo y los porcentajes a la centésima.
+    """
+    valores = [
+        _empaquetar_valor(estado.get(clave), formato, codificacion, opciones.get(clave, []))
+        for clave, formato, codificacion, _ in CAMPOS[version]
+    ]
+    datos = _CABECERA.pack(version) + _ESTRUCTURAS[version].pack(*valores)
+    datos += _CONTROL.pack(_suma_control(datos))
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode("ascii")
+
+
+def decodificar_estado(codigo, opciones):
+    """
+    Dict clave → valor listo para st.session_state, o None si el código no es válido (versión, longitud,
+    control o algún valor fuera del rango de su widget).
+    """
+    try:
+        datos = base64.urlsafe_b64decode(codigo + "=" * (-len(codigo) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if len(datos) < _CABECERA.size + _CONTROL.size:
+        return None
+    cuerpo, (control,) = datos[:-_CONTROL.size], _CONTROL.unpack(datos[-_CONTROL.size:])
+    (version,) = _CABECERA.unpack_from(cuerpo)
+    estructura = _ESTRUCTURAS.get(version)
+    if estructura is None or len(cuerpo) != _CABECERA.size + estructura.size or control != _suma_control(cuerpo):
+        return None
+
+    estado = {}
+    for (clave, _, codificacion, rango), valor in zip(CAMPOS[version], estructura.unpack_from(cuerpo, _CABECERA.size)):
+        valor = _desempaquetar_valor(valor, codificacion, opciones.get(clave, []))
+        if valor is None or (rango is not None and not rango[0] <= valor <= rango[1]):
+            return None
+        estado[clave] = valor
+    return estado
@@ -0,0 +1,55 @@
+# ============================================================
+# 📈 Serie histórica del Euríbor a 12 meses
+# ============================================================
+# datos/euribor_12m.csv trae la media mensual aproximada del Euríbor a 12 meses (en %, dos
+# decimales) desde su creación en 1999. Al importar el módulo se carga en dos arrays (meses y
+# valores en tanto por uno) que usan el test de estrés de carteras y el backtest histórico.
+# Para actualizarla basta con añadir filas al CSV: los episodios se definen por fecha.
+
+import csv
+import os
+
+import numpy as np
+
+RUTA_EURIBOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "euribor_12m.csv")
+
+# Subidas históricas que se usan como trayectorias de estrés: nombre → mes de inicio
+EPISODIOS_HISTORICOS = {
+    "2005-2008": "2005-09",   # de 2,2 % a 5,4 % antes de la crisis financiera
+    "2010-2011": "2010-03",   # repunte de 2011
+    "2022-2023": "2021-12",   # de −0,5 % a 4,2 % en menos de dos años
+}
+
+
+def cargar_euribor(ruta=RUTA_EURIBOR):
+    """(meses 'AAAA-MM', valores en tanto por uno) ordenados por fecha."""
+    with open(ruta, encoding="utf-8", newline="") as f:
+        filas = sorted((fila["fecha"], float(fila["euribor_12m"]) / 100) for fila in csv.DictReader(f))
+    meses, valores = zip(*filas)
+    return np.array(meses), np.array(valores)
+
+
+MESES_EURIBOR, VALORES_EURIBOR = cargar_euribor()
+
+
+def indice_mes(mes):
+    """Posición de 'AAAA-MM' en la serie."""
+    posicion = int(np.searchsorted(MESES_EURIBOR, mes))
+    if posicion >= len(MESES_EURIBOR) or MESES_EURIBOR[posicion] != mes:
+        raise KeyError(f"Mes fuera de la serie del Euríbor: {mes}")
+    return posicion
+
+
+def euribor_actual():
+    """Último valor publicado en la serie (tanto por uno)."""
+    return float(VALORES_EURIBOR[-1])
+
+
+def trayectoria_historica(nombre, meses):
+    """
+    Variación del Euríbor respecto al mes de inicio del episodio durante `meses` meses
+    (si la serie se acaba antes, se mantiene el último valor).
+    """
+    inicio = indice_mes(EPISODIOS_HISTORICOS[nombre])
+    posiciones = np.minimum(inicio + np.arange(meses), len(VALORES_EURIBOR) - 1)
+    return VALORES_EURIBOR[posiciones] - VALORES_EURIBOR[inicio]
@@ -0,0 +1 @@
+# Herramientas de línea de comandos (validación, lotes, perfiles...) que reutilizan el motor de la app.
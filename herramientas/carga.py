@@ -0,0 +1,423 @@
+# ============================================================
+# 🏋️ Prueba de carga: cientos de sesiones simultáneas contra un servidor de Streamlit local
+# ============================================================
+# Arranca `streamlit run app.py` en localhost (o usa uno ya arrancado con --url) y abre una
+# conexión websocket por sesión simulada, hablando el mismo protocolo que el navegador
+# (BackMsg/ForwardMsg de streamlit.proto). Cada sesión sigue un recorrido realista: cambia de
+# modo, edita la barra lateral y prueba la amortización anticipada (re-ejecuciones de fragmento).
+#
+# No se usa streamlit.testing.v1.AppTest: cada AppTest sustituye el Runtime global y parchea la
+# configuración del proceso, así que no admite varias sesiones concurrentes en el mismo proceso.
+# Con el servidor real todas las sesiones comparten proceso y caché de resultados, como en producción.
+#
+# Uso (necesita `websockets`, incluido en requirements-dev.txt):
+#   pip install -r requirements-dev.txt
+#   python -m herramientas.carga --sesiones 200 --rampa 10 --pasos 8 --semilla 42
+# Informa de los percentiles de latencia por tipo de re-ejecución, los KB recibidos, la CPU del
+# servidor y su memoria: la de la caché compartida y la de cada sesión conectada, por separado
+# (con una segunda ola de las mismas sesiones cuando la caché ya está caliente).
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from cache_resultados import CACHE_MAX_BYTES
+
+RUTA_APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PERCENTILES = [50, 90, 95, 99]
+MODOS = ["🔎 Descubrir mi precio máximo", "🏠 Comprobar una vivienda concreta"]
+
+# Widgets que edita el recorrido, por clave → (tipo de valor del WidgetState, generador)
+EDICIONES_BARRA_LATERAL = {
+    "sueldo": ("double_value", lambda rng: float(rng.randrange(1_200, 8_000, 100))),
+    "entrada": ("double_value", lambda rng: float(rng.randrange(10_000, 150_000, 5_000))),
+    "deudas": ("double_value", lambda rng: float(rng.choice([0, 150, 300, 600]))),
+    "plazo": ("double_array_value", lambda rng: [float(rng.randint(15, 35))]),
+    "tipo_hipoteca": ("opcion", None),
+    "ccaa": ("opcion", None),
+    "interes": ("double_value", lambda rng: round(rng.uniform(1.0, 5.0), 1)),
+}
+CLAVE_INTERES = {"Fija": "interes_fijo", "Variable": "euribor", "Mixta": "interes_fijo_mixta"}
+
+
+# =========================
+# Métricas del servidor (Linux, /proc)
+# =========================
+def cpu_proceso(pid):
+    """Segundos de CPU (usuario + sistema) consumidos por el proceso, o None si no hay /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        return (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def memoria_rss(pid):
+    """Memoria residente del proceso en bytes, o None si no hay /proc."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrancar_servidor(puerto, timeout=60):
+    """Lanza `streamlit run app.py` sin navegador en localhost y espera a que responda el health check."""
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", RUTA_APP,
+         "--server.headless", "true", "--server.address", "127.0.0.1", "--server.port", str(puerto),
+         "--server.enableXsrfProtection", "false", "--browser.gatherUsageStats", "false",
+         "--server.fileWatcherType", "none", "--logger.level", "error"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor de Streamlit terminó al arrancar (código {proceso.returncode}).")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{puerto}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return proceso
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError("El servidor de Streamlit no respondió a tiempo.")
+
+
+# =========================
+# Sesión simulada (cliente websocket)
+# =========================
+class SesionSimulada:
+    """
+    Un navegador mínimo: recuerda los widgets renderizados (por clave, o por etiqueta si no tienen)
+    y envía en cada re-ejecución el estado de todos los que ha tocado, como hace el frontend.
+    """
+
+    def __init__(self, ws, rng, timeout):
+        self.ws = ws
+        self.rng = rng
+        self.timeout = timeout
+        self.widgets = {}  # clave o etiqueta → (id, tipo de elemento, proto, fragment_id)
+        self.valores = {}  # clave o etiqueta → (tipo de valor, valor)
+        self.query_string = ""  # la app escribe su estado en la URL (?e=...) y el navegador lo reenvía
+        self.mediciones = []  # (tipo, segundos, bytes recibidos, excepciones)
+        self.errores = []  # (tipo de re-ejecución, mensaje de la excepción mostrada por la app)
+
+    def _registrar(self, delta):
+        elemento = delta.new_element
+        tipo = elemento.WhichOneof("type")
+        proto = getattr(elemento, tipo, None) if tipo else None
+        widget_id = getattr(proto, "id", "")
+        if not widget_id.startswith("$$ID-"):
+            return
+        clave = widget_id.split("-", 2)[2]
+        if clave == "None":
+            clave = getattr(proto, "label", None)
+            if not clave:
+                return  # gráficos y otros elementos con id propio, no editables
+        self.widgets[clave] = (widget_id, tipo, proto, delta.fragment_id)
+
+    async def ejecutar(self, tipo, fragment_id=""):
+        """Envía un rerun_script y espera al script_finished; registra latencia, bytes y excepciones."""
+        mensaje = BackMsg()
+        cliente = mensaje.rerun_script
+        cliente.query_string = self.query_string
+        cliente.page_script_hash = ""
+        cliente.fragment_id = fragment_id
+        for clave, (tipo_valor, valor) in self.valores.items():
+            if clave not in self.widgets:
+                continue
+            estado = cliente.widget_states.widgets.add()
+            estado.id = self.widgets[clave][0]
+            if tipo_valor == "double_array_value":
+                estado.double_array_value.data.extend(valor)
+            else:
+                setattr(estado, tipo_valor, valor)
+
+        inicio = time.perf_counter()
+        recibidos = excepciones = 0
+        await self.ws.send(mensaje.SerializeToString())
+        while True:
+            datos = await asyncio.wait_for(self.ws.recv(), self.timeout)
+            recibidos += len(datos)
+            respuesta = ForwardMsg()
+            respuesta.ParseFromString(datos)
+            tipo_respuesta = respuesta.WhichOneof("type")
+            if tipo_respuesta == "delta" and respuesta.delta.WhichOneof("type") == "new_element":
+                if respuesta.delta.new_element.WhichOneof("type") == "exception":
+                    excepcion = respuesta.delta.new_element.exception
+                    self.errores.append((tipo, f"{excepcion.type}: {excepcion.message}"))
+                    excepciones += 1
+                self._registrar(respuesta.delta)
+            elif tipo_respuesta == "page_info_changed":
+                self.query_string = respuesta.page_info_changed.query_string
+            elif tipo_respuesta == "script_finished" and respuesta.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+        self.mediciones.append((tipo, time.perf_counter() - inicio, recibidos, excepciones))
+        return excepciones
+
+    def fijar(self, clave, tipo_valor, valor):
+        """Cambia el valor de un widget; devuelve su fragment_id (vacío si no está en un fragmento)."""
+        if tipo_valor == "opcion":
+            tipo_valor = "string_value"
+        self.valores[clave] = (tipo_valor, valor)
+        return self.widgets[clave][3]
+
+    def opcion(self, clave):
+        """Opción elegida en un radio/selectbox (la del usuario o la inicial del widget)."""
+        if clave in self.valores:
+            return self.valores[clave][1]
+        proto = self.widgets[clave][2]
+        return proto.options[proto.default] if proto.HasField("default") else proto.options[0]
+
+    # ---- Recorridos de usuario ----
+    def _editar_barra_lateral(self):
+        """Una edición típica de la barra lateral: un único widget cada vez, como haría una persona."""
+        campo = self.rng.choice(list(EDICIONES_BARRA_LATERAL))
+        tipo_valor, generador = EDICIONES_BARRA_LATERAL[campo]
+        clave = CLAVE_INTERES[self.opcion("tipo_hipoteca")] if campo == "interes" else campo
+        if clave not in self.widgets:
+            return None
+        valor = self.rng.choice(list(self.widgets[clave][2].options)) if tipo_valor == "opcion" else generador(self.rng)
+        return f"barra lateral ({campo})", self.fijar(clave, tipo_valor, valor)
+
+    def _cambiar_amortizacion(self):
+        """Activa la simulación de amortización anticipada o cambia su importe (solo en el modo 2)."""
+        activar = next((c for c in self.widgets if c.startswith("Activar simulación")), None)
+        if activar is None:
+            return None
+        if not self.valores.get(activar, (None, False))[1]:
+            return "amortización (activar)", self.fijar(activar, "bool_value", True)
+        importe = next((c for c in self.widgets if c.startswith("Cantidad del pago extra")), None)
+        if importe is None:
+            return None
+        return "amortización (importe)", self.fijar(importe, "double_value", float(self.rng.randrange(1_000, 30_000, 1_000)))
+
+    def siguiente_accion(self):
+        """Elige y aplica la siguiente interacción; devuelve (tipo, fragment_id)."""
+        modo_2 = self.opcion("modo") == MODOS[1]
+        dado = self.rng.random()
+        if dado < 0.15:
+            return "cambio de modo", self.fijar("modo", "opcion", self.rng.choice(MODOS))
+        if dado < 0.30 and modo_2:
+            accion = self._cambiar_amortizacion()
+            if accion:
+                return accion
+        if dado < 0.40 and modo_2:
+            return "precio vivienda", self.fijar("precio_comp", "double_value", float(self.rng.randrange(120_000, 600_000, 5_000)))
+        return self._editar_barra_lateral() or ("barra lateral (sueldo)", self.fijar("sueldo", "double_value", 3_000.0))
+
+    async def recorrido(self, pasos, pausa):
+        """Carga inicial, datos básicos y `pasos` interacciones, con tiempo de lectura entre ellas."""
+        async def paso(tipo, fragment_id=""):
+            errores = await self.ejecutar(tipo, fragment_id)
+            if pausa:
+                await asyncio.sleep(self.rng.uniform(0, 2 * pausa))
+            return errores
+
+        await paso("carga inicial")
+        self.fijar("modo", "opcion", self.rng.choice(MODOS))
+        await paso("cambio de modo")
+
+        self.fijar("sueldo", "double_value", float(self.rng.randrange(1_500, 6_000, 100)))
+        self.fijar("entrada", "double_value", float(self.rng.randrange(20_000, 120_000, 5_000)))
+        if self.opcion("modo") == MODOS[1]:  # el precio solo es editable en el modo 2
+            self.fijar("precio_comp", "double_value", float(self.rng.randrange(150_000, 450_000, 5_000)))
+        if await paso("datos básicos"):
+            return
+
+        for _ in range(pasos):
+            tipo, fragment_id = self.siguiente_accion()
+            if await paso(tipo, fragment_id):
+                break
+
+
+async def calentar(url, timeout):
+    """Una carga inicial suelta para que el servidor importe módulos y llene cachés antes de medir."""
+    async with connect(url, subprotocols=["streamlit"], max_size=None, open_timeout=timeout) as ws:
+        await SesionSimulada(ws, random.Random(0), timeout).ejecutar("calentamiento")
+
+
+async def simular(url, args, liberar):
+    """
+    Lanza todas las sesiones repartiendo su arranque en `rampa` segundos y vuelve cuando han terminado
+    su recorrido. Siguen conectadas hasta que se activa `liberar`, para que la memoria medida incluya
+    cada sesión viva; devuelve las sesiones y las tareas que las mantienen abiertas.
+    """
+    todas_listas = asyncio.Event()
+    pendientes = [args.sesiones]
+    sesiones = []
+
+    def terminada():
+        pendientes[0] -= 1
+        if pendientes[0] == 0:
+            todas_listas.set()
+
+    async def una_sesion(i):
+        rng = random.Random(args.semilla * 100_003 + i)
+        await asyncio.sleep(args.rampa * i / max(args.sesiones, 1))
+        contada = False
+        try:
+            async with connect(url, subprotocols=["streamlit"], max_size=None, open_timeout=args.timeout) as ws:
+                sesion = SesionSimulada(ws, rng, args.timeout)
+                sesiones.append(sesion)
+                try:
+                    await sesion.recorrido(args.pasos, args.pausa)
+                finally:
+                    contada = True
+                    terminada()
+                await liberar.wait()
+        except (OSError, asyncio.TimeoutError, ConnectionClosed) as e:
+            print(f"Sesión {i}: {type(e).__name__}: {e}", file=sys.stderr)
+            if not contada:
+                terminada()
+
+    tareas = [asyncio.create_task(una_sesion(i)) for i in range(args.sesiones)]
+    await todas_listas.wait()
+    return sesiones, tareas
+
+
+async def medir(url, args):
+    """
+    Primera ola: las sesiones de la prueba, de la que salen latencias y CPU. Lo que crece la RSS en ella
+    mezcla la memoria de cada sesión con la caché compartida, que se va llenando (hasta CACHE_MAX_BYTES).
+    Segunda ola (si hay PID y no se pasa --sin-segunda-ola): las mismas sesiones con la misma semilla, y
+    por tanto las mismas entradas, mientras la primera sigue conectada. La caché ya está caliente, así
+    que lo que crece la RSS en ella es solo memoria por sesión.
+    """
+    medicion = {"rss": [], "cpu": None, "duracion": None}
+    liberar = asyncio.Event()
+    medicion["rss"].append(memoria_rss(args.pid) if args.pid else None)
+    cpu_inicial = cpu_proceso(args.pid) if args.pid else None
+    inicio = time.perf_counter()
+    sesiones, tareas = await simular(url, args, liberar)
+    medicion["duracion"] = time.perf_counter() - inicio
+    cpu_final = cpu_proceso(args.pid) if args.pid else None
+    if cpu_inicial is not None and cpu_final is not None:
+        medicion["cpu"] = cpu_final - cpu_inicial
+    medicion["rss"].append(memoria_rss(args.pid) if args.pid else None)
+    try:
+        if args.pid and not args.sin_segunda_ola:
+            _, repetidas = await simular(url, args, liberar)
+            tareas += repetidas
+            medicion["rss"].append(memoria_rss(args.pid))
+    finally:
+        liberar.set()
+        await asyncio.gather(*tareas)
+    return sesiones, medicion
+
+
+# =========================
+# Informe
+# =========================
+def _fila_percentiles(nombre, latencias, recibidos):
+    valores = np.percentile(np.array(latencias) * 1000, PERCENTILES)
+    columnas = "".join(f"{v:>9.0f}" for v in valores)
+    return f"{nombre:<28}{len(latencias):>8,}{columnas}{max(latencias) * 1000:>9.0f}{np.mean(recibidos) / 1024:>10.1f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones simuladas contra un servidor de Streamlit local.")
+    parser.add_argument("--sesiones", type=int, default=200, help="Sesiones simultáneas simuladas.")
+    parser.add_argument("--rampa", type=float, default=10.0, help="Segundos en los que se reparten los arranques de sesión.")
+    parser.add_argument("--pasos", type=int, default=8, help="Interacciones por sesión tras la carga inicial.")
+    parser.add_argument("--pausa", type=float, default=1.0, help="Pausa media entre interacciones (s).")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Tiempo máximo por re-ejecución (s).")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla para reproducir los recorridos.")
+    parser.add_argument("--url", help="Servidor ya arrancado (p. ej. http://localhost:8501); si no, se arranca uno.")
+    parser.add_argument("--pid", type=int, help="PID del servidor indicado con --url, para medir su CPU y memoria.")
+    parser.add_argument("--sin-segunda-ola", action="store_true",
+                        help="No repetir las sesiones con la caché caliente (la memoria por sesión no se separa de la caché).")
+    args = parser.parse_args(argv)
+
+    servidor = None
+    if args.url:
+        base = args.url.rstrip("/").replace("http://", "ws://").replace("https://", "wss://")
+    else:
+        puerto = _puerto_libre()
+        servidor = arrancar_servidor(puerto)
+        args.pid = servidor.pid
+        base = f"ws://127.0.0.1:{puerto}"
+
+    url = f"{base}/_stcore/stream"
+    try:
+        asyncio.run(calentar(url, args.timeout))
+        sesiones, medicion = asyncio.run(medir(url, args))
+    finally:
+        if servidor is not None:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+    por_tipo, bytes_por_tipo = defaultdict(list), defaultdict(list)
+    errores = 0
+    for sesion in sesiones:
+        for tipo, latencia, recibidos, excepciones in sesion.mediciones:
+            por_tipo[tipo].append(latencia)
+            bytes_por_tipo[tipo].append(recibidos)
+            errores += excepciones > 0
+    if not por_tipo:
+        print("Ninguna sesión llegó a ejecutarse.", file=sys.stderr)
+        return 1
+    todas = [latencia for latencias in por_tipo.values() for latencia in latencias]
+    todos_bytes = [b for lista in bytes_por_tipo.values() for b in lista]
+
+    print(f"Sesiones: {len(sesiones):,}/{args.sesiones:,} · rampa: {args.rampa:g} s · pasos: {args.pasos} · "
+          f"pausa: {args.pausa:g} s · semilla: {args.semilla}\n")
+    print(f"{'Re-ejecución':<28}{'n':>8}" + "".join(f"{'p' + str(p) + ' ms':>9}" for p in PERCENTILES)
+          + f"{'máx ms':>9}{'KB medio':>10}")
+    for tipo in sorted(por_tipo, key=lambda t: -len(por_tipo[t])):
+        print(_fila_percentiles(tipo, por_tipo[tipo], bytes_por_tipo[tipo]))
+    print(_fila_percentiles("TOTAL", todas, todos_bytes))
+
+    duracion = medicion["duracion"]
+    print(f"\nDuración: {duracion:.1f} s · {len(todas) / duracion:.1f} re-ejecuciones/s · {errores} con excepción")
+    distintos = defaultdict(int)
+    for sesion in sesiones:
+        for _, mensaje in sesion.errores:
+            distintos[mensaje[:120]] += 1
+    for mensaje, veces in sorted(distintos.items(), key=lambda par: -par[1]):
+        print(f"  {veces:>4} × {mensaje}")
+    if medicion["cpu"] is not None:
+        cpu = medicion["cpu"]
+        print(f"CPU del servidor: {cpu:.1f} s ({cpu / duracion * 100:.0f} % de un núcleo, {os.cpu_count()} núcleos) · "
+              f"{cpu / len(todas) * 1000:.0f} ms de CPU por re-ejecución")
+    rss = medicion["rss"]
+    if None not in rss:
+        n = max(len(sesiones), 1)
+        print(f"Memoria del servidor: RSS {rss[0] / 1_048_576:.0f} → {rss[1] / 1_048_576:.0f} MB con "
+              f"{len(sesiones)} sesiones conectadas")
+        if len(rss) == 3:
+            por_sesion = rss[2] - rss[1]
+            compartida = (rss[1] - rss[0]) - por_sesion
+            print(f"  Memoria compartida (sobre todo la caché): {compartida / 1_048_576:.0f} MB (límite {CACHE_MAX_BYTES / 1_048_576:.0f} MB) · "
+                  f"por sesión: {por_sesion / n / 1024:.0f} KB (segunda ola con la caché caliente, "
+                  f"RSS {rss[2] / 1_048_576:.0f} MB con {2 * n} sesiones)")
+        else:
+            print(f"  {(rss[1] - rss[0]) / n / 1024:.0f} KB por sesión, incluida la caché compartida que se llena "
+                  f"durante la prueba (sin segunda ola no se pueden separar)")
+    return 1 if errores or len(sesiones) < args.sesiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
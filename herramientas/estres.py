@@ -0,0 +1,198 @@
+# ============================================================
+# 🌡️ Test de estrés de tipos sobre una cartera de hipotecas vivas
+# ============================================================
+# Reevalúa cada préstamo de la cartera bajo subidas del Euríbor: choques paralelos (+100, +200,
+# +300 pb por defecto) y los episodios históricos de euribor.py aplicados sobre el Euríbor actual.
+# Para cada préstamo y escenario recalcula la cuota en cada revisión del horizonte y el DTI en el
+# peor momento, con estres_cartera_lote (vectorizado sobre préstamos × escenarios), y resume cuántos
+# superan los umbrales de DTI y la distribución de la subida de cuota y del DTI.
+#
+# Uso:
+#   python -m herramientas.estres --cartera cartera.csv --choques 100,200,300 --horizonte 36
+#   python -m herramientas.estres --sinteticos 1000000          # cartera aleatoria
+#
+# Columnas de la cartera (porcentajes como en la app: 1.0 = 1 %):
+#   capital_pendiente, meses_restantes, tipo_hipoteca (Fija/Variable/Mixta), diferencial,
+#   interes_fijo (Fija y tramo fijo de la Mixta), meses_hasta_revision (Variable, por defecto 0),
+#   meses_fijo_restantes (Mixta, por defecto 0), sueldo_neto, deudas_mensuales (por defecto 0)
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from euribor import EPISODIOS_HISTORICOS, euribor_actual, trayectoria_historica
+from motor_hipotecario import DTI_FAIL, DTI_WARN
+from motor_vectorial import dti_visible_lote, estres_cartera_lote
+
+TAM_BLOQUE = 100_000
+CHOQUES_PB = [100, 200, 300]
+HORIZONTE_MESES = 36
+PERCENTILES = [50, 90, 99]
+
+COLUMNAS_CARTERA = {
+    "capital_pendiente": None,
+    "meses_restantes": None,
+    "tipo_hipoteca": "Variable",
+    "diferencial": 1.0,
+    "interes_fijo": 3.0,
+    "meses_hasta_revision": 0,
+    "meses_fijo_restantes": 0,
+    "sueldo_neto": None,
+    "deudas_mensuales": 0.0,
+}
+
+
+# =========================
+# Escenarios y cartera
+# =========================
+def escenarios(choques_pb, historicos, horizonte):
+    """(nombres, variaciones (k, horizonte)): primero la base sin choque, después choques paralelos e históricos."""
+    nombres = ["Base (sin choque)"] + [f"+{pb} pb" for pb in choques_pb] + [f"Histórico {h}" for h in historicos]
+    filas = [np.zeros(horizonte)] + [np.full(horizonte, pb / 10_000) for pb in choques_pb]
+    filas += [trayectoria_historica(h, horizonte) for h in historicos]
+    return nombres, np.array(filas)
+
+
+def normalizar_cartera(tabla):
+    n = len(tabla)
+    datos = {}
+    for nombre, defecto in COLUMNAS_CARTERA.items():
+        if nombre in tabla:
+            valores = np.asarray(tabla[nombre])
+        elif defecto is None:
+            raise ValueError(f"Falta la columna obligatoria «{nombre}»")
+        else:
+            valores = np.full(n, defecto)
+        datos[nombre] = valores.astype(str) if nombre == "tipo_hipoteca" else valores.astype(float)
+    return datos
+
+
+def bloques_csv(ruta, tam_bloque):
+    for tabla in pd.read_csv(ruta, chunksize=tam_bloque):
+        yield normalizar_cartera(tabla)
+
+
+def bloques_sinteticos(n_filas, semilla, tam_bloque):
+    """Cartera aleatoria reproducible: la mitad Variable, un cuarto Mixta y un cuarto Fija, con capitales acordes al sueldo."""
+    for id_bloque, inicio in enumerate(range(0, n_filas, tam_bloque)):
+        rng = np.random.default_rng([semilla, id_bloque])
+        n = min(tam_bloque, n_filas - inicio)
+        sueldo = rng.uniform(1_200, 7_000, n)
+        yield normalizar_cartera(pd.DataFrame({
+            "capital_pendiente": sueldo * rng.uniform(20, 70, n),
+            "meses_restantes": rng.integers(60, 361, n),
+            "tipo_hipoteca": rng.choice(["Variable", "Mixta", "Fija"], n, p=[0.5, 0.25, 0.25]),
+            "diferencial": rng.uniform(0.4, 1.5, n),
+            "interes_fijo": rng.uniform(1.5, 3.5, n),
+            "meses_hasta_revision": rng.integers(0, 12, n),
+            "meses_fijo_restantes": rng.integers(0, 121, n),
+            "sueldo_neto": sueldo,
+            "deudas_mensuales": np.where(rng.random(n) < 0.6, 0.0, rng.uniform(0, 0.2, n) * sueldo),
+        }))
+
+
+def estresar_bloque(datos, euribor_base, variaciones):
+    primera_revision = np.where(datos["tipo_hipoteca"] == "Mixta", datos["meses_fijo_restantes"],
+                                datos["meses_hasta_revision"])
+    return estres_cartera_lote(
+        datos["capital_pendiente"], datos["meses_restantes"], datos["tipo_hipoteca"], datos["diferencial"] / 100,
+        datos["interes_fijo"] / 100, primera_revision, datos["sueldo_neto"], datos["deudas_mensuales"],
+        euribor_base, variaciones,
+    )
+
+
+# =========================
+# Resumen
+# =========================
+def resumir(nombres, dti_base, dti_pico, subida_cuota):
+    """Tabla por escenario: préstamos por encima de cada umbral, nuevos incumplimientos y percentiles."""
+    visible_base = dti_visible_lote(dti_base)
+    visible_pico = dti_visible_lote(dti_pico)
+    filas = []
+    for j, nombre in enumerate(nombres):
+        fila = {
+            "Escenario": nombre,
+            f"DTI > {DTI_WARN:.0%}": int(np.count_nonzero(visible_pico[:, j] > DTI_WARN)),
+            f"DTI > {DTI_FAIL:.0%}": int(np.count_nonzero(visible_pico[:, j] > DTI_FAIL)),
+            f"Nuevos > {DTI_FAIL:.0%}": int(np.count_nonzero((visible_pico[:, j] > DTI_FAIL) & (visible_base <= DTI_FAIL))),
+        }
+        for p, valor in zip(PERCENTILES, np.percentile(subida_cuota[:, j], PERCENTILES)):
+            fila[f"Subida cuota p{p}"] = valor
+        for p, valor in zip(PERCENTILES, np.percentile(dti_pico[:, j], PERCENTILES)):
+            fila[f"DTI p{p}"] = valor
+        filas.append(fila)
+    return pd.DataFrame(filas)
+
+
+def imprimir_resumen(tabla, n_prestamos):
+    print(f"{'Escenario':<22}{f'DTI>{DTI_WARN:.0%}':>10}{f'DTI>{DTI_FAIL:.0%}':>10}{f'Nuevos>{DTI_FAIL:.0%}':>12}"
+          f"{'Δcuota p50':>12}{'p90':>8}{'p99':>8}{'DTI p50':>10}{'p90':>8}{'p99':>8}")
+    for fila in tabla.itertuples(index=False):
+        _, warn, fail, nuevos, c50, c90, c99, d50, d90, d99 = fila
+        print(f"{fila[0]:<22}{warn / n_prestamos:>10.1%}{fail / n_prestamos:>10.1%}{nuevos:>12,}"
+              f"{c50:>12.1%}{c90:>8.1%}{c99:>8.1%}{d50:>10.1%}{d90:>8.1%}{d99:>8.1%}")
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estrés de tipos sobre una cartera de hipotecas vivas.")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--cartera", help="CSV con un préstamo por fila.")
+    origen.add_argument("--sinteticos", type=int, help="Número de préstamos aleatorios a generar.")
+    parser.add_argument("--choques", default=",".join(map(str, CHOQUES_PB)),
+                        help="Choques paralelos del Euríbor en puntos básicos, separados por comas.")
+    parser.add_argument("--historicos", default=",".join(EPISODIOS_HISTORICOS),
+                        help=f"Episodios históricos ({', '.join(EPISODIOS_HISTORICOS)}); vacío para ninguno.")
+    parser.add_argument("--horizonte", type=int, default=HORIZONTE_MESES, help="Meses simulados desde hoy.")
+    parser.add_argument("--euribor", type=float, default=None,
+                        help=f"Euríbor de partida en %% (por defecto el último de la serie: {euribor_actual():.2%}).")
+    parser.add_argument("--tam-bloque", type=int, default=TAM_BLOQUE, help="Préstamos por bloque.")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla de la cartera sintética.")
+    parser.add_argument("--csv", help="Escribe la tabla resumen en este CSV.")
+    args = parser.parse_args(argv)
+
+    choques = [int(c) for c in args.choques.split(",") if c.strip()]
+    historicos = [h.strip() for h in args.historicos.split(",") if h.strip()]
+    desconocidos = [h for h in historicos if h not in EPISODIOS_HISTORICOS]
+    if desconocidos:
+        parser.error(f"Episodios desconocidos: {', '.join(desconocidos)}")
+    euribor_base = euribor_actual() if args.euribor is None else args.euribor / 100
+    nombres, variaciones = escenarios(choques, historicos, args.horizonte)
+
+    if args.cartera:
+        bloques = bloques_csv(args.cartera, args.tam_bloque)
+    else:
+        bloques = bloques_sinteticos(args.sinteticos, args.semilla, args.tam_bloque)
+
+    inicio = time.perf_counter()
+    dti_base, dti_pico, subida_cuota = [], [], []
+    for datos in bloques:
+        r = estresar_bloque(datos, euribor_base, variaciones)
+        dti_base.append(r["dti_base"])
+        dti_pico.append(r["dti_pico"].astype(np.float32))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            subida = r["cuota_pico"] / r["cuota_base"][:, None] - 1
+        subida_cuota.append(np.nan_to_num(subida).astype(np.float32))
+    duracion = time.perf_counter() - inicio
+
+    dti_base, dti_pico, subida_cuota = np.concatenate(dti_base), np.concatenate(dti_pico), np.concatenate(subida_cuota)
+    n_prestamos = len(dti_base)
+    print(f"Préstamos: {n_prestamos:,} · escenarios: {len(nombres)} · horizonte: {args.horizonte} meses"
+          f" · Euríbor de partida: {euribor_base:.2%}")
+    print(f"Tiempo: {duracion:.1f} s ({n_prestamos * len(nombres) / duracion:,.0f} préstamo·escenario/s)\n")
+
+    tabla = resumir(nombres, dti_base, dti_pico, subida_cuota)
+    imprimir_resumen(tabla, n_prestamos)
+    if args.csv:
+        tabla.to_csv(args.csv, index=False)
+        print(f"\nResumen escrito en {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+# ============================================================
+# 📦 Cálculo por lotes sobre carteras de clientes
+# ============================================================
+# Ejecuta la lógica del modo 1 (precio máximo) y/o del modo 2 (evaluación de una vivienda) sobre
+# millones de filas con el motor vectorizado. La entrada se divide en bloques que se reparten entre
+# varios procesos; cada proceso escribe sus filas en un almacén columnar mapeado en memoria
+# (almacen_columnar.py), así que el trabajo no necesita caber en RAM. El manifiesto del almacén
+# anota los ids de los bloques completos: si el trabajo se interrumpe, al relanzarlo con la misma
+# salida se saltan. Durante la ejecución se muestran las filas por segundo y el tiempo restante.
+#
+# Uso:
+#   python -m herramientas.lotes --entrada clientes.csv --salida resultados/cartera --modo ambos --procesos 8
+#   python -m herramientas.lotes --sinteticos 5000000 --salida /tmp/lote   # clientes aleatorios
+#
+# Columnas del CSV (las que falten toman el valor por defecto de la barra lateral de la app;
+# porcentajes como en la app: 4.0 = 4 %):
+#   ccaa, estado, perfil, tipo_hipoteca, interes_fijo, euribor, diferencial, plazo,
+#   sueldo_neto, deudas_mensuales, entrada, precio (solo modo evaluación), ratio_dti, ltv_max,
+#   financiar_comision, notario, registro, gestoria, tasacion, seguro_inicial, com_apertura
+
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from almacen_columnar import AlmacenColumnar
+from motor_fiscal import ESTADOS, PERFILES_FISCALES, REGIONES, indices_fiscales
+from motor_vectorial import buscar_precio_maximo_lote, cuota_maxima_lote, evaluar_vivienda_lote
+
+TAM_BLOQUE = 100_000
+MODOS = ("precio", "evaluacion", "ambos")
+TIPOS_HIPOTECA = ["Fija", "Variable", "Mixta"]
+
+# Columna de entrada → valor por defecto (None: obligatoria)
+COLUMNAS_ENTRADA = {
+    "ccaa": "Madrid",
+    "estado": "Segunda mano",
+    "perfil": "general",
+    "tipo_hipoteca": "Fija",
+    "interes_fijo": 4.0,
+    "euribor": 2.0,
+    "diferencial": 1.0,
+    "plazo": 30,
+    "sueldo_neto": None,
+    "deudas_mensuales": 0.0,
+    "entrada": None,
+    "precio": np.nan,
+    "ratio_dti": 35.0,
+    "ltv_max": 80.0,
+    "financiar_comision": False,
+    "notario": 1500.0,
+    "registro": 500.0,
+    "gestoria": 500.0,
+    "tasacion": 400.0,
+    "seguro_inicial": 300.0,
+    "com_apertura": 1.0,
+}
+COLUMNAS_TEXTO = ("ccaa", "estado", "perfil", "tipo_hipoteca")
+
+# Columnas de resultado por modo (nombre → dtype)
+RESULTADOS = {
+    "precio": {"cuota_max": "f8", "precio_maximo": "f8"},
+    "evaluacion": {
+        "capital_final": "f8", "gastos_iniciales": "f8", "cuota": "f8", "dti": "f8", "ltv": "f8",
+        "viable": "?", "sin_hipoteca": "?", "tramo_fijo": "?",
+    },
+}
+
+
+def columnas_resultado(modo):
+    if modo == "ambos":
+        return {**RESULTADOS["precio"], **RESULTADOS["evaluacion"]}
+    return dict(RESULTADOS[modo])
+
+
+# =========================
+# Fuentes de clientes
+# =========================
+def normalizar_bloque(tabla):
+    """DataFrame (o dict de columnas) → dict de arrays con todas las columnas de entrada y sus valores por defecto."""
+    n = len(next(iter(tabla.values()))) if isinstance(tabla, dict) else len(tabla)
+    datos = {}
+    for nombre, defecto in COLUMNAS_ENTRADA.items():
+        if nombre in tabla:
+            valores = np.asarray(tabla[nombre])
+        elif defecto is None:
+            raise ValueError(f"Falta la columna obligatoria «{nombre}»")
+        else:
+            valores = np.full(n, defecto)
+        if nombre in COLUMNAS_TEXTO:
+            datos[nombre] = valores.astype(str)
+        elif nombre == "financiar_comision":
+            datos[nombre] = valores.astype(bool)
+        else:
+            datos[nombre] = valores.astype(float)
+    return datos
+
+
+class FuenteCSV:
+    """Filas de un CSV leídas por bloques; el número total de filas se cuenta antes de empezar."""
+
+    def __init__(self, ruta, tam_bloque):
+        self.ruta = ruta
+        self.tam_bloque = tam_bloque
+        with open(ruta, "rb") as f:
+            self.n_filas = max(sum(1 for linea in f if linea.strip()) - 1, 0)
+
+    def descripcion(self):
+        return {"fuente": "csv", "ruta": os.path.abspath(self.ruta)}
+
+    def tareas(self, pendientes):
+        """(id_bloque, datos) de los bloques pendientes; los completos se leen pero no se envían a los procesos."""
+        for id_bloque, tabla in enumerate(pd.read_csv(self.ruta, chunksize=self.tam_bloque)):
+            if id_bloque in pendientes:
+                yield id_bloque, normalizar_bloque(tabla)
+
+    def cargar(self, id_bloque, datos):
+        return datos
+
+
+class FuenteSintetica:
+    """Clientes aleatorios reproducibles: cada bloque sale de su propia semilla (semilla, id_bloque)."""
+
+    def __init__(self, n_filas, semilla, tam_bloque):
+        self.n_filas = n_filas
+        self.semilla = semilla
+        self.tam_bloque = tam_bloque
+
+    def descripcion(self):
+        return {"fuente": "sinteticos", "semilla": self.semilla}
+
+    def generar_bloque(self, id_bloque):
+        rng = np.random.default_rng([self.semilla, id_bloque])
+        n = min(self.tam_bloque, self.n_filas - id_bloque * self.tam_bloque)
+        sueldo = rng.uniform(800, 8_000, n)
+        return normalizar_bloque({
+            "ccaa": rng.choice(REGIONES, n),
+            "estado": rng.choice(ESTADOS, n),
+            "perfil": rng.choice(list(PERFILES_FISCALES), n),
+            "tipo_hipoteca": rng.choice(TIPOS_HIPOTECA, n),
+            "interes_fijo": rng.uniform(0.5, 6.0, n),
+            "euribor": rng.uniform(-0.5, 5.0, n),
+            "diferencial": rng.uniform(0.0, 3.0, n),
+            "plazo": rng.integers(5, 41, n),
+            "sueldo_neto": sueldo,
+            "deudas_mensuales": np.where(rng.random(n) < 0.6, 0.0, rng.uniform(0, 0.3, n) * sueldo),
+            "entrada": rng.uniform(0, 200_000, n),
+            "precio": rng.uniform(60_000, 900_000, n),
+            "ratio_dti": rng.integers(30, 41, n),
+            "ltv_max": rng.choice([80, 90, 100], n, p=[0.8, 0.15, 0.05]),
+            "financiar_comision": rng.random(n) < 0.3,
+            "com_apertura": rng.choice([0.0, 0.5, 1.0], n),
+        })
+
+    def tareas(self, pendientes):
+        """Solo los ids: cada proceso genera los clientes de su bloque, así no viajan entre procesos."""
+        for id_bloque in sorted(pendientes):
+            yield id_bloque, None
+
+    def cargar(self, id_bloque, datos):
+        return self.generar_bloque(id_bloque)
+
+
+# =========================
+# Cálculo de un bloque
+# =========================
+def calcular_bloque(datos, modo):
+    """Resultados del bloque con el motor vectorizado (mismas reglas que los modos 1 y 2 de la app)."""
+    tipo = datos["tipo_hipoteca"]
+    interes_fijo, euribor, diferencial = datos["interes_fijo"] / 100, datos["euribor"] / 100, datos["diferencial"] / 100
+    interes_anual = np.where(tipo == "Variable", euribor + diferencial, interes_fijo)
+    tipos = dict(interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial)
+    params = {
+        "tipo_impuesto": None,
+        "fiscal": indices_fiscales(datos["ccaa"], datos["estado"], datos["perfil"]),
+        "notario": datos["notario"],
+        "gestoria": datos["gestoria"],
+        "registro": datos["registro"],
+        "tasacion": datos["tasacion"],
+        "seguro_inicial": datos["seguro_inicial"],
+        "com_apertura_pct": datos["com_apertura"] / 100,
+    }
+    ltv_max, ratio_dti = datos["ltv_max"] / 100, datos["ratio_dti"] / 100
+
+    resultados = {}
+    if modo in ("precio", "ambos"):
+        cuota_max = cuota_maxima_lote(datos["sueldo_neto"], datos["deudas_mensuales"], ratio=ratio_dti)
+        resultados["cuota_max"] = cuota_max
+        resultados["precio_maximo"] = buscar_precio_maximo_lote(
+            datos["entrada"], datos["sueldo_neto"], datos["deudas_mensuales"], cuota_max, params, ltv_max,
+            datos["financiar_comision"], tipo, interes_anual, datos["plazo"], **tipos
+        )
+    if modo in ("evaluacion", "ambos"):
+        if np.isnan(datos["precio"]).any():
+            raise ValueError("El modo evaluación necesita la columna «precio» en todas las filas")
+        r = evaluar_vivienda_lote(
+            datos["precio"], datos["entrada"], datos["sueldo_neto"], datos["deudas_mensuales"], params, ltv_max,
+            ratio_dti, datos["financiar_comision"], tipo, interes_anual, datos["plazo"], **tipos
+        )
+        resultados.update({nombre: r[nombre] for nombre in RESULTADOS["evaluacion"]})
+    return resultados
+
+
+# =========================
+# Ejecución
+# =========================
+def abrir_o_crear_almacen(ruta, fuente, modo, tam_bloque, sobrescribir):
+    """Reanuda el almacén de `ruta` si corresponde al mismo trabajo; si no existe (o se pide), lo crea de cero."""
+    metadatos = {"modo": modo, **fuente.descripcion()}
+    if AlmacenColumnar.existe(ruta) and not sobrescribir:
+        almacen = AlmacenColumnar.abrir(ruta, escritura=True)
+        mismo_trabajo = (almacen.metadatos == metadatos and almacen.n_filas == fuente.n_filas
+                         and almacen.tam_bloque == tam_bloque)
+        if not mismo_trabajo:
+            raise SystemExit(f"❌ {ruta} contiene otro trabajo; usa --sobrescribir o cambia --salida.")
+        return almacen
+    return AlmacenColumnar.crear(ruta, fuente.n_filas, columnas_resultado(modo), tam_bloque, metadatos)
+
+
+# Almacén abierto por cada proceso trabajador (ruta → AlmacenColumnar), reutilizado entre bloques
+_ALMACENES = {}
+
+
+def procesar_bloque(tarea):
+    """Trabajo de un proceso: calcula el bloque y escribe sus filas en el almacén. Devuelve (id_bloque, filas)."""
+    ruta, fuente, modo, id_bloque, datos = tarea
+    almacen = _ALMACENES.get(ruta)
+    if almacen is None:
+        almacen = _ALMACENES[ruta] = AlmacenColumnar.abrir(ruta, escritura=True)
+    datos = fuente.cargar(id_bloque, datos)
+    almacen.escribir_filas(id_bloque, calcular_bloque(datos, modo))
+    return id_bloque, len(datos["sueldo_neto"])
+
+
+class Progreso:
+    """Filas por segundo de esta ejecución y tiempo restante estimado para las filas pendientes."""
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+        self.inicio = time.perf_counter()
+        self.filas = 0
+        self.restantes = sum(fin - inicio for inicio, fin in map(almacen.rango_bloque, almacen.pendientes()))
+
+    @property
+    def duracion(self):
+        return time.perf_counter() - self.inicio
+
+    def anotar(self, id_bloque, filas):
+        self.filas += filas
+        self.restantes -= filas
+        ritmo = self.filas / self.duracion
+        eta = datetime.timedelta(seconds=round(self.restantes / ritmo)) if ritmo else "?"
+        print(f"  bloque {id_bloque + 1:>5} · {len(self.almacen.completados):>5}/{self.almacen.n_bloques} completos"
+              f" · {ritmo:>9,.0f} filas/s · quedan {eta}", flush=True)
+
+
+def ejecutar(fuente, almacen, modo, procesos):
+    """
+    Procesa los bloques pendientes. Con varios procesos, cada uno escribe sus filas y este proceso
+    anota los bloques en el manifiesto a medida que terminan; como mucho hay 2 bloques por proceso
+    en vuelo, así que la entrada se lee al ritmo del cálculo.
+    """
+    progreso = Progreso(almacen)
+    pendientes = set(almacen.pendientes())
+
+    def anotar(id_bloque, filas):
+        almacen.marcar_completado(id_bloque)
+        progreso.anotar(id_bloque, filas)
+
+    if procesos <= 1:
+        for id_bloque, datos in fuente.tareas(pendientes):
+            datos = fuente.cargar(id_bloque, datos)
+            almacen.escribir_filas(id_bloque, calcular_bloque(datos, modo))
+            anotar(id_bloque, len(datos["sueldo_neto"]))
+        return progreso
+
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        en_vuelo = set()
+        try:
+            for id_bloque, datos in fuente.tareas(pendientes):
+                if len(en_vuelo) >= 2 * procesos:
+                    terminados, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                    for futuro in terminados:
+                        anotar(*futuro.result())
+                en_vuelo.add(pool.submit(procesar_bloque, (almacen.ruta, fuente, modo, id_bloque, datos)))
+            for futuro in wait(en_vuelo).done:
+                anotar(*futuro.result())
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+    return progreso
+
+
+def resumen(almacen):
+    """Agregados del almacén leídos por rebanadas (vistas sin copia sobre los ficheros)."""
+    columnas = [c for c in ("precio_maximo", "viable") if c in almacen.nombres_columnas]
+    filas, suma_precio, viables = 0, 0.0, 0
+    for _, rebanada in almacen.rebanadas(columnas):
+        primera = next(iter(rebanada.values()))
+        filas += len(primera)
+        if "precio_maximo" in rebanada:
+            suma_precio += float(rebanada["precio_maximo"].sum())
+        if "viable" in rebanada:
+            viables += int(np.count_nonzero(rebanada["viable"]))
+    lineas = [f"Filas completas: {filas:,} de {almacen.n_filas:,}"]
+    if filas and "precio_maximo" in columnas:
+        lineas.append(f"Precio máximo medio: {suma_precio / filas:,.0f} €")
+    if filas and "viable" in columnas:
+        lineas.append(f"Operaciones viables: {viables:,} ({viables / filas:.1%})")
+    return lineas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Modo 1 / modo 2 sobre una cartera de clientes, por bloques y reanudable.")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--entrada", help="CSV con una fila por cliente.")
+    origen.add_argument("--sinteticos", type=int, help="Número de clientes aleatorios a generar.")
+    parser.add_argument("--salida", required=True, help="Carpeta del almacén de resultados.")
+    parser.add_argument("--modo", choices=MODOS, default="precio",
+                        help="precio = modo 1, evaluacion = modo 2 (necesita «precio»), ambos.")
+    parser.add_argument("--tam-bloque", type=int, default=TAM_BLOQUE, help="Filas por bloque.")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Procesos en paralelo.")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla de los clientes sintéticos.")
+    parser.add_argument("--sobrescribir", action="store_true", help="Empieza de cero aunque haya un trabajo a medias.")
+    args = parser.parse_args(argv)
+
+    if args.entrada:
+        fuente = FuenteCSV(args.entrada, args.tam_bloque)
+    else:
+        fuente = FuenteSintetica(args.sinteticos, args.semilla, args.tam_bloque)
+    almacen = abrir_o_crear_almacen(args.salida, fuente, args.modo, args.tam_bloque, args.sobrescribir)
+
+    if almacen.completados:
+        print(f"Reanudando: {len(almacen.completados)} de {almacen.n_bloques} bloques ya completos")
+    print(f"Filas: {almacen.n_filas:,} · bloques de {almacen.tam_bloque:,} · modo: {args.modo} · procesos: {args.procesos}")
+    try:
+        progreso = ejecutar(fuente, almacen, args.modo, args.procesos)
+    except KeyboardInterrupt:
+        print(f"\n⏸️ Interrumpido con {len(almacen.completados)} de {almacen.n_bloques} bloques completos; "
+              "relanza el mismo comando para continuar.")
+        return 130
+    if progreso.filas:
+        print(f"Tiempo: {progreso.duracion:.1f} s ({progreso.filas / progreso.duracion:,.0f} filas/s)")
+
+    print("\n".join(resumen(almacen)))
+    print(f"✅ Resultados en {args.salida}" if almacen.completo else "❌ El trabajo no se ha completado.")
+    almacen.cerrar()
+    return 0 if almacen.completo else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
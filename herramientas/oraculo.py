@@ -0,0 +1,325 @@
+# ============================================================
+# 🔬 Oráculo diferencial: motor rápido vs. implementación de referencia
+# ============================================================
+# Ejecuta las versiones escalares de motor_hipotecario.py (bucles de referencia) y las
+# vectorizadas de motor_vectorial.py (y las tablas precalculadas de tablas_amortizacion.py)
+# sobre los mismos escenarios aleatorios, y reporta por
+# métrica la desviación máxima absoluta/relativa, las discrepancias y el factor de aceleración.
+#
+# Uso:
+#   python -m herramientas.oraculo --casos 20000 --semilla 42
+# Devuelve código de salida 1 si alguna métrica supera su tolerancia.
+
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from herramientas.validador import generar_escenario
+from motor_fiscal import indices_fiscales
+from motor_hipotecario import (
+    PLAZO_MAX_ANIOS,
+    buscar_precio_maximo,
+    PERIODICIDADES_REVISION,
+    cuadro_revisiones_variable,
+    cuota_maxima,
+    escenarios_interes,
+    evaluar_vivienda,
+    evolucion_anual,
+    pagos_totales_prestamo,
+)
+from motor_vectorial import (
+    buscar_precio_maximo_lote,
+    escenarios_interes_lote,
+    evaluar_vivienda_lote,
+    evolucion_anual_rapida,
+    pagos_totales_lote,
+    revisiones_variable_lote,
+)
+from tablas_amortizacion import N_TIPOS, PASO_TIPO, TABLAS_AMORTIZACION
+
+TASAS_ESCENARIOS_PCT = [2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]
+
+# Tolerancia absoluta por métrica (€ o proporción); las booleanas deben coincidir siempre
+TOLERANCIAS = {
+    "precio_maximo": 0.01,
+    "evolucion.capital_pendiente": 1e-4,
+    "evolucion.intereses_acumulados": 1e-4,
+    "evolucion.capital_amortizado": 1e-4,
+    "tablas.capital_pendiente": 1e-4,
+    "tablas.intereses_acumulados": 1e-4,
+    "tablas.capital_amortizado": 1e-4,
+    "tablas.cuota": 1e-6,
+    "revisiones.cuota": 1e-6,
+    "revisiones.intereses": 1e-4,
+    "escenarios.cuota": 1e-6,
+    "escenarios.dti": 1e-6,
+    "escenarios.viable": 0,
+    "evaluacion.cuota": 1e-6,
+    "evaluacion.dti": 1e-9,
+    "evaluacion.viable": 0,
+    "evaluacion.pagos_totales": 1e-4,
+}
+
+
+def _columna(escenarios, clave, defecto=np.nan):
+    return np.array([defecto if e[clave] is None else e[clave] for e in escenarios], dtype=float)
+
+
+def _params_lote(escenarios):
+    claves = [k for k in escenarios[0]["params"] if k not in ("fiscal", "tipo_impuesto")]
+    params = {k: np.array([e["params"][k] for e in escenarios]) for k in claves}
+    # Región/estado/perfil se traducen a índices de la tabla fiscal una sola vez
+    params["fiscal"] = indices_fiscales(*(np.array(col) for col in zip(*(e["params"]["fiscal"] for e in escenarios))))
+    return params
+
+
+def _cronometrar(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, time.perf_counter() - inicio
+
+
+def _desviacion(referencia, rapido):
+    """Desviación absoluta y relativa; la relativa usa como mínimo 1 en el denominador (saldos ≈ 0 al final)."""
+    referencia, rapido = np.asarray(referencia, dtype=float), np.asarray(rapido, dtype=float)
+    abs_ = np.abs(rapido - referencia)
+    rel = abs_ / np.maximum(np.abs(referencia), 1.0)
+    return abs_, rel
+
+
+# =========================
+# Comparaciones
+# =========================
+def comparar_precio_maximo(escenarios):
+    cuota_max = [cuota_maxima(e["sueldo_neto"], e["deudas_mensuales"], ratio=e["ratio_dti"]) for e in escenarios]
+
+    referencia, t_ref = _cronometrar(lambda: [
+        buscar_precio_maximo(
+            e["entrada"], e["sueldo_neto"], e["deudas_mensuales"], cm, e["params"], e["ltv_max"], e["financiar_comision"],
+            e["tipo_hipoteca"], e["interes_anual"], e["anos_plazo"],
+            interes_fijo=e["interes_fijo"], euribor=e["euribor"], diferencial=e["diferencial"]
+        )
+        for e, cm in zip(escenarios, cuota_max)
+    ])
+    rapido, t_rap = _cronometrar(lambda: buscar_precio_maximo_lote(
+        _columna(escenarios, "entrada"), _columna(escenarios, "sueldo_neto"), _columna(escenarios, "deudas_mensuales"),
+        np.array(cuota_max), _params_lote(escenarios), _columna(escenarios, "ltv_max"),
+        np.array([e["financiar_comision"] for e in escenarios]), np.array([e["tipo_hipoteca"] for e in escenarios]),
+        _columna(escenarios, "interes_anual"), _columna(escenarios, "anos_plazo"),
+        interes_fijo=_columna(escenarios, "interes_fijo"), euribor=_columna(escenarios, "euribor"),
+        diferencial=_columna(escenarios, "diferencial"),
+    ))
+    abs_, rel = _desviacion(referencia, rapido)
+    return {"precio_maximo": (abs_, rel)}, t_ref, t_rap
+
+
+def _desviacion_evolucion(referencia, rapido, prefijo):
+    """Desviación máxima por préstamo de cada columna de la evolución anual (inf si cambia el número de años)."""
+    metricas = {}
+    for clave, columna in [("capital_pendiente", "Capital Pendiente"), ("intereses_acumulados", "Intereses Acumulados"),
+                           ("capital_amortizado", "Capital Amortizado")]:
+        abs_max, rel_max = [], []
+        for filas_ref, cols_rap in zip(referencia, rapido):
+            ref = [f[columna] for f in filas_ref]
+            if len(ref) != len(cols_rap[columna]):
+                abs_max.append(np.inf)
+                rel_max.append(np.inf)
+                continue
+            abs_, rel = _desviacion(ref, cols_rap[columna])
+            abs_max.append(abs_.max())
+            rel_max.append(rel.max())
+        metricas[f"{prefijo}.{clave}"] = (np.array(abs_max), np.array(rel_max))
+    return metricas
+
+
+def comparar_evolucion(escenarios):
+    from motor_hipotecario import cuota_prestamo
+
+    prestamos = []
+    for e in escenarios:
+        capital = max(e["precio"] - e["entrada"], 1_000.0)
+        prestamos.append((capital, e["interes_anual"], e["anos_plazo"], cuota_prestamo(capital, e["interes_anual"], e["anos_plazo"])))
+
+    referencia, t_ref = _cronometrar(lambda: [evolucion_anual(*p) for p in prestamos])
+    rapido, t_rap = _cronometrar(lambda: [evolucion_anual_rapida(*p) for p in prestamos])
+    return _desviacion_evolucion(referencia, rapido, "evolucion"), t_ref, t_rap
+
+
+def comparar_tablas(escenarios):
+    """Los mismos préstamos con el tipo redondeado a la rejilla de tablas_amortizacion (0,05 %)."""
+    from motor_hipotecario import cuota_prestamo
+
+    prestamos = []
+    for e in escenarios:
+        capital = max(e["precio"] - e["entrada"], 1_000.0)
+        interes = min(max(round(e["interes_anual"] / PASO_TIPO), 0), N_TIPOS - 1) * PASO_TIPO
+        prestamos.append((capital, interes, e["anos_plazo"], cuota_prestamo(capital, interes, e["anos_plazo"])))
+
+    TABLAS_AMORTIZACION.factor(0.0, PLAZO_MAX_ANIOS)  # carga fuera del cronómetro
+    referencia, t_ref = _cronometrar(lambda: [evolucion_anual(*p) for p in prestamos])
+    rapido, t_rap = _cronometrar(lambda: [TABLAS_AMORTIZACION.evolucion_anual(*p[:3]) for p in prestamos])
+    metricas = _desviacion_evolucion(referencia, rapido, "tablas")
+    metricas["tablas.cuota"] = _desviacion([p[3] for p in prestamos],
+                                           [TABLAS_AMORTIZACION.cuota(*p[:3]) for p in prestamos])
+    return metricas, t_ref, t_rap
+
+
+def comparar_revisiones(escenarios):
+    """Préstamos variables (y el tramo variable de las Mixta) con un Euríbor aleatorio, suelo y techo."""
+    rng = np.random.default_rng(0)
+    prestamos = []
+    for e in escenarios:
+        capital = max(e["precio"] - e["entrada"], 1_000.0)
+        meses_revision = int(rng.choice(list(PERIODICIDADES_REVISION.values())))
+        euribor = (e["euribor"] if e["euribor"] is not None else 0.02) + np.cumsum(rng.normal(0, 0.004, 80))
+        suelo = None if rng.random() < 0.5 else 0.0
+        techo = None if rng.random() < 0.5 else float(rng.uniform(0.03, 0.07))
+        meses_fijo = (e["anios_fijo"] or 0) * 12
+        prestamos.append((capital, e["anos_plazo"], e["diferencial"] or 0.0, euribor, meses_revision,
+                          suelo, techo, e["interes_fijo"], meses_fijo))
+
+    referencia, t_ref = _cronometrar(lambda: [cuadro_revisiones_variable(*p) for p in prestamos])
+
+    def rapido_fn():
+        col = lambda k, vacio=np.nan: np.array([vacio if p[k] is None else p[k] for p in prestamos])
+        r = revisiones_variable_lote(
+            col(0), col(1), col(2), np.array([p[3] for p in prestamos]), col(4),
+            suelo=col(5, -np.inf), techo=col(6, np.inf), interes_fijo=col(7), meses_fijo=col(8),
+        )
+        return [fila[duracion > 0] for fila, duracion in zip(r["cuotas"], r["meses_periodo"])], \
+               [fila[duracion > 0] for fila, duracion in zip(r["intereses"], r["meses_periodo"])]
+
+    rapido, t_rap = _cronometrar(rapido_fn)
+
+    metricas = {}
+    for clave, columna, valores in [("cuota", "Cuota", rapido[0]), ("intereses", "Intereses", rapido[1])]:
+        abs_max, rel_max = [], []
+        for filas_ref, fila_rapida in zip(referencia, valores):
+            abs_, rel = _desviacion([f[columna] for f in filas_ref], fila_rapida)
+            abs_max.append(abs_.max())
+            rel_max.append(rel.max())
+        metricas[f"revisiones.{clave}"] = (np.array(abs_max), np.array(rel_max))
+    return metricas, t_ref, t_rap
+
+
+def comparar_escenarios(escenarios):
+    datos = []
+    for e in escenarios:
+        capital = max(e["precio"] - e["entrada"], 0.0)
+        cuota_max = cuota_maxima(e["sueldo_neto"], e["deudas_mensuales"], ratio=e["ratio_dti"])
+        ltv_val = capital / e["precio"]
+        diferencial = e["diferencial"] if e["diferencial"] is not None else 0.0
+        interes_fijo = e["interes_fijo"] if e["interes_fijo"] is not None else e["interes_anual"]
+        datos.append((capital, e["anos_plazo"], cuota_max, ltv_val, e["ltv_max"], e["sueldo_neto"],
+                      e["deudas_mensuales"], e["tipo_hipoteca"], interes_fijo, diferencial))
+
+    referencia, t_ref = _cronometrar(lambda: [
+        escenarios_interes(d[0], d[1], TASAS_ESCENARIOS_PCT, *d[2:8], interes_fijo=d[8], diferencial=d[9]) for d in datos
+    ])
+
+    def rapido_fn():
+        col = lambda i: np.array([d[i] for d in datos])[:, None]
+        return escenarios_interes_lote(
+            col(0), col(1), TASAS_ESCENARIOS_PCT, col(2), col(3), col(4), col(5), col(6), col(7),
+            interes_fijo=col(8), diferencial=col(9)
+        )
+
+    rapido, t_rap = _cronometrar(rapido_fn)
+
+    metricas = {}
+    for clave in ["cuota", "dti", "viable"]:
+        ref = np.array([[fila[clave] for fila in filas] for filas in referencia], dtype=float)
+        metricas[f"escenarios.{clave}"] = _desviacion(ref, rapido[clave].astype(float))
+    return metricas, t_ref, t_rap
+
+
+def comparar_evaluacion(escenarios):
+    def interes_variable(e):
+        return e["euribor"] + e["diferencial"] if e["tipo_hipoteca"] == "Mixta" else None
+
+    def referencia_fn():
+        filas = []
+        for e in escenarios:
+            r = evaluar_vivienda(
+                e["precio"], e["entrada"], e["sueldo_neto"], e["deudas_mensuales"], e["params"], e["ltv_max"],
+                e["ratio_dti"], e["financiar_comision"], e["tipo_hipoteca"], e["interes_anual"], e["anos_plazo"],
+                interes_fijo=e["interes_fijo"], euribor=e["euribor"], diferencial=e["diferencial"]
+            )
+            pagos = pagos_totales_prestamo(
+                r["capital_final"], e["tipo_hipoteca"], e["interes_anual"], e["anos_plazo"],
+                interes_fijo=e["interes_fijo"], interes_variable=interes_variable(e), anios_fijo=e["anios_fijo"]
+            )
+            filas.append((r["cuota"], r["dti"], r["viable"], pagos))
+        return np.array(filas, dtype=float).T
+
+    referencia, t_ref = _cronometrar(referencia_fn)
+
+    def rapido_fn():
+        tipo = np.array([e["tipo_hipoteca"] for e in escenarios])
+        interes_anual, anos = _columna(escenarios, "interes_anual"), _columna(escenarios, "anos_plazo")
+        interes_fijo = _columna(escenarios, "interes_fijo")
+        r = evaluar_vivienda_lote(
+            _columna(escenarios, "precio"), _columna(escenarios, "entrada"), _columna(escenarios, "sueldo_neto"),
+            _columna(escenarios, "deudas_mensuales"), _params_lote(escenarios), _columna(escenarios, "ltv_max"),
+            _columna(escenarios, "ratio_dti"), np.array([e["financiar_comision"] for e in escenarios]),
+            tipo, interes_anual, anos, interes_fijo=interes_fijo, euribor=_columna(escenarios, "euribor"),
+            diferencial=_columna(escenarios, "diferencial"),
+        )
+        pagos = pagos_totales_lote(
+            r["capital_final"], tipo, interes_anual, anos, interes_fijo=interes_fijo,
+            interes_variable=_columna(escenarios, "euribor") + _columna(escenarios, "diferencial"),
+            anios_fijo=_columna(escenarios, "anios_fijo"),
+        )
+        return r["cuota"], r["dti"], r["viable"].astype(float), pagos
+
+    rapido, t_rap = _cronometrar(rapido_fn)
+
+    metricas = {}
+    for i, clave in enumerate(["cuota", "dti", "viable", "pagos_totales"]):
+        metricas[f"evaluacion.{clave}"] = _desviacion(referencia[i], rapido[i])
+    return metricas, t_ref, t_rap
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara el motor vectorizado con la implementación de referencia.")
+    parser.add_argument("--casos", type=int, default=20_000, help="Escenarios aleatorios por comparación.")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla para reproducir la ejecución.")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.semilla)
+    escenarios = [generar_escenario(rng) for _ in range(args.casos)]
+
+    print(f"Escenarios: {args.casos:,} · semilla: {args.semilla}\n")
+    print(f"{'Métrica':<34}{'Desv. abs. máx.':>16}{'Desv. rel. máx.':>16}{'Fuera tol.':>12}")
+
+    fallido = False
+    tiempos = []
+    for nombre, comparar in [("Precio máximo (bisección)", comparar_precio_maximo),
+                             ("Evolución anual (bucle mensual)", comparar_evolucion),
+                             ("Tablas precalculadas (rejilla)", comparar_tablas),
+                             ("Revisiones del tipo variable", comparar_revisiones),
+                             ("Escenarios de interés", comparar_escenarios),
+                             ("Evaluación y pagos totales", comparar_evaluacion)]:
+        metricas, t_ref, t_rap = comparar(escenarios)
+        tiempos.append((nombre, t_ref, t_rap))
+        for metrica, (abs_, rel) in metricas.items():
+            fuera = int((abs_ > TOLERANCIAS[metrica]).sum())
+            fallido = fallido or fuera > 0
+            print(f"{metrica:<34}{abs_.max():>16.3e}{rel.max():>16.3e}{fuera:>12,}")
+
+    print(f"\n{'Motor':<34}{'Referencia (s)':>16}{'Rápido (s)':>16}{'Aceleración':>12}")
+    for nombre, t_ref, t_rap in tiempos:
+        print(f"{nombre:<34}{t_ref:>16.3f}{t_rap:>16.3f}{t_ref / t_rap:>11.1f}x")
+
+    print("\n✅ Equivalencia dentro de tolerancias." if not fallido else "\n❌ Hay discrepancias fuera de tolerancia.")
+    return 1 if fallido else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
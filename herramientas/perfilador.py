@@ -0,0 +1,309 @@
+# ============================================================
+# 🔥 Perfilador de re-ejecuciones completas de app.py (flame graphs)
+# ============================================================
+# Ejecuta app.py sin navegador con el arnés de pruebas de Streamlit (AppTest) para cada
+# escenario fijo (modo 1, modo 2 Fija/Variable/Mixta y Guía) y perfila la re-ejecución:
+#
+# - Muestreo (por defecto): un hilo toma la pila del hilo del script cada `--intervalo` ms.
+#   Los marcos de los ficheros del repositorio llevan número de línea, así que el flame graph
+#   muestra qué líneas de app.py (código a nivel de módulo incluido) dominan cada modo.
+#   También muestrea los hilos de los pools de cache_resultados (en_paralelo y precálculo)
+#   mientras ejecutan una tarea: aparecen como raíces propias, «[hilo paralelo]» y «[hilo precalculo]».
+# - cProfile (`--cprofile`): además guarda un .prof por escenario para pstats/snakeviz.
+#
+# Por escenario escribe en `--salida`:
+#   <escenario>.collapsed  pilas plegadas (formato de flamegraph.pl, speedscope, inferno)
+#   <escenario>.svg        flame graph autocontenido (pasar el ratón muestra muestras y %)
+#   <escenario>.prof       estadísticas de cProfile (solo con --cprofile)
+#
+# Uso:
+#   python -m herramientas.perfilador --escenarios modo2-mixta guia --cache fria --salida perfiles
+
+import argparse
+import cProfile
+import html
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from streamlit.testing.v1 import AppTest
+
+from cache_resultados import CACHE_RESULTADOS
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_APP = os.path.join(RAIZ, "app.py")
+HILO_SCRIPT = "ScriptRunner.scriptThread"
+HILOS_POOL = ("paralelo", "precalculo")  # prefijos de nombre de los pools de cache_resultados
+
+_BASE = {"sueldo": 3000.0, "entrada": 60000.0, "edad": 35, "ccaa": "Madrid"}
+_MODO_1 = "🔎 Descubrir mi precio máximo"
+_MODO_2 = "🏠 Comprobar una vivienda concreta"
+
+# Escenario → valores de st.session_state antes de ejecutar el script
+ESCENARIOS = {
+    "modo1": {**_BASE, "modo": _MODO_1, "tipo_hipoteca": "Fija"},
+    "modo2-fija": {**_BASE, "modo": _MODO_2, "tipo_hipoteca": "Fija", "precio_comp": 220000.0},
+    "modo2-variable": {**_BASE, "modo": _MODO_2, "tipo_hipoteca": "Variable", "precio_comp": 220000.0},
+    "modo2-mixta": {**_BASE, "modo": _MODO_2, "tipo_hipoteca": "Mixta", "precio_comp": 220000.0},
+    "guia": {**_BASE, "modo": "📚 Guía Completa"},
+}
+
+
+# =========================
+# Muestreo de pilas
+# =========================
+def _etiqueta(marco):
+    """Nombre del marco: con fichero y línea si es del repositorio, solo función y módulo si es de una librería."""
+    codigo = marco.f_code
+    ruta = os.path.abspath(codigo.co_filename)
+    if ruta.startswith(RAIZ + os.sep) and "site-packages" not in ruta:
+        return f"{codigo.co_name} ({os.path.relpath(ruta, RAIZ)}:{marco.f_lineno})"
+    if "site-packages" + os.sep in ruta:
+        modulo = ruta.rsplit("site-packages" + os.sep, 1)[1].removesuffix(".py").replace(os.sep, ".")
+    else:
+        modulo = os.path.basename(ruta).removesuffix(".py")  # biblioteca estándar
+    return f"{codigo.co_name} ({modulo})"
+
+
+class Muestreador(threading.Thread):
+    """
+    Toma cada `intervalo` segundos la pila del hilo del script y la de los hilos de los pools que están
+    ejecutando una tarea (los ociosos, esperando en su cola, no cuentan), y acumula pilas plegadas.
+    Las pilas de los pools cuelgan de una raíz «[hilo <pool>]»: las muestras suman tiempo de hilo, no de reloj.
+    """
+
+    def __init__(self, intervalo):
+        super().__init__(name="perfilador.muestreador", daemon=True)
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._parar = threading.Event()
+
+    @staticmethod
+    def _raiz(hilo):
+        """None para el hilo del script, «[hilo <pool>]» para un hilo de pool y False para el resto."""
+        if hilo.name == HILO_SCRIPT:
+            return None
+        prefijo = next((p for p in HILOS_POOL if hilo.name.startswith(p + "_")), None)
+        return f"[hilo {prefijo}]" if prefijo else False
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            raices = {hilo.ident: self._raiz(hilo) for hilo in threading.enumerate()}
+            for ident, marco in sys._current_frames().items():
+                raiz = raices.get(ident, False)
+                if raiz is False:
+                    continue
+                pila = []
+                while marco is not None:
+                    pila.append(_etiqueta(marco))
+                    marco = marco.f_back
+                if raiz is not None:
+                    # Hilo de pool: solo cuenta mientras ejecuta una tarea (_WorkItem.run), no esperando en la cola
+                    if "run (thread)" not in pila:
+                        continue
+                    pila.append(raiz)
+                self.pilas[";".join(reversed(pila))] += 1
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+class PerfilHiloScript:
+    """
+    cProfile solo mide el hilo en el que se activa, y AppTest ejecuta el script en un hilo propio:
+    se instala un gancho para hilos nuevos que activa el perfil en cuanto arranca el del script.
+    """
+
+    def __init__(self):
+        self.perfil = cProfile.Profile()
+
+    def _gancho(self, *_):
+        if threading.current_thread().name == HILO_SCRIPT:
+            self.perfil.enable()  # sustituye al gancho en este hilo
+        else:
+            sys.setprofile(None)
+
+    def __enter__(self):
+        threading.setprofile(self._gancho)
+        return self
+
+    def __exit__(self, *_):
+        threading.setprofile(None)
+        self.perfil.disable()
+
+
+# =========================
+# Flame graph en SVG
+# =========================
+ANCHO_SVG, ALTO_FILA, MIN_ANCHO = 1200, 17, 0.5
+
+
+def _arbol(pilas):
+    raiz = {"n": 0, "hijos": {}}
+    for pila, muestras in pilas.items():
+        raiz["n"] += muestras
+        nodo = raiz
+        for marco in pila.split(";"):
+            nodo = nodo["hijos"].setdefault(marco, {"n": 0, "hijos": {}})
+            nodo["n"] += muestras
+    return raiz
+
+
+def _color(marco):
+    """Cálido para el código del repositorio (app.py más intenso), frío para librerías."""
+    semilla = sum(marco.encode()) % 40
+    if "(app.py:" in marco:
+        return f"rgb(235,{90 + semilla * 2},40)"
+    if ".py:" in marco:
+        return f"rgb(230,{150 + semilla * 2},60)"
+    return f"rgb({90 + semilla},{140 + semilla},200)"
+
+
+def flame_graph_svg(pilas, titulo):
+    """SVG autocontenido con la raíz abajo; cada rectángulo lleva un <title> con muestras y porcentaje."""
+    raiz = _arbol(pilas)
+    total = max(raiz["n"], 1)
+    escala = (ANCHO_SVG - 20) / total
+    rectangulos, profundidad_max = [], 0
+
+    def dibujar(nodo, x, profundidad):
+        nonlocal profundidad_max
+        for marco, hijo in sorted(nodo["hijos"].items()):
+            ancho = hijo["n"] * escala
+            if ancho >= MIN_ANCHO:
+                profundidad_max = max(profundidad_max, profundidad)
+                rectangulos.append((marco, hijo["n"], x, profundidad, ancho))
+                dibujar(hijo, x, profundidad + 1)
+            x += ancho
+
+    dibujar(raiz, 10.0, 0)
+    alto = (profundidad_max + 1) * ALTO_FILA + 50
+    partes = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{ANCHO_SVG}" height="{alto}" font-family="monospace" font-size="11">',
+        f'<rect width="100%" height="100%" fill="#fafafa"/>',
+        f'<text x="10" y="20" font-size="14">{html.escape(titulo)} · {total:,} muestras</text>',
+    ]
+    for marco, muestras, x, profundidad, ancho in rectangulos:
+        y = alto - (profundidad + 1) * ALTO_FILA - 10
+        texto = html.escape(marco)
+        visible = html.escape(marco[: int(ancho / 6.5)]) if ancho > 20 else ""
+        partes.append(
+            f'<g><title>{texto} · {muestras:,} muestras ({muestras / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{ancho:.1f}" height="{ALTO_FILA - 1}" fill="{_color(marco)}" rx="2"/>'
+            f'<text x="{x + 3:.1f}" y="{y + 12}">{visible}</text></g>'
+        )
+    partes.append("</svg>")
+    return "\n".join(partes)
+
+
+# =========================
+# Ejecución de escenarios
+# =========================
+def preparar(escenario):
+    at = AppTest.from_file(RUTA_APP, default_timeout=300)
+    for clave, valor in ESCENARIOS[escenario].items():
+        at.session_state[clave] = valor
+    return at
+
+
+def perfilar(escenario, intervalo, cache, usar_cprofile):
+    """Perfila una re-ejecución completa del escenario. Devuelve (segundos, pilas, perfil cProfile o None, excepciones)."""
+    at = preparar(escenario)
+    at.run()  # primera pasada sin medir: inicializa la sesión como la carga inicial en el navegador
+    if cache == "fria":
+        CACHE_RESULTADOS.limpiar()  # caliente: la re-ejecución perfilada encuentra los resultados ya calculados
+
+    muestreador = Muestreador(intervalo)
+    perfil = PerfilHiloScript() if usar_cprofile else None
+    # El muestreador necesita el GIL para leer la pila: se reduce el intervalo de cambio de hilo
+    # (5 ms por defecto) para que pueda muestrear al ritmo pedido mientras el script calcula.
+    intervalo_gil = sys.getswitchinterval()
+    sys.setswitchinterval(min(intervalo, intervalo_gil))
+    muestreador.start()
+    inicio = time.perf_counter()
+    try:
+        if perfil:
+            with perfil:
+                at.run()
+        else:
+            at.run()
+        segundos = time.perf_counter() - inicio
+    finally:
+        muestreador.parar()
+        sys.setswitchinterval(intervalo_gil)
+    return segundos, muestreador.pilas, perfil.perfil if perfil else None, [e.value for e in at.exception]
+
+
+def separar_compilacion(pilas):
+    """
+    AppTest crea una caché de bytecode nueva en cada run() y vuelve a compilar app.py; un servidor
+    la comparte entre sesiones y re-ejecuciones. Esas muestras se separan para no falsear el perfil.
+    """
+    script, compilacion = Counter(), 0
+    for pila, muestras in pilas.items():
+        if "get_bytecode (" in pila:
+            compilacion += muestras
+        else:
+            script[pila] = muestras
+    return script, compilacion
+
+
+def lineas_app_dominantes(pilas, n=12):
+    """
+    Líneas de app.py con más muestras inclusivas (una línea cuenta una vez por muestra). Incluye las
+    de los hilos de pool: una figura de en_paralelo aparece con la línea de su función, no solo con la espera.
+    """
+    por_linea = Counter()
+    for pila, muestras in pilas.items():
+        lineas = {marco.rsplit(":", 1)[1].rstrip(")") for marco in pila.split(";") if "(app.py:" in marco}
+        for linea in lineas:
+            por_linea[int(linea)] += muestras
+    return por_linea.most_common(n)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perfila re-ejecuciones completas de app.py y genera flame graphs.")
+    parser.add_argument("--escenarios", nargs="+", choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument("--intervalo", type=float, default=1.0, help="Intervalo de muestreo (ms).")
+    parser.add_argument("--cache", choices=["fria", "caliente"], default="fria",
+                        help="fria: caché de resultados vacía; caliente: re-ejecución tras una primera pasada.")
+    parser.add_argument("--cprofile", action="store_true", help="Guarda también un .prof de cProfile por escenario.")
+    parser.add_argument("--salida", default="perfiles", help="Carpeta de salida.")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)  # avisos de Streamlit sin servidor (ScriptRunContext, APIs obsoletas)
+    os.makedirs(args.salida, exist_ok=True)
+
+    errores = 0
+    for escenario in args.escenarios:
+        segundos, pilas, perfil, excepciones = perfilar(escenario, args.intervalo / 1000, args.cache, args.cprofile)
+        pilas, compilacion = separar_compilacion(pilas)
+        muestras_pool = sum(muestras for pila, muestras in pilas.items() if pila.startswith("[hilo "))
+        muestras_script = sum(pilas.values()) - muestras_pool
+        segundos *= muestras_script / max(muestras_script + compilacion, 1)
+        errores += bool(excepciones)
+        base = os.path.join(args.salida, escenario)
+        with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+            f.writelines(f"{pila} {muestras}\n" for pila, muestras in sorted(pilas.items()))
+        with open(f"{base}.svg", "w", encoding="utf-8") as f:
+            f.write(flame_graph_svg(pilas, f"{escenario} · caché {args.cache} · {segundos * 1000:.0f} ms"))
+        if perfil:
+            perfil.dump_stats(f"{base}.prof")
+
+        total = max(muestras_script, 1)
+        print(f"\n{escenario}: {segundos * 1000:.0f} ms · {total:,} muestras del script (+{compilacion:,} de compilación, "
+              f"excluidas; +{muestras_pool:,} en hilos de pool) · {base}.svg"
+              + (f" · {len(excepciones)} excepción(es): {str(excepciones[0])[:100]}" if excepciones else ""))
+        for linea, muestras in lineas_app_dominantes(pilas):
+            codigo = linecache.getline(RUTA_APP, linea).strip()[:70]
+            print(f"  {muestras / total:>6.1%}  app.py:{linea:<5} {codigo}")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
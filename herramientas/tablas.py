@@ -0,0 +1,44 @@
+# ============================================================
+# 📋 Generador de las tablas de amortización precalculadas
+# ============================================================
+# Escribe las tablas de tablas_amortizacion.py como ficheros .npy. Si la carpeta existe al
+# arrancar la app, las tablas se abren mapeadas en memoria en lugar de calcularse en cada proceso.
+#
+# Uso:
+#   python -m herramientas.tablas                      # datos/tablas_amortizacion/
+#   python -m herramientas.tablas --salida /ruta/tablas
+# También se puede indicar la carpeta a la app con la variable CALCULADORA_TABLAS.
+
+import argparse
+import sys
+import time
+
+from tablas_amortizacion import FORMAS, N_PLAZOS, N_TIPOS, RUTA_TABLAS, TablasAmortizacion, guardar_tablas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera las tablas de amortización para abrirlas con mmap.")
+    parser.add_argument("--salida", default=RUTA_TABLAS, help="Carpeta donde escribir los .npy.")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    tablas = guardar_tablas(args.salida)
+    duracion = time.perf_counter() - inicio
+
+    print(f"Rejilla: {N_TIPOS} tipos × {N_PLAZOS} plazos · {duracion:.2f} s\n")
+    for nombre in FORMAS:
+        tabla = tablas[nombre]
+        print(f"{nombre + '.npy':<24}{' × '.join(map(str, tabla.shape)):>18}{tabla.nbytes / 1e6:>10.1f} MB")
+
+    # Comprobación: la carpeta recién escrita se abre desde disco con las formas esperadas
+    comprobacion = TablasAmortizacion(args.salida)
+    comprobacion.factor(0.0, 30)
+    if comprobacion.origen != "disco":
+        print("\n❌ No se han podido abrir las tablas escritas.")
+        return 1
+    print(f"\n✅ Tablas escritas en {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+# ============================================================
+# ✅ Validador de consistencia del motor (basado en propiedades)
+# ============================================================
+# Sustituye al antiguo MODO_VALIDACION de app.py: en lugar de unos pocos casos fijos,
+# genera miles de escenarios aleatorios (reproducibles por semilla) y comprueba invariantes
+# del motor en paralelo con varios procesos.
+#
+# Uso:
+#   python -m herramientas.validador --casos 100000 --procesos 8 --semilla 42
+# Devuelve código de salida 1 si algún invariante falla.
+
+import argparse
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+from motor_fiscal import PERFILES_FISCALES, REGIONES, impuestos_compra
+from motor_hipotecario import (
+    DTI_FAIL,
+    buscar_precio_maximo,
+    cuota_maxima,
+    cuota_mixta_peor_tramo,
+    cuota_prestamo,
+    dti,
+    dti_visible,
+    es_viable,
+    evaluar_vivienda,
+    evolucion_anual,
+    soluciones_viabilidad,
+    tipo_revisado,
+)
+
+TIPOS_HIPOTECA = ["Fija", "Variable", "Mixta"]
+ESTADOS_VIVIENDA = ["Nuevo", "Segunda mano"]
+PERFILES = list(PERFILES_FISCALES)
+EJEMPLOS_POR_INVARIANTE = 3
+TOLERANCIA_EUR = 0.01  # céntimo
+
+
+# =========================
+# Generación de escenarios
+# =========================
+def generar_escenario(rng):
+    """Escenario aleatorio dentro de rangos realistas del mercado español."""
+    ccaa = rng.choice(REGIONES)
+    estado = rng.choice(ESTADOS_VIVIENDA)
+    perfil = rng.choice(PERFILES)
+    tipo_hipoteca = rng.choice(TIPOS_HIPOTECA)
+    anos_plazo = rng.randint(5, 40)
+
+    interes_fijo = euribor = diferencial = anios_fijo = None
+    if tipo_hipoteca == "Fija":
+        interes_anual = rng.uniform(0.005, 0.08)
+    elif tipo_hipoteca == "Variable":
+        # Como en la app: suelo legal del 0 %, así que un Euríbor negativo puede dejar el tipo en 0,0 exacto
+        euribor = rng.uniform(-0.01, 0.05)
+        diferencial = rng.uniform(0.0, 0.03)
+        interes_anual = tipo_revisado(euribor, diferencial, suelo=0.0)
+    else:
+        interes_fijo = rng.uniform(0.005, 0.06)
+        euribor = rng.uniform(-0.005, 0.05)
+        diferencial = rng.uniform(0.0, 0.03)
+        interes_anual = interes_fijo
+        anios_fijo = rng.randint(1, 30)
+
+    params = {
+        "tipo_impuesto": None,
+        "fiscal": (ccaa, estado, perfil),
+        "notario": rng.uniform(0, 2000),
+        "gestoria": rng.uniform(0, 800),
+        "registro": rng.uniform(0, 1000),
+        "tasacion": rng.uniform(0, 800),
+        "seguro_inicial": rng.uniform(0, 600),
+        "com_apertura_pct": rng.choice([0.0, rng.uniform(0, 0.02)]),
+    }
+
+    return {
+        "ccaa": ccaa,
+        "estado": estado,
+        "perfil": perfil,
+        "tipo_hipoteca": tipo_hipoteca,
+        "interes_anual": interes_anual,
+        "interes_fijo": interes_fijo,
+        "euribor": euribor,
+        "diferencial": diferencial,
+        "anios_fijo": anios_fijo,
+        "anos_plazo": anos_plazo,
+        "precio": rng.uniform(30_000, 2_500_000),
+        "entrada": rng.uniform(0, 400_000),
+        "sueldo_neto": rng.uniform(600, 12_000),
+        "deudas_mensuales": rng.choice([0.0, rng.uniform(0, 1500)]),
+        "ltv_max": rng.uniform(0.5, 1.0),
+        "ratio_dti": rng.uniform(0.2, 0.5),
+        "financiar_comision": rng.random() < 0.5,
+        "params": params,
+    }
+
+
+# =========================
+# Invariantes
+# =========================
+def comprobar_escenario(e):
+    """Devuelve la lista de invariantes que incumple el escenario (vacía si todo es coherente)."""
+    fallos = []
+    tipos = dict(interes_fijo=e["interes_fijo"], euribor=e["euribor"], diferencial=e["diferencial"])
+
+    r = evaluar_vivienda(
+        e["precio"], e["entrada"], e["sueldo_neto"], e["deudas_mensuales"], e["params"],
+        e["ltv_max"], e["ratio_dti"], e["financiar_comision"],
+        e["tipo_hipoteca"], e["interes_anual"], e["anos_plazo"], **tipos
+    )
+    capital = r["capital_final"]
+
+    # 1) Capital y gastos nunca negativos
+    if capital < 0 or r["gastos_puros"] < 0 or r["gastos_iniciales"] < 0:
+        fallos.append("capital_no_negativo")
+
+    # 2) Los impuestos no bajan al subir el precio (tramos progresivos y límites de bonificación)
+    impuestos = impuestos_compra(e["precio"], *e["params"]["fiscal"])["total"]
+    if impuestos_compra(e["precio"] * 1.01, *e["params"]["fiscal"])["total"] < impuestos or impuestos < 0:
+        fallos.append("impuestos_monotonos_en_precio")
+
+    # 3) La cuota crece con el tipo de interés
+    if capital > 0:
+        i = e["interes_anual"]
+        c_bajo = cuota_prestamo(capital, i - 0.005, e["anos_plazo"])
+        c_alto = cuota_prestamo(capital, i + 0.005, e["anos_plazo"])
+        if not (c_bajo <= cuota_prestamo(capital, i, e["anos_plazo"]) + 1e-9 <= c_alto + 2e-9):
+            fallos.append("cuota_monotona_en_interes")
+
+    # 4) El cuadro anual amortiza exactamente el capital
+    if capital > 0 and e["interes_anual"] > 0:
+        cuota = cuota_prestamo(capital, e["interes_anual"], e["anos_plazo"])
+        filas = evolucion_anual(capital, e["interes_anual"], e["anos_plazo"], cuota)
+        ultima = filas[-1]
+        if abs(ultima["Capital Pendiente"]) > TOLERANCIA_EUR or abs(ultima["Capital Amortizado"] - capital) > TOLERANCIA_EUR:
+            fallos.append("cuadro_amortiza_capital")
+
+    # 5) La viabilidad coincide con sus comprobaciones individuales
+    if not r["sin_hipoteca"]:
+        cuota_max = cuota_maxima(e["sueldo_neto"], e["deudas_mensuales"], ratio=e["ratio_dti"])
+        esperado = (
+            r["cuota"] > 0
+            and r["cuota"] <= cuota_max
+            and r["ltv"] <= e["ltv_max"]
+            and dti_visible(r["dti"]) <= DTI_FAIL
+        )
+        if r["viable"] != esperado or r["viable"] != (r["cuota"] > 0 and es_viable(r["cuota"], cuota_max, r["ltv"], e["ltv_max"], r["dti"])):
+            fallos.append("viabilidad_coherente")
+
+    # 6) En Mixta, la cuota de validación cubre ambos tramos
+    if e["tipo_hipoteca"] == "Mixta" and capital > 0:
+        peor, c_fija, c_var, _ = cuota_mixta_peor_tramo(capital, e["anos_plazo"], e["interes_fijo"], e["euribor"], e["diferencial"])
+        if peor < c_fija or peor < c_var or abs(r["cuota"] - peor) > 1e-9:
+            fallos.append("mixta_peor_tramo")
+
+    # 7) En Fija/Variable la cuota es la francesa al tipo dado, también a un tipo del 0 % (capital / n)
+    if e["tipo_hipoteca"] != "Mixta" and capital > 0 and not r["sin_hipoteca"]:
+        if abs(r["cuota"] - cuota_prestamo(capital, e["interes_anual"], e["anos_plazo"])) > 1e-9:
+            fallos.append("cuota_fija_variable")
+
+    # 8) El precio máximo del modo 1 es viable al evaluarlo como vivienda concreta
+    cuota_max = cuota_maxima(e["sueldo_neto"], e["deudas_mensuales"], ratio=e["ratio_dti"])
+    precio_max = buscar_precio_maximo(
+        e["entrada"], e["sueldo_neto"], e["deudas_mensuales"], cuota_max, e["params"],
+        e["ltv_max"], e["financiar_comision"], e["tipo_hipoteca"], e["interes_anual"], e["anos_plazo"], **tipos
+    )
+    if precio_max > 0:
+        r_max = evaluar_vivienda(
+            precio_max, e["entrada"], e["sueldo_neto"], e["deudas_mensuales"], e["params"],
+            e["ltv_max"], e["ratio_dti"], e["financiar_comision"],
+            e["tipo_hipoteca"], e["interes_anual"], e["anos_plazo"], **tipos
+        )
+        cuota_max_ok = r_max["cuota"] <= cuota_max
+        dti_ok = dti_visible(dti(r_max["cuota"], e["deudas_mensuales"], e["sueldo_neto"])) <= DTI_FAIL
+        if not (r_max["ltv_ok"] and cuota_max_ok and dti_ok and e["entrada"] >= r_max["gastos_puros"]):
+            fallos.append("precio_maximo_viable")
+
+    # 9) Cada umbral de los solvers inversos hace viable la operación por sí solo
+    argumentos = dict(
+        precio=e["precio"], entrada=e["entrada"], sueldo_neto=e["sueldo_neto"], deudas_mensuales=e["deudas_mensuales"],
+        params=e["params"], ltv_max=e["ltv_max"], ratio_dti=e["ratio_dti"], financiar_comision=e["financiar_comision"],
+        tipo_hipoteca=e["tipo_hipoteca"], interes_anual=e["interes_anual"], anos_plazo=e["anos_plazo"], **tipos
+    )
+    soluciones = soluciones_viabilidad(**argumentos)
+    cambios = {
+        "entrada_min": {"entrada": soluciones["entrada_min"]},
+        "sueldo_min": {"sueldo_neto": soluciones["sueldo_min"]},
+        "plazo_min": {"anos_plazo": soluciones["plazo_min"]},
+    }
+    if soluciones["interes_max"] is not None:
+        if e["tipo_hipoteca"] == "Mixta":
+            cambios["interes_max"] = {"euribor": soluciones["interes_max"] - e["diferencial"]}
+        else:
+            cambios["interes_max"] = {"interes_anual": soluciones["interes_max"]}
+    for nombre, cambio in cambios.items():
+        if None in cambio.values():
+            continue
+        r_sol = evaluar_vivienda(**{**argumentos, **cambio})
+        if not (r_sol["diferencia_entrada"] >= 0 and (r_sol["sin_hipoteca"] or r_sol["viable"])):
+            fallos.append(f"solver_{nombre}")
+
+    return fallos
+
+
+def validar_lote(args):
+    """Trabajo de un proceso: genera y valida su lote a partir de semilla + id de lote."""
+    semilla, id_lote, tam_lote = args
+    rng = random.Random(semilla * 1_000_003 + id_lote)
+    conteo, ejemplos = {}, {}
+    for _ in range(tam_lote):
+        escenario = generar_escenario(rng)
+        try:
+            fallos = comprobar_escenario(escenario)
+        except Exception as exc:  # una excepción también es una violación
+            fallos = [f"excepcion:{type(exc).__name__}"]
+        for nombre in fallos:
+            conteo[nombre] = conteo.get(nombre, 0) + 1
+            lista = ejemplos.setdefault(nombre, [])
+            if len(lista) < EJEMPLOS_POR_INVARIANTE:
+                lista.append(escenario)
+    return tam_lote, conteo, ejemplos
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validación basada en propiedades del motor hipotecario.")
+    parser.add_argument("--casos", type=int, default=100_000, help="Número total de escenarios aleatorios.")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Procesos en paralelo.")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla para reproducir la ejecución.")
+    parser.add_argument("--tam-lote", type=int, default=2_000, help="Escenarios por lote de trabajo.")
+    args = parser.parse_args(argv)
+
+    lotes = []
+    restantes, id_lote = args.casos, 0
+    while restantes > 0:
+        n = min(args.tam_lote, restantes)
+        lotes.append((args.semilla, id_lote, n))
+        restantes -= n
+        id_lote += 1
+
+    inicio = time.perf_counter()
+    conteo_total, ejemplos_total, hechos = {}, {}, 0
+    with Pool(processes=max(1, args.procesos)) as pool:
+        for n, conteo, ejemplos in pool.imap_unordered(validar_lote, lotes):
+            hechos += n
+            for nombre, c in conteo.items():
+                conteo_total[nombre] = conteo_total.get(nombre, 0) + c
+                lista = ejemplos_total.setdefault(nombre, [])
+                lista.extend(ejemplos[nombre][: EJEMPLOS_POR_INVARIANTE - len(lista)])
+    duracion = time.perf_counter() - inicio
+
+    print(f"Escenarios: {hechos:,} · procesos: {args.procesos} · semilla: {args.semilla}")
+    print(f"Tiempo: {duracion:.1f} s ({hechos / duracion:,.0f} escenarios/s)")
+
+    if not conteo_total:
+        print("✅ Todos los invariantes se cumplen.")
+        return 0
+
+    print("❌ Invariantes incumplidos:")
+    for nombre, c in sorted(conteo_total.items(), key=lambda kv: -kv[1]):
+        print(f"  - {nombre}: {c:,} casos")
+        for ejemplo in ejemplos_total[nombre]:
+            print(f"      {ejemplo}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
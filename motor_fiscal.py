@@ -0,0 +1,259 @@
+# ============================================================
+# 🧾 Motor fiscal basado en tabla
+# ============================================================
+# Las reglas fiscales (IVA/ITP por tramos de precio, AJD y bonificaciones por perfil) viven en
+# datos/reglas_fiscales.json. Al importar el módulo se compilan en arrays planos indexados por
+# (región, estado, perfil), de modo que calcular impuestos sobre un array de precios es una única
+# operación vectorizada, sin búsquedas en diccionarios por fila.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+RUTA_REGLAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "reglas_fiscales.json")
+
+ESTADOS = ["Nuevo", "Segunda mano"]
+_CLAVE_ESTADO = {"Nuevo": "nuevo", "Segunda mano": "segunda"}
+_IMPUESTO_TRANSMISION = {"nuevo": "iva", "segunda": "itp"}
+
+
+def cargar_reglas(ruta=RUTA_REGLAS):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def huella_reglas(ruta=RUTA_REGLAS):
+    """Resumen corto del fichero de reglas: cambia en cuanto cambia cualquier tipo o tramo."""
+    with open(ruta, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _normalizar_tramos(valor):
+    """Un tipo fijo equivale a un único tramo sin límite superior."""
+    if isinstance(valor, (int, float)):
+        return [(np.inf, float(valor))]
+    return [(np.inf if t["hasta"] is None else float(t["hasta"]), float(t["tipo"])) for t in valor]
+
+
+def compilar_reglas(reglas):
+    """
+    Convierte las reglas en arrays con forma (regiones, estados, perfiles[, tramos]):
+    - inferiores/anchos/tipos: tramos progresivos del IVA/ITP (rellenados con anchura 0)
+    - ajd: tipo de AJD
+    - precio_max: precio a partir del cual la bonificación deja de aplicar (se usa el perfil general)
+    """
+    regiones = sorted(reglas["regiones"])
+    perfiles = list(reglas["perfiles"])
+    celdas = {}
+    for i, region in enumerate(regiones):
+        datos = reglas["regiones"][region]
+        for j, estado in enumerate(ESTADOS):
+            clave = _CLAVE_ESTADO[estado]
+            general = datos[clave]
+            for k, perfil in enumerate(perfiles):
+                regla = dict(general)
+                regla.update(datos.get("bonificaciones", {}).get(perfil, {}).get(clave, {}))
+                celdas[i, j, k] = (
+                    _normalizar_tramos(regla[_IMPUESTO_TRANSMISION[clave]]),
+                    float(regla.get("ajd", 0.0)),
+                    float(regla.get("precio_max") or np.inf),
+                )
+
+    forma = (len(regiones), len(ESTADOS), len(perfiles))
+    max_tramos = max(len(tramos) for tramos, _, _ in celdas.values())
+    inferiores = np.zeros(forma + (max_tramos,))
+    anchos = np.zeros(forma + (max_tramos,))
+    tipos = np.zeros(forma + (max_tramos,))
+    ajd = np.zeros(forma)
+    precio_max = np.full(forma, np.inf)
+    for indice, (tramos, tipo_ajd, limite) in celdas.items():
+        inferior = 0.0
+        for t, (hasta, tipo) in enumerate(tramos):
+            inferiores[indice + (t,)] = inferior
+            anchos[indice + (t,)] = hasta - inferior
+            tipos[indice + (t,)] = tipo
+            inferior = hasta
+        inferiores[indice + (slice(len(tramos), None),)] = np.inf
+        ajd[indice] = tipo_ajd
+        precio_max[indice] = limite
+
+    return {
+        "regiones": regiones,
+        "perfiles": perfiles,
+        "inferiores": inferiores,
+        "anchos": anchos,
+        "tipos": tipos,
+        "ajd": ajd,
+        "precio_max": precio_max,
+    }
+
+
+# =========================
+# Tabla compilada (una vez por proceso)
+# =========================
+REGLAS_FISCALES = cargar_reglas()
+TABLA_FISCAL = compilar_reglas(REGLAS_FISCALES)
+HUELLA_REGLAS = huella_reglas()
+
+REGIONES = TABLA_FISCAL["regiones"]
+PERFILES_FISCALES = REGLAS_FISCALES["perfiles"]  # clave -> etiqueta visible
+_INDICE_REGION = {r: i for i, r in enumerate(REGIONES)}
+_INDICE_ESTADO = {e: i for i, e in enumerate(ESTADOS)}
+_INDICE_PERFIL = {p: i for i, p in enumerate(TABLA_FISCAL["perfiles"])}
+_REGION_POR_DEFECTO = _INDICE_REGION[REGLAS_FISCALES["region_por_defecto"]]
+
+# Copia por celda en tuplas de Python para el cálculo de un único precio
+_CELDAS = {
+    indice: (
+        [(float(i), float(a), float(t)) for i, a, t in zip(
+            TABLA_FISCAL["inferiores"][indice], TABLA_FISCAL["anchos"][indice], TABLA_FISCAL["tipos"][indice]
+        ) if a > 0],
+        float(TABLA_FISCAL["ajd"][indice]),
+        float(TABLA_FISCAL["precio_max"][indice]),
+    )
+    for indice in np.ndindex(TABLA_FISCAL["ajd"].shape)
+}
+
+
+def _traducir(valor, indice, defecto=None):
+    if isinstance(valor, str):
+        return indice.get(valor, defecto)
+    valor = np.asarray(valor)
+    if valor.dtype.kind in "iu":
+        return valor
+    return np.array([indice.get(v, defecto) for v in valor.ravel()]).reshape(valor.shape)
+
+
+def indices_fiscales(region, estado, perfil="general"):
+    """Traduce nombres (o arrays de nombres) a índices de la tabla. Región desconocida → región por defecto."""
+    return (
+        _traducir(region, _INDICE_REGION, _REGION_POR_DEFECTO),
+        _traducir(estado, _INDICE_ESTADO),
+        _traducir(perfil, _INDICE_PERFIL, 0),
+    )
+
+
+def _impuestos_celda(precio, region, estado, perfil):
+    base = np.minimum(
+        np.maximum(precio[..., None] - TABLA_FISCAL["inferiores"][region, estado, perfil], 0.0),
+        TABLA_FISCAL["anchos"][region, estado, perfil],
+    )
+    tipos = TABLA_FISCAL["tipos"][region, estado, perfil]
+    tipo_ajd = TABLA_FISCAL["ajd"][region, estado, perfil]
+    # Como los tramos cubren todo el precio, sumar el AJD en cada tramo da el total con un solo producto
+    total = (base * (tipos + tipo_ajd[..., None])).sum(axis=-1)
+    return (base * tipos).sum(axis=-1), precio * tipo_ajd, total
+
+
+def _impuestos_escalar(precio, celda):
+    """Misma cuenta que _impuestos_celda para un único precio, sin el coste fijo de NumPy (bisección del modo 1)."""
+    tramos, tipo_ajd, _ = celda
+    transmision = total = 0.0
+    for inferior, ancho, tipo in tramos:
+        base = min(max(precio - inferior, 0.0), ancho)
+        transmision += base * tipo
+        total += base * (tipo + tipo_ajd)
+    return {"transmision": transmision, "ajd": precio * tipo_ajd, "total": total}
+
+
+def impuestos_compra(precio, region, estado, perfil="general"):
+    """
+    Impuestos de compra para un precio o un array de precios (región/estado/perfil por nombre o índice).
+    Devuelve {"transmision": IVA o ITP, "ajd": AJD, "total": suma}. Si el precio supera el límite
+    de la bonificación del perfil, se aplican los tipos generales.
+    """
+    r, e, p = indices_fiscales(region, estado, perfil)
+    if isinstance(precio, (int, float)) and (r, e, p) in _CELDAS:
+        celda = _CELDAS[r, e, p] if precio <= _CELDAS[r, e, p][2] else _CELDAS[r, e, 0]
+        return _impuestos_escalar(float(precio), celda)
+    precio_arr = np.asarray(precio, dtype=float)
+
+    bonificado = _impuestos_celda(precio_arr, r, e, p)
+    general = _impuestos_celda(precio_arr, r, e, 0)
+    aplica = precio_arr <= TABLA_FISCAL["precio_max"][r, e, p]
+    resultado = {
+        clave: np.where(aplica, b, g)
+        for clave, b, g in zip(["transmision", "ajd", "total"], bonificado, general)
+    }
+    if np.ndim(resultado["total"]) == 0:
+        return {clave: float(v) for clave, v in resultado.items()}
+    return resultado
+
+
+def preparar_impuestos_totales(region, estado, perfil="general"):
+    """
+    Extrae una sola vez de la tabla los tramos de (región, estado, perfil) y devuelve una función
+    precio -> impuestos totales. Para búsquedas que evalúan muchos precios con la misma fiscalidad.
+    """
+    r, e, p = indices_fiscales(region, estado, perfil)
+    tabla = TABLA_FISCAL
+    celdas = [
+        (tabla["inferiores"][r, e, q], tabla["anchos"][r, e, q], tabla["tipos"][r, e, q] + tabla["ajd"][r, e, q][..., None])
+        for q in (p, 0)
+    ]
+    precio_max = tabla["precio_max"][r, e, p]
+    con_limite = bool(np.isfinite(precio_max).any())
+
+    def total(precio, celda):
+        inferiores, anchos, tipos = celda
+        return (np.minimum(np.maximum(precio[..., None] - inferiores, 0.0), anchos) * tipos).sum(axis=-1)
+
+    def impuestos_totales(precio):
+        precio = np.asarray(precio, dtype=float)
+        if not con_limite:
+            return total(precio, celdas[0])
+        return np.where(precio <= precio_max, total(precio, celdas[0]), total(precio, celdas[1]))
+
+    return impuestos_totales
+
+
+def nombre_impuesto_transmision(estado):
+    return "IVA" if estado == "Nuevo" else "ITP"
+
+
+# =========================
+# Textos explicativos generados desde la tabla
+# =========================
+def _fmt_pct(tipo, decimales=None):
+    texto = f"{tipo * 100:.{decimales}f}" if decimales is not None else f"{tipo * 100:g}"
+    return texto.replace(".", ",") + "%"
+
+
+def _fmt_eur(valor):
+    return f"{valor:,.0f} €".replace(",", ".")
+
+
+def _describir_tramos(nombre, tramos):
+    if len(tramos) == 1:
+        return f"{nombre} {_fmt_pct(tramos[0][1])}"
+    partes = [f"{_fmt_pct(tipo)} hasta {_fmt_eur(hasta)}" for hasta, tipo in tramos[:-1]]
+    return f"{nombre} por tramos: {', '.join(partes)} y {_fmt_pct(tramos[-1][1])} por encima"
+
+
+def _describir_regla(regla, clave):
+    texto = _describir_tramos(_IMPUESTO_TRANSMISION[clave].upper(), _normalizar_tramos(regla[_IMPUESTO_TRANSMISION[clave]]))
+    if clave == "nuevo":
+        texto += f" + AJD {_fmt_pct(regla.get('ajd', 0.0), 1)}"
+    return texto
+
+
+def explicacion_impuestos(region, estado, perfil="general"):
+    """Texto para el usuario con los tipos que se aplican (y la bonificación del perfil, si existe)."""
+    datos = REGLAS_FISCALES["regiones"].get(region)
+    if datos is None:
+        return None
+    clave = _CLAVE_ESTADO[estado]
+    estado_txt = "obra nueva" if clave == "nuevo" else "segunda mano"
+    nota = f" ({datos['nota']})" if datos.get("nota") else ""
+    texto = f"En {region} ({estado_txt}) se aplica {_describir_regla(datos[clave], clave)}{nota}."
+
+    bonificacion = datos.get("bonificaciones", {}).get(perfil, {}).get(clave)
+    if bonificacion:
+        regla = {**datos[clave], **bonificacion}
+        condicion = f" si el precio no supera {_fmt_eur(bonificacion['precio_max'])}" if bonificacion.get("precio_max") else ""
+        texto += f" Con perfil {PERFILES_FISCALES[perfil].lower()}: {_describir_regla(regla, clave)}{condicion}."
+    elif perfil != "general":
+        texto += f" No hay bonificación para el perfil {PERFILES_FISCALES[perfil].lower()} en esta simplificación."
+    return texto
@@ -0,0 +1,579 @@
+# ============================================================
+# 🧮 Motor de cálculo hipotecario
+# ============================================================
+# Funciones puras (sin Streamlit) que usa app.py. Al poder importarse por separado,
+# las herramientas de validación y de lotes ejecutan exactamente los mismos cálculos que la app.
+# Estas implementaciones escalares (bucles incluidos) son también la referencia contra la que
+# herramientas/oraculo.py compara las versiones rápidas de motor_vectorial.py.
+
+import math
+from collections import namedtuple
+from math import isclose
+
+from motor_fiscal import impuestos_compra
+
+
+# =========================
+# Umbrales globales de DTI
+# =========================
+DTI_WARN = 0.30   # ≤ 30% → Seguro
+DTI_FAIL = 0.35   # ≤ 35% → Moderado; > 35% → Arriesgado
+
+
+def dti_visible(dti_val):
+    """Devuelve el DTI visible como proporción (0–1) alineada con pct_dti.
+    Usa ceil para mostrar el valor más conservador al usuario."""
+    if dti_val is None:
+        return None
+    val_pct = math.ceil(dti_val * 10000) / 100  # ej. 35.01 (%)
+    return val_pct / 100  # 0.3501
+
+def es_viable(cuota, cuota_max, ltv_val, ltv_max, dti_val):
+    """
+    Valida la operación usando los mismos criterios que ve el usuario:
+    - Cuota ≤ cuota máxima
+    - LTV ≤ LTV máximo
+    - DTI visible (redondeado hacia arriba a 2 decimales) ≤ 35 %
+    """
+    return (
+        cuota <= cuota_max
+        and ltv_val <= ltv_max
+        and dti_visible(dti_val) <= DTI_FAIL
+    )
+
+
+# =========================
+# Cálculos financieros
+# =========================
+def cuota_prestamo(capital, interes_anual, anos):
+    n = int(anos * 12)
+    if n <= 0 or capital is None or capital <= 0:
+        return None
+    r = interes_anual / 12.0
+    if isclose(r, 0.0, abs_tol=1e-12):
+        return capital / n
+    return capital * (r / (1 - (1 + r) ** (-n)))
+
+def cuota_maxima(sueldo_neto_mensual, deudas_mensuales, ratio=0.35):
+    return max(0.0, sueldo_neto_mensual * ratio - deudas_mensuales)
+
+def dti(cuota_hipoteca, deudas_mensuales, sueldo_neto_mensual):
+    """Calcula DTI con precisión de 6 decimales internamente."""
+    if sueldo_neto_mensual is None or sueldo_neto_mensual <= 0:
+        return 0.0
+    if cuota_hipoteca is None or cuota_hipoteca < 0:
+        cuota_hipoteca = 0.0
+    if deudas_mensuales is None or deudas_mensuales < 0:
+        deudas_mensuales = 0.0
+    val = (cuota_hipoteca + deudas_mensuales) / sueldo_neto_mensual
+    return round(val, 6)  # redondeamos a 6 decimales para evitar errores de precisión
+
+def cuota_mixta_peor_tramo(capital, plazo_anios, interes_fijo_pct, euribor_pct, diferencial_pct):
+    """
+    Calcula ambas cuotas (fijo y variable) sobre el plazo total y devuelve:
+    (cuota_peor, cuota_fija, cuota_variable, tramo_peor)
+    """
+    if capital is None or capital <= 0 or plazo_anios <= 0:
+        return None, None, None, None
+
+    r_fijo = (interes_fijo_pct or 0.0)
+    r_var  = ((euribor_pct or 0.0) + (diferencial_pct or 0.0))
+
+    cuota_fija = cuota_prestamo(capital, r_fijo, plazo_anios) or 0.0
+    cuota_var  = cuota_prestamo(capital, r_var,  plazo_anios) or 0.0
+
+    cuota_peor = max(cuota_fija, cuota_var)
+    tramo_peor = "FIJO" if cuota_peor == cuota_fija else "VARIABLE"
+    return cuota_peor, cuota_fija, cuota_var, tramo_peor
+
+
+def cuota_segun_tipo(capital, tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """
+    Cuota mensual con la que la app valida la operación y tramo evaluado.
+    - Fija/Variable: cuota al interés anual (0,0 si no se indica; al 0 % la cuota es capital / n).
+    - Mixta: la peor de las cuotas fija y variable calculadas sobre el plazo total.
+    Devuelve (cuota, tramo_peor); tramo_peor solo aplica a Mixta.
+    """
+    if tipo_hipoteca in ["Fija", "Variable"] and interes_anual is not None:
+        return cuota_prestamo(capital, interes_anual, anos_plazo) or 0.0, None
+    if tipo_hipoteca == "Mixta" and (interes_fijo is not None) and (euribor is not None) and (diferencial is not None):
+        cuota_fijo = cuota_prestamo(capital, interes_fijo, anos_plazo) or 0.0
+        cuota_var = cuota_prestamo(capital, euribor + diferencial, anos_plazo) or 0.0
+        cuota = max(cuota_fijo, cuota_var)
+        return cuota, ("FIJO" if cuota == cuota_fijo else "VARIABLE")
+    return 0.0, None
+
+
+def tramos_mixta(capital, anos_plazo, interes_fijo, interes_variable, anios_fijo):
+    """
+    Cuotas de los dos tramos de una Mixta, con el modelo de la tabla de amortización:
+    el tramo fijo usa el plazo total y, al acabar, el capital pendiente se amortiza al interés
+    variable en los años restantes. Devuelve (cuota_fijo, capital_pendiente, cuota_variable);
+    cuota_variable es None si no queda plazo o capital para el tramo variable.
+    """
+    anios_fijo = min(max(int(anios_fijo or 0), 0), anos_plazo)
+    cuota_fijo = cuota_prestamo(capital, interes_fijo, anos_plazo) or 0.0
+    r_fijo = interes_fijo / 12
+    capital_pendiente = capital
+    for _ in range(anios_fijo * 12):
+        capital_pendiente -= cuota_fijo - capital_pendiente * r_fijo
+    plazo_var = anos_plazo - anios_fijo
+    cuota_variable = None
+    if plazo_var > 0 and capital_pendiente > 0:
+        cuota_variable = cuota_prestamo(capital_pendiente, interes_variable, plazo_var) or 0.0
+    return cuota_fijo, capital_pendiente, cuota_variable
+
+
+def pagos_totales_prestamo(capital, tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, interes_variable=None,
+                           anios_fijo=None):
+    """
+    Suma de todas las cuotas pagadas al banco durante el plazo (intereses = pagos - capital).
+    - Fija/Variable: cuota constante durante todo el plazo.
+    - Mixta: en el tramo fijo la cuota se calcula con el plazo total; al acabar, el capital pendiente
+      se amortiza al interés variable en los años restantes (mismo modelo que la tabla de amortización).
+    """
+    if capital is None or capital <= 0 or anos_plazo <= 0:
+        return 0.0
+    if tipo_hipoteca in ["Fija", "Variable"]:
+        if interes_anual is None:
+            return 0.0
+        return (cuota_prestamo(capital, interes_anual, anos_plazo) or 0.0) * anos_plazo * 12
+    if tipo_hipoteca == "Mixta" and interes_fijo is not None and interes_variable is not None:
+        anios_fijo = min(max(int(anios_fijo or 0), 0), anos_plazo)
+        cuota_fijo, _, cuota_variable = tramos_mixta(capital, anos_plazo, interes_fijo, interes_variable, anios_fijo)
+        pagos = cuota_fijo * anios_fijo * 12
+        if cuota_variable is not None:
+            pagos += cuota_variable * (anos_plazo - anios_fijo) * 12
+        return pagos
+    return 0.0
+
+
+# =========================
+# Función unificada de cálculo
+# =========================
+def calcular_capital_y_gastos(precio, entrada, params, ltv_max=0.80, financiar_comision=False):
+    # Tabla fiscal (región, estado, perfil) o tipo introducido manualmente
+    if params.get("fiscal"):
+        impuestos = impuestos_compra(precio, *params["fiscal"])["total"]
+    else:
+        impuestos = precio * params["tipo_impuesto"]
+    gastos_puros = impuestos + params["notario"] + params["gestoria"] + params["registro"] + params["tasacion"] + params["seguro_inicial"]
+
+    diferencia_entrada = entrada - gastos_puros
+    excedente = max(0.0, diferencia_entrada)
+    capital_preliminar = max(0.0, precio - excedente)
+
+    com_apertura = capital_preliminar * params["com_apertura_pct"] if params["com_apertura_pct"] > 0 else 0.0
+    if financiar_comision:
+        capital_final = capital_preliminar + com_apertura
+        gastos_iniciales = gastos_puros
+    else:
+        capital_final = capital_preliminar
+        gastos_iniciales = gastos_puros + com_apertura
+
+    ltv_real = (capital_final / precio) if (precio is not None and precio > 0) else 0.0
+    ltv_ok = ltv_real <= ltv_max
+
+    return {
+        "gastos_puros": gastos_puros,
+        "gastos_iniciales": gastos_iniciales,
+        "capital_final": capital_final,
+        "excedente": excedente,
+        "diferencia_entrada": diferencia_entrada,
+        "ltv": ltv_real,
+        "ltv_ok": ltv_ok
+    }
+
+
+def evaluar_vivienda(precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+                     tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """Evaluación principal del modo 2 (capital, cuota, DTI y viabilidad) para una vivienda concreta."""
+    r = calcular_capital_y_gastos(
+        precio, entrada, params,
+        ltv_max=ltv_max, financiar_comision=financiar_comision
+    )
+    cuota_max = cuota_maxima(sueldo_neto, deudas_mensuales, ratio=ratio_dti)
+
+    # Compra al contado si la entrada cubre el precio completo
+    sin_hipoteca = (r["capital_final"] <= 0 and r["diferencia_entrada"] >= precio)
+
+    cuota, tramo_peor = 0.0, None
+    if not sin_hipoteca:
+        cuota, tramo_peor = cuota_segun_tipo(
+            r["capital_final"], tipo_hipoteca, interes_anual, anos_plazo,
+            interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+        )
+
+    dti_val = round(dti(cuota, deudas_mensuales, sueldo_neto), 4) if (sueldo_neto > 0 and not sin_hipoteca) else 0.0
+
+    return {
+        **r,
+        "cuota_max": cuota_max,
+        "sin_hipoteca": sin_hipoteca,
+        "cuota": cuota,
+        "tramo_peor": tramo_peor,
+        "dti": dti_val,
+        "viable": cuota > 0 and es_viable(cuota, cuota_max, r["ltv"], ltv_max, dti_val),
+    }
+
+
+# =========================
+# Solvers inversos (modo 2): qué haría viable la operación
+# =========================
+PLAZO_MIN_ANIOS = 5
+PLAZO_MAX_ANIOS = 40
+INTERES_MAX_BUSQUEDA = 0.25
+CENTIMO = 0.01
+
+
+def _cuota_viable(cuota, cuota_max, ltv_val, ltv_max, deudas_mensuales, sueldo_neto):
+    """Mismo criterio que evaluar_vivienda (DTI redondeado a 4 decimales antes del DTI visible)."""
+    dti_val = round(dti(cuota, deudas_mensuales, sueldo_neto), 4) if sueldo_neto > 0 else 0.0
+    return cuota > 0 and es_viable(cuota, cuota_max, ltv_val, ltv_max, dti_val)
+
+
+def _subir_hasta_cumplir(valor, cumple, intentos=100):
+    """Redondea al céntimo superior una estimación analítica y la corrige al alza si los redondeos del DTI lo exigen."""
+    centimos = math.ceil(round(valor / CENTIMO, 6))
+    for i in range(intentos):
+        if cumple((centimos + i) * CENTIMO):
+            return round((centimos + i) * CENTIMO, 2)
+    return None
+
+
+def entrada_minima_viable(precio, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+                          tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """
+    Entrada mínima que hace viable la compra. Analítica: la cuota es lineal en el capital, así que el
+    capital máximo es min(cuota límite / cuota por euro, LTV máx. · precio) y la entrada cubre gastos + el resto.
+    """
+    tipos = dict(interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial)
+    gastos_puros = calcular_capital_y_gastos(precio, 0.0, params, ltv_max=ltv_max, financiar_comision=financiar_comision)["gastos_puros"]
+    cuota_max = cuota_maxima(sueldo_neto, deudas_mensuales, ratio=ratio_dti)
+    cuota_limite = min(cuota_max, DTI_FAIL * sueldo_neto - deudas_mensuales)
+    cuota_por_euro, _ = cuota_segun_tipo(1.0, tipo_hipoteca, interes_anual, anos_plazo, **tipos)
+
+    capital_max = 0.0
+    if cuota_por_euro > 0 and cuota_limite > 0:
+        capital_max = min(cuota_limite / cuota_por_euro, ltv_max * precio)
+    if financiar_comision and params["com_apertura_pct"] > 0:
+        capital_max /= 1 + params["com_apertura_pct"]
+
+    def cumple(entrada):
+        r = evaluar_vivienda(precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti,
+                             financiar_comision, tipo_hipoteca, interes_anual, anos_plazo, **tipos)
+        return r["diferencia_entrada"] >= 0 and (r["sin_hipoteca"] or r["viable"])
+
+    return _subir_hasta_cumplir(gastos_puros + max(0.0, precio - capital_max), cumple)
+
+
+def sueldo_minimo_viable(capital, cuota, ltv_val, ltv_max, deudas_mensuales, ratio_dti):
+    """Ingresos netos mínimos para la cuota actual: cuota + deudas ≤ sueldo · min(ratio, DTI máx.)."""
+    if cuota <= 0 or capital <= 0 or ltv_val > ltv_max:
+        return None  # sin cuota o con LTV excedido, ningún sueldo la hace viable
+
+    def cumple(sueldo):
+        return _cuota_viable(cuota, cuota_maxima(sueldo, deudas_mensuales, ratio=ratio_dti), ltv_val, ltv_max, deudas_mensuales, sueldo)
+
+    return _subir_hasta_cumplir((cuota + deudas_mensuales) / min(ratio_dti, DTI_FAIL), cumple)
+
+
+def interes_maximo_viable(capital, anos_plazo, cuota_max, ltv_val, ltv_max, deudas_mensuales, sueldo_neto,
+                          tipo_hipoteca, interes_fijo=None):
+    """
+    Tipo anual máximo con el que la operación sigue siendo viable (búsqueda acotada sobre la cuota, que crece con el tipo).
+    En Mixta es el tipo del tramo variable (Euríbor + diferencial); el tramo fijo debe ser viable por sí solo.
+    Devuelve None si ni con un tipo casi nulo es viable, o INTERES_MAX_BUSQUEDA si lo es con cualquier tipo razonable.
+    """
+    if capital <= 0 or ltv_val > ltv_max:
+        return None
+    cuota_fija = (cuota_prestamo(capital, interes_fijo, anos_plazo) or 0.0) if tipo_hipoteca == "Mixta" else 0.0
+
+    def cumple(interes):
+        cuota = max(cuota_fija, cuota_prestamo(capital, interes, anos_plazo) or 0.0)
+        return _cuota_viable(cuota, cuota_max, ltv_val, ltv_max, deudas_mensuales, sueldo_neto)
+
+    low, high = 1e-9, INTERES_MAX_BUSQUEDA
+    if not cumple(low):
+        return None
+    if cumple(high):
+        return high
+    for _ in range(40):
+        mid = (low + high) / 2
+        if cumple(mid):
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+def plazo_minimo_viable(capital, cuota_max, ltv_val, ltv_max, deudas_mensuales, sueldo_neto,
+                        tipo_hipoteca, interes_anual, interes_fijo=None, euribor=None, diferencial=None):
+    """Plazo mínimo (años enteros del selector) con el que la cuota resulta viable; None si ni con el máximo."""
+    if capital <= 0 or ltv_val > ltv_max:
+        return None
+    for anos in range(PLAZO_MIN_ANIOS, PLAZO_MAX_ANIOS + 1):
+        cuota, _ = cuota_segun_tipo(capital, tipo_hipoteca, interes_anual, anos,
+                                    interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial)
+        if _cuota_viable(cuota, cuota_max, ltv_val, ltv_max, deudas_mensuales, sueldo_neto):
+            return anos
+    return None
+
+
+def soluciones_viabilidad(precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+                          tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """
+    Valores umbral que hacen viable la operación cambiando una sola variable cada vez:
+    entrada mínima, sueldo mínimo, tipo de interés máximo y plazo mínimo (None si no existe).
+    """
+    tipos = dict(interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial)
+    r = evaluar_vivienda(precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti,
+                         financiar_comision, tipo_hipoteca, interes_anual, anos_plazo, **tipos)
+    capital, ltv_val, cuota_max = r["capital_final"], r["ltv"], r["cuota_max"]
+    entrada_ok = r["diferencia_entrada"] >= 0
+
+    interes_max = None
+    if entrada_ok:
+        interes_max = interes_maximo_viable(
+            capital, anos_plazo, cuota_max, ltv_val, ltv_max, deudas_mensuales, sueldo_neto,
+            tipo_hipoteca, interes_fijo=interes_fijo
+        )
+    return {
+        "entrada_min": entrada_minima_viable(precio, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti,
+                                             financiar_comision, tipo_hipoteca, interes_anual, anos_plazo, **tipos),
+        "sueldo_min": sueldo_minimo_viable(capital, r["cuota"], ltv_val, ltv_max, deudas_mensuales, ratio_dti) if entrada_ok else None,
+        "interes_max": interes_max,
+        "plazo_min": plazo_minimo_viable(capital, cuota_max, ltv_val, ltv_max, deudas_mensuales, sueldo_neto,
+                                         tipo_hipoteca, interes_anual, **tipos) if entrada_ok else None,
+    }
+
+
+# =========================
+# Resultado completo del modo 2
+# =========================
+SolucionesViabilidad = namedtuple("SolucionesViabilidad", ["entrada_min", "sueldo_min", "interes_max", "plazo_min"])
+
+# Tupla inmutable: la app la comparte entre secciones (y entre sesiones, vía la caché) sin riesgo de que
+# una sección la modifique. Los campos de evaluar_vivienda van primero y con el mismo nombre.
+ResultadoVivienda = namedtuple("ResultadoVivienda", [
+    "gastos_puros", "gastos_iniciales", "capital_final", "excedente", "diferencia_entrada", "ltv", "ltv_ok",
+    "cuota_max", "sin_hipoteca", "cuota", "tramo_peor", "dti", "viable",
+    "cuota_fijo",         # Mixta: cuota del tramo fijo sobre el plazo total (None en Fija/Variable)
+    "cuota_variable",     # Mixta: cuota del tramo variable sobre el capital y el plazo que quedan (None si no hay tramo)
+    "pagos_totales",      # capital + intereses pagados al banco durante todo el plazo
+    "intereses_totales",
+    "soluciones",         # SolucionesViabilidad (None si no hay hipoteca)
+])
+
+
+def resultado_vivienda(precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+                       tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None,
+                       anios_fijo=None):
+    """
+    Todo lo que muestra el modo 2 para una vivienda: evaluación, cuotas de cada tramo de la Mixta,
+    pagos totales y umbrales de viabilidad. Se calcula una vez por estado de entrada y todas las
+    secciones (indicadores, coste total, consejos, tablas y resumen) leen de aquí.
+    """
+    tipos = dict(interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial)
+    r = evaluar_vivienda(precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti,
+                         financiar_comision, tipo_hipoteca, interes_anual, anos_plazo, **tipos)
+    capital = r["capital_final"]
+
+    cuota_fijo = cuota_variable = None
+    if tipo_hipoteca == "Mixta" and not r["sin_hipoteca"]:
+        cuota_fijo, _, cuota_variable = tramos_mixta(capital, anos_plazo, interes_fijo, euribor + diferencial, anios_fijo)
+
+    pagos_totales = intereses_totales = 0.0
+    if not r["sin_hipoteca"] and r["cuota"] > 0 and capital > 0:
+        interes_variable = euribor + diferencial if tipo_hipoteca == "Mixta" else None
+        pagos_totales = pagos_totales_prestamo(capital, tipo_hipoteca, interes_anual, anos_plazo,
+                                               interes_fijo=interes_fijo, interes_variable=interes_variable,
+                                               anios_fijo=anios_fijo)
+        intereses_totales = max(0.0, pagos_totales - capital)
+
+    soluciones = None
+    if not r["sin_hipoteca"]:
+        soluciones = SolucionesViabilidad(**soluciones_viabilidad(
+            precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+            tipo_hipoteca, interes_anual, anos_plazo, **tipos
+        ))
+
+    return ResultadoVivienda(
+        **r, cuota_fijo=cuota_fijo, cuota_variable=cuota_variable, pagos_totales=pagos_totales,
+        intereses_totales=intereses_totales, soluciones=soluciones,
+    )
+
+
+# =========================
+# Precio máximo viable (modo 1)
+# =========================
+def buscar_precio_maximo(entrada_usuario, sueldo_neto, deudas_mensuales, cuota_max, params, ltv_max, financiar_comision,
+                          tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """Búsqueda binaria del precio máximo viable (entrada, LTV, DTI y cuota máxima)."""
+    low, high = 0.0, 2_000_000.0
+    precio_maximo = 0.0
+    for _ in range(50):
+        mid = (low + high) / 2
+
+        r_mid = calcular_capital_y_gastos(
+            mid, entrada_usuario, params,
+            ltv_max=ltv_max, financiar_comision=financiar_comision
+        )
+        capital_mid = r_mid["capital_final"]
+        ltv_ok = r_mid["ltv_ok"]
+        entrada_ok = entrada_usuario >= r_mid["gastos_puros"]
+
+        # Cuota según tipo de hipoteca (en Mixta, el peor tramo)
+        cuota_mid, _ = cuota_segun_tipo(
+            capital_mid, tipo_hipoteca, interes_anual, anos_plazo,
+            interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+        )
+        dti_mid = dti(cuota_mid, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
+
+        cuota_ok = cuota_mid <= cuota_max
+        dti_ok = dti_visible(dti_mid) <= DTI_FAIL
+
+        if entrada_ok and ltv_ok and dti_ok and cuota_ok:
+            precio_maximo = mid
+            low = mid
+        else:
+            high = mid
+    return precio_maximo
+
+
+# =========================
+# Escenarios de interés
+# =========================
+def escenarios_interes(capital, anos_plazo, tasas_pct, cuota_max, ltv_val, ltv_max, sueldo_neto, deudas_mensuales,
+                       tipo_hipoteca, interes_fijo=None, diferencial=None):
+    """
+    Cuota, DTI y viabilidad para cada tipo de interés simulado (en %).
+    En Mixta la tasa simulada es el Euríbor: se suma el diferencial y se valida el peor tramo.
+    """
+    filas = []
+    for interes_pct in tasas_pct:
+        interes = interes_pct / 100
+        interes_variable, tramo_peor = None, None
+        if tipo_hipoteca == "Mixta":
+            interes_variable = interes + diferencial
+            cuota_fijo = cuota_prestamo(capital, interes_fijo, anos_plazo) or 0.0
+            cuota_var = cuota_prestamo(capital, interes_variable, anos_plazo) or 0.0
+            cuota = max(cuota_fijo, cuota_var)
+            tramo_peor = "FIJO" if cuota_fijo >= cuota_var else "VARIABLE"
+        else:
+            cuota = cuota_prestamo(capital, interes, anos_plazo) or 0.0
+        dti_val = dti(cuota, deudas_mensuales, sueldo_neto) if sueldo_neto > 0 else 0.0
+        filas.append({
+            "interes": interes,
+            "interes_variable": interes_variable,
+            "cuota": cuota,
+            "dti": dti_val,
+            "tramo_peor": tramo_peor,
+            "viable": es_viable(cuota, cuota_max, ltv_val, ltv_max, dti_val),
+        })
+    return filas
+
+
+# =========================
+# Evolución anual del préstamo
+# =========================
+def evolucion_anual(capital_hipoteca, interes_anual, anos_plazo, cuota_mensual):
+    """Evolución anual del préstamo (Fija/Variable): una fila por año con capital pendiente e intereses."""
+    evolucion_data = []
+    capital_pendiente = capital_hipoteca
+    r = interes_anual / 12 if interes_anual else 0.0
+
+    intereses_acumulados = 0.0
+    capital_amortizado_acumulado = 0.0
+
+    for anio in range(1, anos_plazo + 1):
+        intereses_anio = 0.0
+        capital_anio = 0.0
+
+        for mes in range(12):
+            if capital_pendiente <= 0:
+                break
+            interes_mes = capital_pendiente * r
+            amortizacion_mes = cuota_mensual - interes_mes
+            intereses_anio += interes_mes
+            capital_anio += amortizacion_mes
+            capital_pendiente -= amortizacion_mes
+
+        intereses_acumulados += intereses_anio
+        capital_amortizado_acumulado += capital_anio
+
+        evolucion_data.append({
+            "Año": anio,
+            "Capital Pendiente": max(0, capital_pendiente),
+            "Intereses Acumulados": intereses_acumulados,
+            "Capital Amortizado": capital_amortizado_acumulado,
+            "Intereses Anuales": intereses_anio,
+            "Capital Anual": capital_anio
+        })
+
+        if capital_pendiente <= 0:
+            break
+
+    return evolucion_data
+
+
+# =========================
+# Hipoteca variable con revisiones periódicas
+# =========================
+PERIODICIDADES_REVISION = {"Anual": 12, "Semestral": 6}
+
+
+def tipo_revisado(euribor, diferencial, suelo=None, techo=None):
+    """Euríbor + diferencial acotado por el suelo y el techo del contrato (None = sin límite)."""
+    tipo = euribor + diferencial
+    if suelo is not None:
+        tipo = max(tipo, suelo)
+    if techo is not None:
+        tipo = min(tipo, techo)
+    return tipo
+
+
+def periodos_revision(anos_plazo, meses_revision=12, meses_fijo=0):
+    """(mes de inicio, duración) de cada periodo: el tramo fijo (si lo hay) y después uno por revisión."""
+    meses = int(anos_plazo * 12)
+    meses_fijo = min(max(int(meses_fijo or 0), 0), meses)
+    periodos = [(0, meses_fijo)] if meses_fijo else []
+    periodos += [(inicio, min(meses_revision, meses - inicio)) for inicio in range(meses_fijo, meses, meses_revision)]
+    return periodos
+
+
+def cuadro_revisiones_variable(capital, anos_plazo, diferencial, euribor_revisiones, meses_revision=12,
+                               suelo=None, techo=None, interes_fijo=None, meses_fijo=0):
+    """
+    Préstamo que revisa el tipo cada `meses_revision` meses: en cada revisión el tipo pasa a ser
+    euribor_revisiones[i] + diferencial (acotado por suelo/techo) y la cuota se recalcula sobre el
+    capital pendiente y los meses que quedan. Si hay menos Euríbor que revisiones se repite el último.
+    Mixta: los primeros `meses_fijo` meses van al interés fijo con la cuota calculada sobre el plazo total.
+    Una fila por periodo, recorriendo el cuadro mes a mes (referencia del motor vectorizado).
+    """
+    meses = int(anos_plazo * 12)
+    filas = []
+    capital_pendiente = capital
+    revision = 0
+    for inicio, duracion in periodos_revision(anos_plazo, meses_revision, meses_fijo):
+        if inicio < (meses_fijo or 0):
+            tipo = interes_fijo
+        else:
+            euribor = euribor_revisiones[min(revision, len(euribor_revisiones) - 1)]
+            tipo = tipo_revisado(euribor, diferencial, suelo, techo)
+            revision += 1
+        cuota = cuota_prestamo(capital_pendiente, tipo, (meses - inicio) / 12) or 0.0
+        capital_inicio, intereses = capital_pendiente, 0.0
+        for _ in range(duracion):
+            interes_mes = capital_pendiente * tipo / 12
+            intereses += interes_mes
+            capital_pendiente -= cuota - interes_mes
+        capital_pendiente = max(capital_pendiente, 0.0)
+        filas.append({
+            "Mes": inicio + 1,
+            "Tipo": tipo,
+            "Cuota": cuota,
+            "Capital Pendiente": capital_inicio,
+            "Intereses": intereses,
+        })
+    return filas
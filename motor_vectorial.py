@@ -0,0 +1,716 @@
+# ============================================================
+# 🚀 Motor vectorizado (NumPy)
+# ============================================================
+# Versiones rápidas de los cálculos de motor_hipotecario.py: trabajan sobre arrays
+# (muchos préstamos a la vez) o sustituyen bucles por fórmulas cerradas.
+# Las funciones escalares de motor_hipotecario.py son la referencia: herramientas/oraculo.py
+# compara ambas implementaciones y mide la ganancia antes de usar estas en la app.
+
+import numpy as np
+
+from motor_fiscal import ESTADOS, REGIONES, impuestos_compra, indices_fiscales, preparar_impuestos_totales
+from motor_hipotecario import DTI_FAIL, PLAZO_MAX_ANIOS, periodos_revision
+from tablas_amortizacion import TABLAS_AMORTIZACION
+
+BUSQUEDA_PRECIO_MIN = 0.0
+BUSQUEDA_PRECIO_MAX = 2_000_000.0
+BUSQUEDA_ITERACIONES = 50
+
+
+def _como_array(valor):
+    """Array float; None se convierte en NaN (parámetro no aplicable, p. ej. Euríbor en Fija)."""
+    if valor is None:
+        return np.array(np.nan)
+    return np.asarray(valor, dtype=float)
+
+
+def _redondear(valores, decimales):
+    """
+    Igual que round() de Python elemento a elemento. np.round escala por 10^d y puede resolver distinto
+    los valores casi empatados (…5 en el último decimal): solo esos se rehacen con round().
+    """
+    valores = np.asarray(valores, dtype=float)
+    resultado = np.array(np.round(valores, decimales))
+    escalado = valores * 10.0 ** decimales
+    dudosos = np.abs(escalado - np.floor(escalado) - 0.5) < 1e-6
+    if np.any(dudosos):
+        resultado[dudosos] = [round(float(v), decimales) for v in valores[dudosos]]
+    return resultado
+
+
+# =========================
+# Cálculos financieros
+# =========================
+def factor_cuota(interes_anual, anos):
+    """
+    Parte de la cuota francesa que no depende del capital: cuota = capital · factor
+    (o capital / n sin interés). Se calcula una vez y se reutiliza para cualquier capital.
+    """
+    r = _como_array(interes_anual) / 12.0
+    n = np.floor(_como_array(anos) * 12)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        factor = r / (1 - (1 + r) ** (-n))
+    return factor, np.abs(r) <= 1e-12, n
+
+
+def aplicar_factor_cuota(capital, factor_preparado):
+    """Cuota para un capital con un factor de factor_cuota (mismas operaciones que cuota_prestamo)."""
+    factor, sin_interes, n = factor_preparado
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cuota = np.where(sin_interes, capital / n, capital * factor)
+    return np.where((n > 0) & (capital > 0), cuota, 0.0)
+
+
+def cuota_prestamo_lote(capital, interes_anual, anos):
+    """Cuota francesa para arrays de capital/interés/plazo. Devuelve 0 donde la escalar devuelve None."""
+    return aplicar_factor_cuota(_como_array(capital), factor_cuota(interes_anual, anos))
+
+
+def cuota_maxima_lote(sueldo_neto_mensual, deudas_mensuales, ratio=0.35):
+    return np.maximum(0.0, _como_array(sueldo_neto_mensual) * _como_array(ratio) - _como_array(deudas_mensuales))
+
+
+def dti_lote(cuota_hipoteca, deudas_mensuales, sueldo_neto_mensual):
+    """DTI redondeado a 6 decimales; 0 donde no hay sueldo (igual que dti())."""
+    cuota = np.maximum(_como_array(cuota_hipoteca), 0.0)
+    deudas = np.maximum(_como_array(deudas_mensuales), 0.0)
+    sueldo = _como_array(sueldo_neto_mensual)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        val = _redondear((cuota + deudas) / sueldo, 6)
+    return np.where(sueldo > 0, val, 0.0)
+
+
+def dti_visible_lote(dti_val):
+    return (np.ceil(_como_array(dti_val) * 10000) / 100) / 100
+
+
+def es_viable_lote(cuota, cuota_max, ltv_val, ltv_max, dti_val):
+    return (
+        (_como_array(cuota) <= _como_array(cuota_max))
+        & (_como_array(ltv_val) <= _como_array(ltv_max))
+        & (dti_visible_lote(dti_val) <= DTI_FAIL)
+    )
+
+
+def preparar_cuota_segun_tipo(tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """Factores de cuota_segun_tipo que no dependen del capital (para reutilizarlos en una búsqueda)."""
+    tipo = np.asarray(tipo_hipoteca)
+    interes_anual = _como_array(interes_anual)
+    interes_fijo, euribor, diferencial = _como_array(interes_fijo), _como_array(euribor), _como_array(diferencial)
+
+    es_fija_variable = ((tipo == "Fija") | (tipo == "Variable")) & ~np.isnan(interes_anual)
+    es_mixta = (tipo == "Mixta") & ~np.isnan(interes_fijo) & ~np.isnan(euribor) & ~np.isnan(diferencial)
+    return {
+        "es_fija_variable": es_fija_variable,
+        "es_mixta": es_mixta,
+        "simple": factor_cuota(interes_anual, anos_plazo),
+        "fijo": factor_cuota(interes_fijo, anos_plazo),
+        "variable": factor_cuota(euribor + diferencial, anos_plazo),
+    }
+
+
+def aplicar_cuota_segun_tipo(capital, preparado):
+    """Devuelve (cuota, tramo_fijo) para un capital con los factores de preparar_cuota_segun_tipo."""
+    capital = _como_array(capital)
+    es_mixta = preparado["es_mixta"]
+    if not np.any(es_mixta):  # sin Mixtas no hace falta calcular los dos tramos
+        cuota = np.where(preparado["es_fija_variable"], aplicar_factor_cuota(capital, preparado["simple"]), 0.0)
+        return cuota, np.zeros(cuota.shape, dtype=bool)
+    cuota_simple = aplicar_factor_cuota(capital, preparado["simple"])
+    cuota_fijo = aplicar_factor_cuota(capital, preparado["fijo"])
+    cuota_mixta = np.maximum(cuota_fijo, aplicar_factor_cuota(capital, preparado["variable"]))
+    cuota = np.where(preparado["es_fija_variable"], cuota_simple, np.where(es_mixta, cuota_mixta, 0.0))
+    return cuota, es_mixta & (cuota_mixta == cuota_fijo)
+
+
+def cuota_segun_tipo_lote(capital, tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """
+    Equivalente vectorizado de cuota_segun_tipo: tipo_hipoteca puede ser un texto o un array de textos.
+    Devuelve (cuota, tramo_fijo) donde tramo_fijo indica que el peor tramo de la Mixta es el FIJO.
+    """
+    preparado = preparar_cuota_segun_tipo(
+        tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+    )
+    return aplicar_cuota_segun_tipo(capital, preparado)
+
+
+def _saldo_tras_meses(capital, r, cuota, meses):
+    """Saldo tras `meses` cuotas con la fórmula cerrada S_k = C·(1+r)^k − cuota·((1+r)^k − 1)/r."""
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        crecimiento = (1 + r) ** meses
+        saldo = capital * crecimiento - cuota * (crecimiento - 1) / r
+    return np.where(np.abs(r) <= 1e-12, capital - cuota * meses, saldo)
+
+
+def pagos_totales_lote(capital, tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, interes_variable=None,
+                       anios_fijo=None):
+    """Versión vectorizada de pagos_totales_prestamo: el saldo al final del tramo fijo sale de la fórmula cerrada."""
+    capital, anos = _como_array(capital), _como_array(anos_plazo)
+    tipo = np.asarray(tipo_hipoteca)
+    interes_anual = _como_array(interes_anual)
+    interes_fijo, interes_variable = _como_array(interes_fijo), _como_array(interes_variable)
+
+    con_prestamo = (capital > 0) & (anos > 0)
+    es_fija_variable = ((tipo == "Fija") | (tipo == "Variable")) & ~np.isnan(interes_anual)
+    es_mixta = (tipo == "Mixta") & ~np.isnan(interes_fijo) & ~np.isnan(interes_variable)
+
+    pagos = np.where(es_fija_variable, cuota_prestamo_lote(capital, interes_anual, anos) * anos * 12, 0.0)
+    if np.any(es_mixta & con_prestamo):  # el tramo variable solo se calcula si hay alguna Mixta
+        anios_fijo = np.minimum(np.maximum(np.floor(np.nan_to_num(_como_array(anios_fijo))), 0), anos)
+        cuota_fijo = cuota_prestamo_lote(capital, interes_fijo, anos)
+        pendiente = _saldo_tras_meses(capital, interes_fijo / 12, cuota_fijo, anios_fijo * 12)
+        plazo_var = anos - anios_fijo
+        cuota_var = cuota_prestamo_lote(np.maximum(pendiente, 0.0), interes_variable, plazo_var)
+        pagos = np.where(es_mixta, cuota_fijo * anios_fijo * 12 + cuota_var * plazo_var * 12, pagos)
+    return np.where(con_prestamo, pagos, 0.0)
+
+
+def calcular_capital_y_gastos_lote(precio, entrada, params, ltv_max=0.80, financiar_comision=False):
+    """
+    Versión vectorizada de calcular_capital_y_gastos. Los valores de `params` pueden ser escalares o arrays;
+    las operaciones siguen el mismo orden que la escalar para obtener los mismos redondeos.
+    """
+    precio, entrada = _como_array(precio), _como_array(entrada)
+    fiscal = params.get("fiscal")
+    if callable(fiscal):
+        impuestos = fiscal(precio)  # función ya preparada con preparar_impuestos_totales
+    elif fiscal is not None:
+        impuestos = impuestos_compra(precio, *fiscal)["total"]
+    else:
+        impuestos = precio * _como_array(params["tipo_impuesto"])
+    gastos_puros = (
+        impuestos + _como_array(params["notario"]) + _como_array(params["gestoria"])
+        + _como_array(params["registro"]) + _como_array(params["tasacion"]) + _como_array(params["seguro_inicial"])
+    )
+
+    diferencia_entrada = entrada - gastos_puros
+    excedente = np.maximum(0.0, diferencia_entrada)
+    capital_preliminar = np.maximum(0.0, precio - excedente)
+
+    com_pct = _como_array(params["com_apertura_pct"])
+    com_apertura = np.where(com_pct > 0, capital_preliminar * com_pct, 0.0)
+    financiar = np.asarray(financiar_comision, dtype=bool)
+    capital_final = np.where(financiar, capital_preliminar + com_apertura, capital_preliminar)
+    gastos_iniciales = np.where(financiar, gastos_puros, gastos_puros + com_apertura)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ltv_real = np.where(precio > 0, capital_final / precio, 0.0)
+
+    return {
+        "gastos_puros": gastos_puros,
+        "gastos_iniciales": gastos_iniciales,
+        "capital_final": capital_final,
+        "excedente": excedente,
+        "diferencia_entrada": diferencia_entrada,
+        "ltv": ltv_real,
+        "ltv_ok": ltv_real <= _como_array(ltv_max),
+    }
+
+
+def evaluar_vivienda_lote(precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+                          tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """
+    Versión vectorizada de evaluar_vivienda: cada entrada puede ser un escalar o un array.
+    En lugar del texto tramo_peor devuelve el booleano tramo_fijo (peor tramo de la Mixta = FIJO).
+    """
+    r = calcular_capital_y_gastos_lote(precio, entrada, params, ltv_max=ltv_max, financiar_comision=financiar_comision)
+    cuota_max = cuota_maxima_lote(sueldo_neto, deudas_mensuales, ratio=ratio_dti)
+
+    # Compra al contado si la entrada cubre el precio completo
+    sin_hipoteca = (r["capital_final"] <= 0) & (r["diferencia_entrada"] >= _como_array(precio))
+
+    cuota, tramo_fijo = cuota_segun_tipo_lote(
+        r["capital_final"], tipo_hipoteca, interes_anual, anos_plazo,
+        interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+    )
+    cuota = np.where(sin_hipoteca, 0.0, cuota)
+    con_dti = (_como_array(sueldo_neto) > 0) & ~sin_hipoteca
+    dti_val = np.where(con_dti, _redondear(dti_lote(cuota, deudas_mensuales, sueldo_neto), 4), 0.0)
+
+    return {
+        **r,
+        "cuota_max": cuota_max,
+        "sin_hipoteca": sin_hipoteca,
+        "cuota": cuota,
+        "tramo_fijo": tramo_fijo & ~sin_hipoteca,
+        "dti": dti_val,
+        "viable": (cuota > 0) & es_viable_lote(cuota, cuota_max, r["ltv"], ltv_max, dti_val),
+    }
+
+
+# =========================
+# Precio máximo viable (modo 1) para muchos perfiles a la vez
+# =========================
+def buscar_precio_maximo_lote(entrada_usuario, sueldo_neto, deudas_mensuales, cuota_max, params, ltv_max, financiar_comision,
+                              tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None):
+    """
+    Búsqueda binaria de buscar_precio_maximo ejecutada a la vez para todos los perfiles:
+    mismos 50 pasos y mismos puntos medios, pero cada paso es una operación sobre arrays.
+    """
+    forma = np.broadcast(
+        _como_array(entrada_usuario), _como_array(sueldo_neto), _como_array(deudas_mensuales), _como_array(cuota_max),
+        _como_array(ltv_max), _como_array(interes_anual), _como_array(anos_plazo), np.asarray(tipo_hipoteca),
+        *(np.asarray(indice) for indice in (params.get("fiscal") or ())),
+    ).shape
+    # Todo lo que no depende del precio se prepara una sola vez fuera de los 50 pasos
+    entrada_usuario, sueldo_neto, deudas_mensuales = _como_array(entrada_usuario), _como_array(sueldo_neto), _como_array(deudas_mensuales)
+    cuota_max, ltv_max = _como_array(cuota_max), _como_array(ltv_max)
+    financiar_comision = np.asarray(financiar_comision, dtype=bool)
+    params = {clave: (valor if clave == "fiscal" else _como_array(valor)) for clave, valor in params.items()}
+    if params.get("fiscal") is not None:
+        params["fiscal"] = preparar_impuestos_totales(*params["fiscal"])
+    cuota_preparada = preparar_cuota_segun_tipo(
+        tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+    )
+
+    low = np.full(forma, BUSQUEDA_PRECIO_MIN)
+    high = np.full(forma, BUSQUEDA_PRECIO_MAX)
+    precio_maximo = np.zeros(forma)
+
+    for _ in range(BUSQUEDA_ITERACIONES):
+        mid = (low + high) / 2
+
+        r_mid = calcular_capital_y_gastos_lote(mid, entrada_usuario, params, ltv_max=ltv_max, financiar_comision=financiar_comision)
+        entrada_ok = entrada_usuario >= r_mid["gastos_puros"]
+
+        cuota_mid, _ = aplicar_cuota_segun_tipo(r_mid["capital_final"], cuota_preparada)
+        dti_mid = dti_lote(cuota_mid, deudas_mensuales, sueldo_neto)
+
+        ok = entrada_ok & r_mid["ltv_ok"] & (dti_visible_lote(dti_mid) <= DTI_FAIL) & (cuota_mid <= cuota_max)
+        precio_maximo = np.where(ok, mid, precio_maximo)
+        low = np.where(ok, mid, low)
+        high = np.where(ok, high, mid)
+
+    return precio_maximo
+
+
+def precio_maximo_por_region(entrada_usuario, sueldo_neto, deudas_mensuales, cuota_max, params, ltv_max, financiar_comision,
+                             tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None,
+                             perfil="general"):
+    """
+    Precio máximo en todas las comunidades y estados (Nuevo / Segunda mano) con una sola búsqueda vectorizada:
+    la tabla fiscal se indexa con una rejilla (región × estado) y el resto de entradas son las del cliente.
+    """
+    indice_region = np.arange(len(REGIONES))[:, None]
+    indice_estado = np.arange(len(ESTADOS))[None, :]
+    _, _, indice_perfil = indices_fiscales(REGIONES[0], ESTADOS[0], perfil)
+    params_rejilla = {**params, "fiscal": (indice_region, indice_estado, indice_perfil)}
+
+    precios = buscar_precio_maximo_lote(
+        entrada_usuario, sueldo_neto, deudas_mensuales, cuota_max, params_rejilla, ltv_max, financiar_comision,
+        tipo_hipoteca, interes_anual, anos_plazo,
+        interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+    )
+    return {"Comunidad": list(REGIONES), **{estado: precios[:, j] for j, estado in enumerate(ESTADOS)}}
+
+
+FRONTERA_PUNTOS = 200
+FRONTERA_SUELDO = (0.5, 2.0)                  # rango de sueldos: fracción del sueldo actual
+FRONTERA_ENTRADAS = (0.5, 1.0, 1.5, 2.0)      # curvas por entrada: múltiplos de la entrada actual
+FRONTERA_PLAZOS = (20, 25, 30, 35, 40)        # curvas por plazo (además del plazo actual)
+
+
+def rejilla_frontera(sueldo_neto, entrada_usuario, anos_plazo):
+    """(sueldos, entradas, plazos) alrededor de la situación actual, que siempre forma parte de la rejilla."""
+    sueldos = np.linspace(sueldo_neto * FRONTERA_SUELDO[0], sueldo_neto * FRONTERA_SUELDO[1], FRONTERA_PUNTOS)
+    sueldos = np.unique(np.append(sueldos, sueldo_neto))
+    entradas = np.array([entrada_usuario * factor for factor in FRONTERA_ENTRADAS])
+    plazos = np.unique(np.append(FRONTERA_PLAZOS, int(anos_plazo)))
+    return sueldos, entradas, plazos
+
+
+def frontera_precio_maximo(sueldos, entradas, plazos, deudas_mensuales, ratio_dti, params, ltv_max, financiar_comision,
+                           tipo_hipoteca, interes_anual, interes_fijo=None, euribor=None, diferencial=None):
+    """
+    Frontera de asequibilidad: precio máximo en la rejilla entradas × plazos × sueldos (forma (E, P, S)) con
+    una sola búsqueda vectorizada. La cuota máxima de cada sueldo sale del mismo ratio de DTI que en el modo 1.
+    """
+    sueldos = _como_array(sueldos)[None, None, :]
+    entradas = _como_array(entradas)[:, None, None]
+    plazos = _como_array(plazos)[None, :, None]
+    return buscar_precio_maximo_lote(
+        entradas, sueldos, deudas_mensuales, cuota_maxima_lote(sueldos, deudas_mensuales, ratio=ratio_dti),
+        params, ltv_max, financiar_comision, tipo_hipoteca, interes_anual, plazos,
+        interes_fijo=interes_fijo, euribor=euribor, diferencial=diferencial
+    )
+
+
+def sueldo_minimo_por_precio(sueldos, precios, umbrales):
+    """
+    Sueldo más bajo de la curva (sueldos crecientes, precios no decrecientes) con el que se alcanza cada
+    precio de `umbrales`; NaN si ni el sueldo más alto de la rejilla llega.
+    """
+    sueldos, precios = _como_array(sueldos), np.maximum.accumulate(_como_array(precios))
+    posiciones = np.searchsorted(precios, _como_array(umbrales), side="left")
+    return np.where(posiciones < len(sueldos), sueldos[np.minimum(posiciones, len(sueldos) - 1)], np.nan)
+
+
+# =========================
+# Escenarios de interés
+# =========================
+def escenarios_interes_lote(capital, anos_plazo, tasas_pct, cuota_max, ltv_val, ltv_max, sueldo_neto, deudas_mensuales,
+                            tipo_hipoteca, interes_fijo=None, diferencial=None):
+    """
+    Escenarios de interés para muchos préstamos a la vez: las entradas con forma (m, 1) y
+    `tasas_pct` con forma (k,) producen resultados (m, k). Misma semántica que escenarios_interes.
+    """
+    tasas = _como_array(tasas_pct) / 100
+    tipo = np.asarray(tipo_hipoteca)
+    es_mixta = tipo == "Mixta"
+
+    interes_variable = np.where(es_mixta, tasas + _como_array(diferencial), np.nan)
+    cuota_simple = cuota_prestamo_lote(capital, tasas, anos_plazo)
+    cuota_fijo = cuota_prestamo_lote(capital, interes_fijo, anos_plazo)
+    cuota_var = cuota_prestamo_lote(capital, interes_variable, anos_plazo)
+
+    cuota = np.where(es_mixta, np.maximum(cuota_fijo, cuota_var), cuota_simple)
+    dti_val = dti_lote(cuota, deudas_mensuales, sueldo_neto)
+    return {
+        "interes": np.broadcast_to(tasas, cuota.shape),
+        "interes_variable": np.broadcast_to(interes_variable, cuota.shape),
+        "cuota": cuota,
+        "dti": dti_val,
+        "tramo_fijo": es_mixta & (cuota_fijo >= cuota_var),
+        "viable": es_viable_lote(cuota, cuota_max, ltv_val, ltv_max, dti_val),
+    }
+
+
+# =========================
+# Evolución anual del préstamo (fórmula cerrada)
+# =========================
+def evolucion_anual_rapida(capital_hipoteca, interes_anual, anos_plazo, cuota_mensual):
+    """
+    Misma tabla que evolucion_anual, sin bucles: el saldo tras k meses sale de la fórmula cerrada
+    S_k = C·(1+r)^k − cuota·((1+r)^k − 1)/r y los totales anuales se obtienen agrupando de 12 en 12.
+    Devuelve un dict de columnas (listo para pd.DataFrame). Si el tipo y el plazo caen en la rejilla
+    precalculada y la cuota es la estándar del préstamo, la tabla sale directamente de tablas_amortizacion.
+    """
+    cuota_tabla = TABLAS_AMORTIZACION.cuota(capital_hipoteca, interes_anual, anos_plazo)
+    if cuota_tabla and abs(cuota_tabla - cuota_mensual) <= 1e-9 * max(cuota_mensual, 1.0):
+        return TABLAS_AMORTIZACION.evolucion_anual(capital_hipoteca, interes_anual, anos_plazo)
+
+    columnas = ["Año", "Capital Pendiente", "Intereses Acumulados", "Capital Amortizado", "Intereses Anuales", "Capital Anual"]
+    anos_plazo = int(anos_plazo)
+    if anos_plazo <= 0:
+        return {c: np.array([]) for c in columnas}
+
+    r = interes_anual / 12 if interes_anual else 0.0
+    meses = np.arange(anos_plazo * 12 + 1)
+    if r:
+        factor = (1 + r) ** meses
+        saldo = capital_hipoteca * factor - cuota_mensual * (factor - 1) / r
+    else:
+        saldo = capital_hipoteca - cuota_mensual * meses
+
+    # Como en el bucle: se deja de pagar en cuanto el saldo llega a 0 (incluido ese último mes)
+    meses_pagados = int(np.logical_and.accumulate(saldo[:-1] > 0).sum())
+    filas = anos_plazo if meses_pagados == anos_plazo * 12 else max(1, -(-meses_pagados // 12))
+
+    interes_mes = np.zeros(filas * 12)
+    interes_mes[:meses_pagados] = saldo[:meses_pagados] * r
+    capital_mes = np.zeros(filas * 12)
+    capital_mes[:meses_pagados] = cuota_mensual - interes_mes[:meses_pagados]
+
+    intereses_anio = interes_mes.reshape(filas, 12).sum(axis=1)
+    capital_anio = capital_mes.reshape(filas, 12).sum(axis=1)
+    fin_de_anio = np.minimum(np.arange(1, filas + 1) * 12, meses_pagados)
+
+    return {
+        "Año": np.arange(1, filas + 1),
+        "Capital Pendiente": np.maximum(0, saldo[fin_de_anio]),
+        "Intereses Acumulados": np.cumsum(intereses_anio),
+        "Capital Amortizado": np.cumsum(capital_anio),
+        "Intereses Anuales": intereses_anio,
+        "Capital Anual": capital_anio,
+    }
+
+
+# =========================
+# Estrés de tipos sobre una cartera de préstamos vivos
+# =========================
+MESES_REVISION = 12
+
+
+def cuota_meses_lote(capital, interes_anual, meses):
+    """Cuota francesa con el plazo en meses (un préstamo vivo rara vez tiene años enteros por delante)."""
+    capital, meses = _como_array(capital), _como_array(meses)
+    r = _como_array(interes_anual) / 12.0
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        cuota = np.where(np.abs(r) <= 1e-12, capital / meses, capital * r / (1 - (1 + r) ** (-meses)))
+    return np.where((meses > 0) & (capital > 0), cuota, 0.0)
+
+
+def estres_cartera_lote(capital_pendiente, meses_restantes, tipo_hipoteca, diferencial, interes_fijo, primera_revision,
+                        sueldo_neto, deudas_mensuales, euribor_base, variaciones):
+    """
+    Cuota y DTI de cada préstamo vivo (arrays de m préstamos) bajo k trayectorias del Euríbor.
+
+    `variaciones` tiene forma (k, H): variación sobre `euribor_base` en cada mes del horizonte. Un choque
+    paralelo es una fila constante; un episodio histórico, su recorrido mes a mes. Las Variable revisan
+    la cuota cada 12 meses a partir de `primera_revision` y las Mixta a partir del fin del tramo fijo
+    (`primera_revision` = meses de tramo fijo que quedan), con el saldo y el plazo que quedan en ese
+    momento; las Fija no cambian. El horizonte se recorre mes a mes sobre arrays (m, k) y en cada mes
+    solo se recalcula la cuota de los préstamos que revisan.
+    """
+    capital = np.atleast_1d(_como_array(capital_pendiente))
+    meses, diferencial, interes_fijo, primera_revision, sueldo_neto, deudas_mensuales = (
+        np.broadcast_to(_como_array(valor), capital.shape)
+        for valor in (meses_restantes, diferencial, interes_fijo, primera_revision, sueldo_neto, deudas_mensuales)
+    )
+    tipo = np.broadcast_to(np.asarray(tipo_hipoteca), capital.shape)
+    variaciones = np.atleast_2d(_como_array(variaciones))
+    forma = (len(capital), variaciones.shape[0])
+
+    revisable = (tipo == "Variable") | (tipo == "Mixta")
+    en_tramo_fijo = (tipo == "Fija") | ((tipo == "Mixta") & (primera_revision > 0))
+    tasa_base = np.where(en_tramo_fijo, interes_fijo, euribor_base + diferencial)
+    cuota_base = cuota_meses_lote(capital, tasa_base, meses)
+
+    tasa = np.repeat(tasa_base[:, None], forma[1], axis=1)
+    cuota = np.repeat(cuota_base[:, None], forma[1], axis=1)
+    saldo = np.repeat(capital[:, None], forma[1], axis=1)
+    cuota_pico = cuota.copy()
+    for mes in range(variaciones.shape[1]):
+        restantes = meses - mes
+        revisa = revisable & (mes >= primera_revision) & ((mes - primera_revision) % MESES_REVISION == 0) & (restantes > 0)
+        filas = np.flatnonzero(revisa)
+        if filas.size:
+            tasa[filas] = euribor_base + variaciones[:, mes] + diferencial[filas, None]
+            cuota[filas] = cuota_meses_lote(saldo[filas], tasa[filas], restantes[filas, None])
+            cuota_pico[filas] = np.maximum(cuota_pico[filas], cuota[filas])
+        saldo *= 1 + tasa / 12
+        saldo -= cuota
+        np.maximum(saldo, 0.0, out=saldo)
+
+    return {
+        "cuota_base": cuota_base,
+        "dti_base": dti_lote(cuota_base, deudas_mensuales, sueldo_neto),
+        "cuota_pico": cuota_pico,
+        "dti_pico": dti_lote(cuota_pico, deudas_mensuales[:, None], sueldo_neto[:, None]),
+    }
+
+
+# =========================
+# Hipoteca variable con revisiones (fórmula cerrada por periodo)
+# =========================
+def _por_fila(valor):
+    """Escalar tal cual; un array de S préstamos como columna (S, 1) para combinarlo con (S, revisiones)."""
+    valor = _como_array(valor)
+    return valor[:, None] if valor.ndim else valor
+
+
+def tipo_revisado_lote(euribor, diferencial, suelo=None, techo=None):
+    """Versión vectorizada de tipo_revisado (None = sin suelo o sin techo)."""
+    tipo = _como_array(euribor) + _como_array(diferencial)
+    if suelo is not None:
+        tipo = np.maximum(tipo, suelo)
+    if techo is not None:
+        tipo = np.minimum(tipo, techo)
+    return tipo
+
+
+def revisiones_variable_lote(capital, anos_plazo, diferencial, euribor_revisiones, meses_revision=MESES_REVISION,
+                             suelo=None, techo=None, interes_fijo=None, meses_fijo=0):
+    """
+    Versión vectorizada de cuadro_revisiones_variable para S préstamos: `euribor_revisiones` tiene forma (S, R)
+    (o (R,) para uno solo) y el resto de parámetros son escalares o arrays de S, así que cada préstamo puede tener
+    su plazo, su periodicidad y su tramo fijo. Cada periodo se resuelve con la fórmula cerrada del saldo: el coste
+    es O(revisiones) y no O(meses) (40 años con revisión semestral son 80 pasos sobre arrays de S).
+    Devuelve arrays (S, periodos) con el mes de inicio, la duración, el tipo, la cuota, el capital pendiente al
+    inicio y los intereses de cada periodo; los préstamos con menos periodos quedan rellenos con duración 0.
+    """
+    euribor = np.atleast_2d(_como_array(euribor_revisiones))
+    if euribor.shape[1] == 0:  # Mixta cuyo tramo fijo cubre todo el plazo: no hay revisiones
+        euribor = np.full((euribor.shape[0], 1), np.nan)
+    forma_filas = euribor.shape[:1]
+    meses = np.broadcast_to(np.asarray(anos_plazo) * 12, forma_filas).astype(int)
+    meses_revision = np.broadcast_to(np.asarray(meses_revision), forma_filas).astype(int)
+    meses_fijo = np.clip(np.broadcast_to(np.nan_to_num(np.asarray(meses_fijo, dtype=float)), forma_filas), 0, meses).astype(int)
+    tipos_revision = tipo_revisado_lote(euribor, _por_fila(diferencial),
+                                        None if suelo is None else _por_fila(suelo),
+                                        None if techo is None else _por_fila(techo))
+    tipo_fijo = np.broadcast_to(_como_array(interes_fijo), forma_filas)
+
+    con_tramo_fijo = meses_fijo > 0
+    n_periodos = int((con_tramo_fijo + -(-(meses - meses_fijo) // meses_revision)).max())
+    forma = (forma_filas[0], n_periodos)
+    inicios, duraciones = np.zeros(forma, dtype=int), np.zeros(forma, dtype=int)
+    tipos, cuotas, saldos, intereses = np.zeros(forma), np.zeros(forma), np.zeros(forma), np.zeros(forma)
+    saldo = np.broadcast_to(_como_array(capital), forma_filas).astype(float)
+    filas = np.arange(forma_filas[0])
+    for j in range(n_periodos):
+        # Periodo j: el tramo fijo (j = 0 en las Mixta) o la revisión número j (j − 1 con tramo fijo)
+        revision = j - con_tramo_fijo
+        en_tramo_fijo = revision < 0
+        inicio = np.where(en_tramo_fijo, 0, meses_fijo + revision * meses_revision)
+        duracion = np.clip(np.where(en_tramo_fijo, meses_fijo, np.minimum(meses_revision, meses - inicio)), 0, None)
+        tipo = np.where(en_tramo_fijo, tipo_fijo,
+                        tipos_revision[filas, np.clip(revision, 0, euribor.shape[1] - 1)])
+        tipo = np.where(duracion > 0, tipo, 0.0)
+        cuota = cuota_meses_lote(saldo, tipo, np.where(duracion > 0, meses - inicio, 0))
+        siguiente = np.maximum(_saldo_tras_meses(saldo, tipo / 12, cuota, duracion), 0.0)
+        inicios[:, j], duraciones[:, j] = inicio, duracion
+        tipos[:, j], cuotas[:, j], saldos[:, j] = tipo, cuota, saldo
+        intereses[:, j] = duracion * cuota - (saldo - siguiente)
+        saldo = siguiente
+
+    return {
+        "mes_inicio": inicios,
+        "meses_periodo": duraciones,
+        "tipos": tipos,
+        "cuotas": cuotas,
+        "capital_pendiente": saldos,
+        "intereses": intereses,
+        "intereses_totales": intereses.sum(axis=1),
+        "cuota_pico": cuotas.max(axis=1),
+    }
+
+
+# =========================
+# Backtest con el Euríbor histórico
+# =========================
+def backtest_euribor_lote(capital, anos_plazo, diferencial, serie_euribor, sueldo_neto=0.0, deudas_mensuales=0.0,
+                          tipo_hipoteca="Variable", interes_fijo=None, anios_fijo=0, meses_revision=MESES_REVISION,
+                          suelo=None, techo=None):
+    """
+    El mismo préstamo iniciado en cada mes de `serie_euribor` (tanto por uno, mensual). La cuota se revisa
+    cada `meses_revision` meses con el Euríbor de ese mes + diferencial (acotado por suelo/techo); en Mixta,
+    los primeros `anios_fijo` años van al interés fijo. Los meses posteriores al final de la serie toman su
+    último valor.
+
+    Una ventana móvil sobre la serie da el Euríbor de cada revisión para todos los inicios a la vez (S × R,
+    sin recorrer la serie en Python) y revisiones_variable_lote resuelve los S préstamos por periodos.
+    `cuotas` es la cuota media de cada año del préstamo (S × años).
+    """
+    serie = _como_array(serie_euribor)
+    anos_plazo = int(anos_plazo)
+    meses = anos_plazo * 12
+    inicios = len(serie)
+    meses_fijo = int(anios_fijo or 0) * 12 if tipo_hipoteca == "Mixta" else 0
+
+    extendida = np.concatenate([serie, np.full(meses, serie[-1])])
+    ventanas = np.lib.stride_tricks.sliding_window_view(extendida, meses)[:inicios]
+    meses_revision_variable = [inicio for inicio, _ in periodos_revision(anos_plazo, meses_revision, meses_fijo)
+                               if inicio >= meses_fijo]
+    r = revisiones_variable_lote(capital, anos_plazo, diferencial, ventanas[:, meses_revision_variable],
+                                 meses_revision, suelo, techo, interes_fijo, meses_fijo)
+
+    # Las revisiones semestrales y el tramo fijo no siempre coinciden con los años: media de las 12 cuotas
+    cuotas = np.repeat(r["cuotas"], r["meses_periodo"][0], axis=1).reshape(inicios, anos_plazo, 12).mean(axis=2)
+    return {
+        "cuotas": cuotas,
+        "cuota_inicial": r["cuotas"][:, 0],
+        "cuota_pico": r["cuota_pico"],
+        "dti_pico": dti_lote(r["cuota_pico"], deudas_mensuales, sueldo_neto),
+        "intereses_totales": r["intereses_totales"],
+        "meses_observados": np.minimum(meses, inicios - np.arange(inicios)),
+    }
+
+
+# =========================
+# Análisis de sensibilidad (tornado)
+# =========================
+# (clave, etiqueta, paso, unidad, tipos de hipoteca a los que aplica; None = todos)
+# Unidad "%": variación relativa (± paso · valor); "pp", "€" y "años": variación absoluta en unidades del motor
+PERTURBACIONES_SENSIBILIDAD = [
+    ("precio", "Precio de la vivienda", 0.05, "%", None),
+    ("entrada", "Entrada aportada", 0.10, "%", None),
+    ("sueldo_neto", "Sueldo neto", 0.10, "%", None),
+    ("deudas_mensuales", "Otras deudas", 100.0, "€", None),
+    ("interes", "Tipo de interés", 0.005, "pp", None),
+    ("diferencial", "Diferencial", 0.0025, "pp", ("Variable", "Mixta")),
+    ("euribor", "Euríbor (tramo variable)", 0.005, "pp", ("Mixta",)),
+    ("anos_plazo", "Plazo", 5, "años", None),
+    ("anios_fijo", "Años tramo fijo", 2, "años", ("Mixta",)),
+    ("impuestos", "Impuestos de compra", 0.01, "pp", None),
+    ("notario", "Notaría", 0.20, "%", None),
+    ("registro", "Registro", 0.20, "%", None),
+    ("gestoria", "Gestoría", 0.20, "%", None),
+    ("tasacion", "Tasación", 0.20, "%", None),
+    ("seguro_inicial", "Seguro inicial", 0.20, "%", None),
+    ("com_apertura_pct", "Comisión de apertura", 0.005, "pp", None),
+]
+
+_GASTOS_TRAMITES = ["notario", "registro", "gestoria", "tasacion", "seguro_inicial"]
+
+
+def sensibilidad_vivienda(precio, entrada, sueldo_neto, deudas_mensuales, params, ltv_max, ratio_dti, financiar_comision,
+                          tipo_hipoteca, interes_anual, anos_plazo, interes_fijo=None, euribor=None, diferencial=None,
+                          anios_fijo=None, suelo=None, techo=None):
+    """
+    Mueve cada entrada un paso hacia abajo y otro hacia arriba (con el resto fijo) y evalúa la vivienda base
+    y todas las variantes en una única llamada vectorizada. Devuelve DTI, coste total y viabilidad de la base
+    y, para cada entrada, la pareja de valores (−paso, +paso).
+    En Variable se mueve Euríbor + diferencial sin acotar y el tipo aplicado pasa por el suelo y el techo del
+    contrato (como en tipo_revisado): con un límite activo, las variantes que no lo cruzan no cambian nada.
+    """
+    perturbaciones = [p for p in PERTURBACIONES_SENSIBILIDAD if p[4] is None or tipo_hipoteca in p[4]]
+    filas = 1 + 2 * len(perturbaciones)
+
+    base = {
+        "precio": precio, "entrada": entrada, "sueldo_neto": sueldo_neto, "deudas_mensuales": deudas_mensuales,
+        "interes": (
+            interes_fijo if tipo_hipoteca == "Mixta"
+            else euribor + diferencial if tipo_hipoteca == "Variable" and euribor is not None and diferencial is not None
+            else interes_anual
+        ),
+        "diferencial": diferencial or 0.0, "euribor": euribor or 0.0,
+        "anos_plazo": anos_plazo, "anios_fijo": anios_fijo or 0, "impuestos": 0.0,
+        "com_apertura_pct": params["com_apertura_pct"], **{k: params[k] for k in _GASTOS_TRAMITES},
+    }
+    # Fila 0 = base; filas 2i+1 y 2i+2 = entrada i con −paso y +paso
+    col = {clave: np.full(filas, float(valor)) for clave, valor in base.items()}
+    for i, (clave, _, paso, unidad, _) in enumerate(perturbaciones):
+        delta = paso * base[clave] if unidad == "%" else paso
+        col[clave][2 * i + 1:2 * i + 3] = base[clave] + np.array([-delta, delta])
+
+    # Límites de cada entrada (el Euríbor y el ajuste de impuestos pueden ser negativos)
+    admite_negativos = {"euribor", "impuestos"} | ({"interes"} if tipo_hipoteca == "Variable" else set())
+    for clave in col.keys() - admite_negativos:
+        col[clave] = np.maximum(col[clave], 0.0)
+    col["anos_plazo"] = np.clip(col["anos_plazo"], 1, PLAZO_MAX_ANIOS)
+    col["anios_fijo"] = np.clip(col["anios_fijo"], 1, col["anos_plazo"])
+
+    params_lote = {**params, "com_apertura_pct": col["com_apertura_pct"], **{k: col[k] for k in _GASTOS_TRAMITES}}
+    fiscal = params.get("fiscal")
+    if fiscal is not None:
+        impuestos_base = fiscal if callable(fiscal) else preparar_impuestos_totales(*fiscal)
+        params_lote["fiscal"] = lambda p: np.maximum(impuestos_base(p) + p * col["impuestos"], 0.0)
+    else:
+        params_lote["tipo_impuesto"] = np.maximum(params["tipo_impuesto"] + col["impuestos"], 0.0)
+
+    interes_fijo_col = euribor_col = diferencial_col = interes_variable_col = None
+    if tipo_hipoteca == "Mixta":
+        interes_fijo_col, euribor_col, diferencial_col = col["interes"], col["euribor"], col["diferencial"]
+        interes_anual_col = interes_fijo_col
+        interes_variable_col = euribor_col + diferencial_col
+    elif tipo_hipoteca == "Variable":
+        interes_anual_col = tipo_revisado_lote(col["interes"], col["diferencial"] - base["diferencial"], suelo, techo)
+    else:
+        interes_anual_col = col["interes"]
+
+    r = evaluar_vivienda_lote(
+        col["precio"], col["entrada"], col["sueldo_neto"], col["deudas_mensuales"], params_lote, ltv_max, ratio_dti,
+        financiar_comision, tipo_hipoteca, interes_anual_col, col["anos_plazo"],
+        interes_fijo=interes_fijo_col, euribor=euribor_col, diferencial=diferencial_col
+    )
+    pagos = pagos_totales_lote(
+        r["capital_final"], tipo_hipoteca, interes_anual_col, col["anos_plazo"],
+        interes_fijo=interes_fijo_col, interes_variable=interes_variable_col, anios_fijo=col["anios_fijo"]
+    )
+    intereses = np.where(r["cuota"] > 0, np.maximum(0.0, pagos - r["capital_final"]), 0.0)
+    coste_total = col["precio"] + r["gastos_iniciales"] + intereses
+
+    def pareja(valores, i, tipo=float):
+        return tipo(valores[2 * i + 1]), tipo(valores[2 * i + 2])
+
+    return {
+        "base": {"dti": float(r["dti"][0]), "coste_total": float(coste_total[0]), "viable": bool(r["viable"][0])},
+        "filas": [
+            {
+                "clave": clave, "etiqueta": etiqueta, "paso": paso, "unidad": unidad,
+                "dti": pareja(r["dti"], i), "coste_total": pareja(coste_total, i), "viable": pareja(r["viable"], i, bool),
+            }
+            for i, (clave, etiqueta, paso, unidad, _) in enumerate(perturbaciones)
+        ],
+    }
@@ -0,0 +1,28 @@
+// Estilo de los tooltips de Plotly (texto oscuro y en negrita sobre el fondo claro del tooltip).
+// Cada gráfico vigila solo su propia capa de tooltips (.hoverlayer), no todo el documento, y los
+// gráficos se descubren la primera vez que el puntero pasa por encima: sin tooltips no hay trabajo.
+(function () {
+  if (window.calculadoraTooltips) return;
+  window.calculadoraTooltips = true;
+
+  function estilizar(capa) {
+    capa.querySelectorAll(".hovertext text").forEach(function (texto) {
+      texto.style.fill = "#0F172A";
+      texto.style.fontWeight = "700";
+      texto.style.opacity = "1";
+    });
+  }
+
+  function vigilar(grafico) {
+    const capa = grafico.querySelector(".hoverlayer");
+    if (!capa || grafico._capaTooltipsVigilada === capa) return;
+    grafico._capaTooltipsVigilada = capa;  // Plotly puede rehacer la capa al volver a dibujar
+    new MutationObserver(function () { estilizar(capa); }).observe(capa, { childList: true, subtree: true });
+    estilizar(capa);
+  }
+
+  document.addEventListener("mouseover", function (evento) {
+    const grafico = evento.target.closest && evento.target.closest(".js-plotly-plot");
+    if (grafico) vigilar(grafico);
+  }, { passive: true });
+})();
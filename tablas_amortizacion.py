@@ -0,0 +1,173 @@
+# ============================================================
+# 📋 Tablas de amortización precalculadas (rejilla tipo × plazo)
+# ============================================================
+# Casi todas las consultas caen en una rejilla pequeña: tipos del 0 al 8 % en pasos de 0,05 %
+# y plazos de 5 a 40 años enteros. Para cada par de la rejilla se guardan, por € de capital:
+# - el factor de la cuota francesa (cuota = capital · factor),
+# - el saldo pendiente tras cada mes (curva normalizada, meses 0…480),
+# - los intereses pagados en cada año del préstamo.
+# La cuota, el saldo en cualquier mes y los totales anuales pasan a ser una consulta a la tabla
+# multiplicada por el capital. Fuera de la rejilla (tipos con más decimales, plazos no enteros)
+# los llamantes siguen con el cálculo exacto: aquí se devuelve None.
+#
+# Las tablas se calculan la primera vez que se usan (unos 25 MB, menos de un segundo) o, si existe
+# la carpeta generada con `python -m herramientas.tablas`, se abren mapeadas en memoria: todos los
+# procesos del servidor comparten entonces las mismas páginas.
+
+import os
+import threading
+
+import numpy as np
+
+from motor_hipotecario import PLAZO_MAX_ANIOS, PLAZO_MIN_ANIOS
+
+RUTA_TABLAS = os.environ.get(
+    "CALCULADORA_TABLAS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "tablas_amortizacion"),
+)
+
+PASO_TIPO = 0.0005          # 0,05 % en tanto por uno
+TIPO_MAX = 0.08
+N_TIPOS = int(round(TIPO_MAX / PASO_TIPO)) + 1
+N_PLAZOS = PLAZO_MAX_ANIOS - PLAZO_MIN_ANIOS + 1
+MESES_MAX = PLAZO_MAX_ANIOS * 12
+
+# Fichero .npy de cada tabla y forma esperada (se comprueba al cargar desde disco)
+FORMAS = {
+    "factores": (N_TIPOS, N_PLAZOS),
+    "saldos": (N_TIPOS, N_PLAZOS, MESES_MAX + 1),
+    "intereses_anuales": (N_TIPOS, N_PLAZOS, PLAZO_MAX_ANIOS),
+}
+
+
+def indice_rejilla(interes_anual, anos):
+    """(índice de tipo, índice de plazo) si el par cae en la rejilla; None si hay que calcular de forma exacta."""
+    if interes_anual is None or anos is None:
+        return None
+    posicion = interes_anual / PASO_TIPO
+    i_tipo = round(posicion)
+    if abs(posicion - i_tipo) > 1e-6 or not 0 <= i_tipo < N_TIPOS:
+        return None
+    if anos != int(anos) or not PLAZO_MIN_ANIOS <= anos <= PLAZO_MAX_ANIOS:
+        return None
+    return i_tipo, int(anos) - PLAZO_MIN_ANIOS
+
+
+def calcular_tablas():
+    """
+    Las tres tablas con las mismas fórmulas que motor_vectorial: factor r/(1 − (1+r)^−n) y
+    saldo S_k = (1+r)^k − factor·((1+r)^k − 1)/r por € de capital. Se recorre tipo a tipo para
+    no reservar más memoria que la de las propias tablas.
+    """
+    tablas = {nombre: np.zeros(forma) for nombre, forma in FORMAS.items()}
+    n = np.arange(PLAZO_MIN_ANIOS, PLAZO_MAX_ANIOS + 1)[:, None] * 12
+    meses = np.arange(MESES_MAX + 1)[None, :]
+    for i_tipo in range(N_TIPOS):
+        r = i_tipo * PASO_TIPO / 12
+        if r:
+            factor = r / (1 - (1 + r) ** (-n))
+            crecimiento = (1 + r) ** meses
+            saldo = crecimiento - factor * (crecimiento - 1) / r
+        else:
+            factor = 1 / n
+            saldo = 1 - factor * meses
+        saldo = np.where(meses <= n, np.maximum(saldo, 0.0), 0.0)
+        tablas["factores"][i_tipo] = factor[:, 0]
+        tablas["saldos"][i_tipo] = saldo
+        tablas["intereses_anuales"][i_tipo] = (saldo[:, :MESES_MAX] * r).reshape(N_PLAZOS, PLAZO_MAX_ANIOS, 12).sum(axis=2)
+    return tablas
+
+
+def guardar_tablas(ruta=RUTA_TABLAS, tablas=None):
+    """Escribe cada tabla como .npy en la carpeta `ruta` (para abrirlas después con mmap)."""
+    tablas = calcular_tablas() if tablas is None else tablas
+    os.makedirs(ruta, exist_ok=True)
+    for nombre, tabla in tablas.items():
+        np.save(os.path.join(ruta, f"{nombre}.npy"), tabla)
+    return tablas
+
+
+def _cargar_tablas(ruta):
+    """Tablas mapeadas en memoria desde `ruta`, o None si falta algún fichero o no tiene la forma esperada."""
+    tablas = {}
+    for nombre, forma in FORMAS.items():
+        fichero = os.path.join(ruta, f"{nombre}.npy")
+        try:
+            tabla = np.load(fichero, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if tabla.shape != forma or tabla.dtype != np.float64:
+            return None
+        tablas[nombre] = tabla
+    return tablas
+
+
+class TablasAmortizacion:
+    """Consultas sobre la rejilla. Cada método devuelve None si (interés, años) no está en ella."""
+
+    def __init__(self, ruta=RUTA_TABLAS):
+        self.ruta = ruta
+        self.origen = None          # "disco" (mmap) o "memoria", tras la primera consulta
+        self._tablas = None
+        self._lock = threading.Lock()
+
+    def _obtener(self):
+        if self._tablas is None:
+            with self._lock:
+                if self._tablas is None:
+                    tablas = _cargar_tablas(self.ruta) if self.ruta else None
+                    self.origen = "memoria" if tablas is None else "disco"
+                    self._tablas = tablas if tablas is not None else calcular_tablas()
+        return self._tablas
+
+    def factor(self, interes_anual, anos):
+        """Cuota por € de capital."""
+        indice = indice_rejilla(interes_anual, anos)
+        return None if indice is None else float(self._obtener()["factores"][indice])
+
+    def cuota(self, capital, interes_anual, anos):
+        factor = self.factor(interes_anual, anos)
+        if factor is None:
+            return None
+        return capital * factor if capital > 0 else 0.0
+
+    def saldo(self, capital, interes_anual, anos, mes):
+        """Capital pendiente tras `mes` cuotas (0 una vez terminado el plazo)."""
+        indice = indice_rejilla(interes_anual, anos)
+        if indice is None:
+            return None
+        mes = min(max(int(mes), 0), MESES_MAX)
+        return capital * float(self._obtener()["saldos"][indice + (mes,)])
+
+    def curva_saldos(self, interes_anual, anos):
+        """Saldo por € de capital al final de cada mes 0…n (vista de solo lectura, sin copiar)."""
+        indice = indice_rejilla(interes_anual, anos)
+        if indice is None:
+            return None
+        return self._obtener()["saldos"][indice][: int(anos) * 12 + 1]
+
+    def evolucion_anual(self, capital, interes_anual, anos):
+        """
+        Misma tabla que motor_vectorial.evolucion_anual_rapida para la cuota estándar del préstamo:
+        saldo a fin de año e intereses anuales leídos de la tabla y multiplicados por el capital.
+        """
+        indice = indice_rejilla(interes_anual, anos)
+        if indice is None or capital <= 0:
+            return None
+        tablas = self._obtener()
+        anos = int(anos)
+        cuota = capital * float(tablas["factores"][indice])
+        intereses_anio = capital * np.asarray(tablas["intereses_anuales"][indice][:anos])
+        capital_anio = 12 * cuota - intereses_anio
+        return {
+            "Año": np.arange(1, anos + 1),
+            "Capital Pendiente": capital * np.asarray(tablas["saldos"][indice][12:anos * 12 + 1:12]),
+            "Intereses Acumulados": np.cumsum(intereses_anio),
+            "Capital Amortizado": np.cumsum(capital_anio),
+            "Intereses Anuales": intereses_anio,
+            "Capital Anual": capital_anio,
+        }
+
+
+# Tablas únicas del proceso (se calculan o se abren de disco en la primera consulta)
+TABLAS_AMORTIZACION = TablasAmortizacion()